@@ -10,7 +10,7 @@ load_dotenv()
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.database import DATABASE_URL, Base
+from app.database import DATABASE_SHARDS, DATABASE_URL, Base
 from app import models
 
 config = context.config
@@ -34,14 +34,22 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 def run_migrations_online() -> None:
-    connectable = create_engine(os.getenv('DATABASE_URL'))
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection,
-            target_metadata=target_metadata
-        )
-        with context.begin_transaction():
-            context.run_migrations()
+    # Shards get the full schema too; migrations can tell them apart from the
+    # primary through config.attributes["shard"].
+    urls = {os.getenv('DATABASE_URL'): None}
+    for name, url in DATABASE_SHARDS.items():
+        urls.setdefault(url, name)
+    for url, shard in urls.items():
+        config.attributes["shard"] = shard
+        connectable = create_engine(url)
+        with connectable.connect() as connection:
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata
+            )
+            with context.begin_transaction():
+                context.run_migrations()
+        connectable.dispose()
 
 print("Alembic using DB:", os.getenv('DATABASE_URL'))
 
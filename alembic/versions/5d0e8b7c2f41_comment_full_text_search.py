@@ -0,0 +1,62 @@
+"""Full-text search index on comments.content
+
+Revision ID: 5d0e8b7c2f41
+Revises: f92ce46985f7
+Create Date: 2026-10-18 16:20:07.284113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d0e8b7c2f41'
+down_revision: Union[str, Sequence[str], None] = 'f92ce46985f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # Generated column: Postgres recomputes it on every insert and update.
+        op.execute(
+            "ALTER TABLE comments ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', content)) STORED"
+        )
+        op.execute("CREATE INDEX ix_comments_search_vector ON comments USING gin (search_vector)")
+    elif dialect == 'sqlite':
+        # External-content FTS5 table kept in sync by triggers, then filled
+        # from the existing rows.
+        op.execute(
+            "CREATE VIRTUAL TABLE comments_fts USING fts5("
+            "content, content='comments', content_rowid='id', tokenize='porter unicode61')"
+        )
+        op.execute(
+            "CREATE TRIGGER comments_fts_insert AFTER INSERT ON comments BEGIN "
+            "INSERT INTO comments_fts(rowid, content) VALUES (new.id, new.content); END"
+        )
+        op.execute(
+            "CREATE TRIGGER comments_fts_delete AFTER DELETE ON comments BEGIN "
+            "INSERT INTO comments_fts(comments_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+        )
+        op.execute(
+            "CREATE TRIGGER comments_fts_update AFTER UPDATE OF content ON comments BEGIN "
+            "INSERT INTO comments_fts(comments_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+            "INSERT INTO comments_fts(rowid, content) VALUES (new.id, new.content); END"
+        )
+        op.execute("INSERT INTO comments_fts(comments_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX ix_comments_search_vector")
+        op.execute("ALTER TABLE comments DROP COLUMN search_vector")
+    elif dialect == 'sqlite':
+        for trigger in ('comments_fts_insert', 'comments_fts_delete', 'comments_fts_update'):
+            op.execute(f"DROP TRIGGER {trigger}")
+        op.execute("DROP TABLE comments_fts")
@@ -0,0 +1,41 @@
+"""Archived comment history
+
+Revision ID: 7c4f1e2a9d36
+Revises: e5a0c27d94b8
+Create Date: 2026-10-19 00:12:37.905214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c4f1e2a9d36'
+down_revision: Union[str, Sequence[str], None] = 'e5a0c27d94b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('comment_archives',
+    sa.Column('comment_id', sa.Integer(), nullable=False),
+    sa.Column('first_id', sa.Integer(), nullable=False),
+    sa.Column('edit_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('comment_id')
+    )
+    # Archived rows leave the table, and SQLite would otherwise reuse the
+    # highest ids once they are gone. Postgres sequences never do.
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('comment_histories', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('comment_histories', recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+            pass
+    op.drop_table('comment_archives')
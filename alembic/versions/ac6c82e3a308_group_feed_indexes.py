@@ -0,0 +1,49 @@
+"""Indexes for group-scoped feeds and denormalized comments.group
+
+Revision ID: ac6c82e3a308
+Revises: 48f517a81831
+Create Date: 2026-10-18 09:12:41.530117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ac6c82e3a308'
+down_revision: Union[str, Sequence[str], None] = '48f517a81831'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_users_group'), 'users', ['group'], unique=False)
+    op.create_index(op.f('ix_comments_user_id'), 'comments', ['user_id'], unique=False)
+    op.create_index(op.f('ix_comment_histories_comment_id'), 'comment_histories', ['comment_id'], unique=False)
+
+    # Copy the author's group onto each comment so group feeds read one table.
+    op.add_column('comments', sa.Column('group', sa.String(), nullable=True))
+    op.execute(
+        'UPDATE comments SET "group" = '
+        '(SELECT users."group" FROM users WHERE users.id = comments.user_id)'
+    )
+    with op.batch_alter_table('comments') as batch_op:
+        batch_op.alter_column('group', existing_type=sa.String(), nullable=False)
+
+    # Keyset pagination order for the group feeds.
+    op.create_index('ix_comments_group_created_at_id', 'comments', ['group', 'created_at', 'id'], unique=False)
+    op.create_index('ix_comment_histories_timestamp_id', 'comment_histories', ['timestamp', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_comment_histories_timestamp_id', table_name='comment_histories')
+    op.drop_index('ix_comments_group_created_at_id', table_name='comments')
+    with op.batch_alter_table('comments') as batch_op:
+        batch_op.drop_column('group')
+    op.drop_index(op.f('ix_comment_histories_comment_id'), table_name='comment_histories')
+    op.drop_index(op.f('ix_comments_user_id'), table_name='comments')
+    op.drop_index(op.f('ix_users_group'), table_name='users')
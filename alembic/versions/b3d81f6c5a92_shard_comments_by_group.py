@@ -0,0 +1,33 @@
+"""Shards keep comments of users that live on the primary
+
+Revision ID: b3d81f6c5a92
+Revises: 5d0e8b7c2f41
+Create Date: 2026-10-18 21:42:51.630418
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3d81f6c5a92'
+down_revision: Union[str, Sequence[str], None] = '5d0e8b7c2f41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A shard's users table stays empty, so comments.user_id can't reference
+    # it there. SQLite doesn't enforce foreign keys (and rebuilding the table
+    # to drop one would also drop the search triggers), so only Postgres
+    # needs the constraint gone.
+    if context.config.attributes.get("shard") and op.get_bind().dialect.name == 'postgresql':
+        op.drop_constraint('comments_user_id_fkey', 'comments', type_='foreignkey')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if context.config.attributes.get("shard") and op.get_bind().dialect.name == 'postgresql':
+        op.create_foreign_key('comments_user_id_fkey', 'comments', 'users', ['user_id'], ['id'])
@@ -0,0 +1,56 @@
+"""Per-user and per-group comment and edit counters
+
+Revision ID: e5a0c27d94b8
+Revises: b3d81f6c5a92
+Create Date: 2026-10-18 23:05:12.418337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a0c27d94b8'
+down_revision: Union[str, Sequence[str], None] = 'b3d81f6c5a92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('group', sa.String(), nullable=False),
+    sa.Column('comment_count', sa.Integer(), nullable=False),
+    sa.Column('edit_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index(op.f('ix_user_stats_group'), 'user_stats', ['group'], unique=False)
+    op.create_table('group_stats',
+    sa.Column('group', sa.String(), nullable=False),
+    sa.Column('comment_count', sa.Integer(), nullable=False),
+    sa.Column('edit_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('group')
+    )
+    # Same as app.utils.counters.rebuild_counts.
+    op.execute(
+        'INSERT INTO user_stats (user_id, "group", comment_count, edit_count) '
+        'SELECT c.user_id, MAX(c."group"), COUNT(c.id), COALESCE(MAX(e.edits), 0) FROM comments c '
+        'LEFT OUTER JOIN (SELECT comments.user_id AS user_id, COUNT(comment_histories.id) AS edits '
+        'FROM comments JOIN comment_histories ON comment_histories.comment_id = comments.id '
+        'GROUP BY comments.user_id) e ON e.user_id = c.user_id '
+        'GROUP BY c.user_id'
+    )
+    op.execute(
+        'INSERT INTO group_stats ("group", comment_count, edit_count) '
+        'SELECT "group", SUM(comment_count), SUM(edit_count) FROM user_stats GROUP BY "group"'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('group_stats')
+    op.drop_index(op.f('ix_user_stats_group'), table_name='user_stats')
+    op.drop_table('user_stats')
@@ -0,0 +1,106 @@
+"""Delta-compressed comment history
+
+Revision ID: f92ce46985f7
+Revises: ac6c82e3a308
+Create Date: 2026-10-18 11:40:02.118734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.delta import apply_delta, make_delta
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f92ce46985f7'
+down_revision: Union[str, Sequence[str], None] = 'ac6c82e3a308'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SNAPSHOT_INTERVAL = 16
+BATCH_SIZE = 1000
+
+histories = sa.table(
+    'comment_histories',
+    sa.column('id', sa.Integer),
+    sa.column('comment_id', sa.Integer),
+    sa.column('old_value', sa.Text),
+    sa.column('new_value', sa.Text),
+    sa.column('delta', sa.Text),
+)
+
+
+def _rewrite(convert) -> None:
+    """Stream history rows in chain order and write back whatever `convert`
+    returns for each (previous row, row) pair, in batches."""
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(histories)
+        .order_by(histories.c.comment_id, histories.c.id)
+        .execution_options(stream_results=True, yield_per=BATCH_SIZE)
+    ).mappings()
+    if bind.dialect.name == 'sqlite':
+        # SQLite can't update a table while a cursor over it is still open.
+        rows = rows.all()
+
+    stmt = (
+        sa.update(histories)
+        .where(histories.c.id == sa.bindparam('b_id'))
+        .values(old_value=sa.bindparam('b_old'), new_value=sa.bindparam('b_new'), delta=sa.bindparam('b_delta'))
+    )
+    batch = []
+    state = {}
+    for row in rows:
+        if state.get('comment_id') != row['comment_id']:
+            state = {'comment_id': row['comment_id'], 'position': 0, 'previous_new': None}
+        batch.append(convert(state, row))
+        state['position'] += 1
+        if len(batch) >= BATCH_SIZE:
+            bind.execute(stmt, batch)
+            batch = []
+    if batch:
+        bind.execute(stmt, batch)
+
+
+def _to_delta(state, row):
+    old_value, new_value = row['old_value'], row['new_value']
+    if row['delta'] is not None:
+        old_value = old_value if old_value is not None else state['previous_new']
+        new_value = apply_delta(old_value, row['delta'])
+    # Only drop old_value when the chain really continues from the previous
+    # edit; anything else stays a snapshot so no text is lost.
+    snapshot = state['position'] % SNAPSHOT_INTERVAL == 0 or old_value != state['previous_new']
+    state['previous_new'] = new_value
+    return {
+        'b_id': row['id'],
+        'b_old': old_value if snapshot else None,
+        'b_new': None,
+        'b_delta': make_delta(old_value, new_value),
+    }
+
+
+def _to_full(state, row):
+    old_value = row['old_value'] if row['old_value'] is not None else state['previous_new']
+    new_value = row['new_value'] if row['delta'] is None else apply_delta(old_value, row['delta'])
+    state['previous_new'] = new_value
+    return {'b_id': row['id'], 'b_old': old_value, 'b_new': new_value, 'b_delta': None}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('comment_histories', sa.Column('delta', sa.Text(), nullable=True))
+    with op.batch_alter_table('comment_histories') as batch_op:
+        batch_op.alter_column('old_value', existing_type=sa.Text(), nullable=True)
+        batch_op.alter_column('new_value', existing_type=sa.Text(), nullable=True)
+    _rewrite(_to_delta)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _rewrite(_to_full)
+    with op.batch_alter_table('comment_histories') as batch_op:
+        batch_op.alter_column('new_value', existing_type=sa.Text(), nullable=False)
+        batch_op.alter_column('old_value', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_column('delta')
@@ -0,0 +1,204 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+from app.auth.auth import decode_token, parse_bearer_header
+from app.auth.principal_cache import principal_cache
+from app.config import (
+    ADMISSION_CONTROL,
+    ADMISSION_INITIAL_LIMIT,
+    ADMISSION_MAX_LIMIT,
+    ADMISSION_MIN_LIMIT,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_PER_SECOND,
+    REQUEST_DEADLINE,
+)
+from app.metrics import current_request, registry
+
+admission_rejected = registry.counter(
+    "bloggu_admission_rejected_total", "Requests turned away by admission control.", ("reason",))
+
+
+class AdaptiveLimit:
+    """Concurrency limit adjusted by AIMD from what requests experienced.
+
+    A request signals congestion when it was dropped, spent more than
+    `max_queue_share` of its time waiting for a pooled connection, or took
+    over `tolerance` times the baseline latency. The baseline is a slow
+    average learnt while the limit is lightly used, so sustained overload
+    can't pass itself off as normal. Congestion cuts the limit by `backoff`,
+    at most once per typical request duration so one slow burst counts
+    once; otherwise a well-used limit grows by about one per such interval.
+    Callers never wait for a slot: a full limit means rejecting the request.
+    """
+
+    def __init__(
+        self,
+        initial: int = ADMISSION_INITIAL_LIMIT,
+        min_limit: int = ADMISSION_MIN_LIMIT,
+        max_limit: int = ADMISSION_MAX_LIMIT,
+        tolerance: float = 3.0,
+        max_queue_share: float = 0.5,
+        backoff: float = 0.8,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.max_queue_share = max_queue_share
+        self.backoff = backoff
+        self.inflight = 0
+        self._recent: Optional[float] = None
+        self._baseline: Optional[float] = None
+        self._last_decrease = 0.0
+
+    def try_acquire(self) -> bool:
+        if self.inflight >= int(self.limit):
+            return False
+        self.inflight += 1
+        return True
+
+    def release(self, latency: float, queued: float = 0.0, dropped: bool = False) -> None:
+        """Record a finished request: its latency, the part of it spent
+        waiting for a connection, and whether it was dropped."""
+        inflight = self.inflight
+        self.inflight -= 1
+
+        if self._recent is None:
+            self._recent = self._baseline = latency
+        self._recent += (latency - self._recent) * 0.2
+        lightly_used = inflight < self.limit / 2
+        self._baseline += (latency - self._baseline) * (0.01 if lightly_used else 0.001)
+
+        congested = (
+            dropped
+            or queued > latency * self.max_queue_share
+            or self._recent > self._baseline * self.tolerance
+        )
+        now = time.monotonic()
+        if congested:
+            if now - self._last_decrease >= self._recent:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif not lightly_used:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def stats(self) -> dict:
+        return {"limit": int(self.limit), "inflight": self.inflight}
+
+
+class TokenBuckets:
+    """One token bucket per key, `rate` tokens a second up to `burst`. The
+    least recently used buckets are dropped beyond `maxsize`; a dropped
+    bucket was idle long enough to have refilled anyway."""
+
+    def __init__(self, rate: float = RATE_LIMIT_PER_SECOND, burst: float = RATE_LIMIT_BURST, maxsize: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str) -> float:
+        """0 if a token was taken, else seconds until one is available."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+concurrency_limit = AdaptiveLimit()
+rate_limits = TokenBuckets()
+
+
+def client_key(scope, headers: dict) -> str:
+    """The authenticated principal when the request carries a valid bearer
+    token, otherwise the client address. Reads only the token (and the
+    principal cache), never the database."""
+    auth_header = headers.get("authorization")
+    if auth_header:
+        try:
+            token = parse_bearer_header(auth_header)
+            principal = principal_cache.peek(token)
+            return f"user:{principal.username if principal else decode_token(token)['sub']}"
+        except HTTPException:
+            pass
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class AdmissionMiddleware:
+    """ASGI middleware shedding load on `paths` before it reaches the pool.
+
+    Requests are rejected at once, never queued: 429 when the client's token
+    bucket is empty and 503 when the adaptive concurrency limit is full, both
+    with Retry-After. Admitted requests that run past `deadline` seconds are
+    cancelled and answered with 503 if no response has started.
+    """
+
+    def __init__(self, app, paths: Tuple[str, ...], deadline: float = REQUEST_DEADLINE, enabled: bool = ADMISSION_CONTROL):
+        self.app = app
+        self.paths = paths
+        self.deadline = deadline
+        self.enabled = enabled
+        self.limit = concurrency_limit
+        self.buckets = rate_limits
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        wait = self.buckets.take(client_key(scope, headers))
+        if wait:
+            return await self.reject(scope, receive, send, 429, "rate", "Rate limit exceeded", wait)
+        if not self.limit.try_acquire():
+            return await self.reject(scope, receive, send, 503, "concurrency", "Server is overloaded", 1)
+
+        started = time.perf_counter()
+        response_started = False
+        dropped = False
+
+        async def send_tracking(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            async with asyncio.timeout(self.deadline):
+                await self.app(scope, receive, send_tracking)
+        except TimeoutError:
+            dropped = True
+            admission_rejected.inc(1, "deadline")
+            if not response_started:
+                await self.reject(scope, receive, send, 503, None, "Request deadline exceeded", 1)
+        finally:
+            # Pool waits are recorded by MetricsMiddleware's request metrics.
+            request = current_request.get()
+            queued = request.pool_wait_seconds if request is not None else 0.0
+            self.limit.release(time.perf_counter() - started, queued, dropped)
+
+    async def reject(self, scope, receive, send, status: int, reason: Optional[str], detail: str, retry_after: float):
+        if reason:
+            admission_rejected.inc(1, reason)
+        response = JSONResponse(
+            {"detail": detail},
+            status_code=status,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        await response(scope, receive, send)
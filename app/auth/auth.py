@@ -1,17 +1,24 @@
+from typing import Optional
 from fastapi import Request, HTTPException, status
 from jwt import decode, exceptions
 from app.config import SECRET_KEY, ALGORITHM
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, use_shard
 from app.models.user import User
+from app.auth.principal_cache import Principal, principal_cache
 
-def get_current_user(request: Request, db: Session) -> User:
-    auth_header = request.headers.get("Authorization")
+def get_bearer_token(request: Request) -> str:
+    return parse_bearer_header(request.headers.get("Authorization"))
+
+def parse_bearer_header(auth_header: Optional[str]) -> str:
     if not auth_header or not auth_header.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    token = auth_header.removeprefix("Bearer ").strip()
+    return auth_header.removeprefix("Bearer ").strip()
 
+def decode_token(token: str) -> dict:
     try:
         payload = decode(token.encode("utf-8"), SECRET_KEY, algorithms=[ALGORITHM])
         username = payload.get("sub")
@@ -20,8 +27,40 @@ def get_current_user(request: Request, db: Session) -> User:
     except Exception:
         raise HTTPException(status_code=401, detail="Could not validate credentials")
 
+    return payload
+
+def get_token_username(request: Request) -> str:
+    return decode_token(get_bearer_token(request))["sub"]
+
+def get_current_user(request: Request, db: Session) -> User:
+    username = get_token_username(request)
+
     user = db.query(User).filter(User.username == username).first()
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     
-    return user
\ No newline at end of file
+    return user
+
+async def get_current_user_async(request: Request, db: AsyncSession, token: Optional[str] = None) -> Principal:
+    # WebSocket clients can't set headers and pass the token in their
+    # connection params instead.
+    token = token or get_bearer_token(request)
+    principal = principal_cache.get(token)
+    if not principal:
+        principal = await load_principal(db, token)
+    # Everything the caller may see lives on their group's shard.
+    use_shard(db, principal.group)
+    return principal
+
+async def load_principal(db: AsyncSession, token: str) -> Principal:
+    epoch = principal_cache.epoch
+    claims = decode_token(token)
+    row = (await db.execute(
+        select(User.id, User.username, User.group).where(User.username == claims["sub"])
+    )).first()
+    if not row:
+        raise HTTPException(status_code=401, detail="User not found")
+
+    principal = Principal(id=row.id, username=row.username, group=row.group, claims=claims)
+    principal_cache.put(token, principal, epoch)
+    return principal
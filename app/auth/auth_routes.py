@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import models, database
 from app.utils import security
 from fastapi.security import OAuth2PasswordRequestForm
@@ -11,29 +12,42 @@ import os
 router = APIRouter()
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_async_db)):
+    user = await db.scalar(select(models.User).where(models.User.username == form_data.username))
+    # Return the connection to the pool before the slow hash check.
+    await db.close()
+    if not user or not await security.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
         )
 
+    # Upgrade hashes made with a different work factor while we have the plain password.
+    if security.needs_rehash(user.hashed_password):
+        hashed_password = await security.hash_password_async(form_data.password)
+        await db.execute(
+            update(models.User).where(models.User.id == user.id).values(hashed_password=hashed_password)
+        )
+        await db.commit()
+
     token_data = {"sub": user.username}
     token = encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
+    # A user who just signed up may not have reached the replicas yet.
+    await database.recent_writes.mark(f"Bearer {token}")
     return {"access_token": token, "token_type": "bearer"}
 
 
 @router.post("/signup", response_model=UserRead, status_code=status.HTTP_201_CREATED)
-def signup(user: UserCreate, db: Session = Depends(database.get_db)):
-    existing_user = db.query(models.User).filter(models.User.username == user.username).first()
+async def signup(user: UserCreate, db: AsyncSession = Depends(database.get_async_db)):
+    existing_user = await db.scalar(select(models.User).where(models.User.username == user.username))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already taken"
         )
+    await db.close()
 
-    hashed_password = security.hash_password(user.password)
+    hashed_password = await security.hash_password_async(user.password)
     new_user = models.User(
         username=user.username,
         hashed_password=hashed_password,
@@ -41,7 +55,7 @@ def signup(user: UserCreate, db: Session = Depends(database.get_db)):
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
-    return new_user
\ No newline at end of file
+    return new_user
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.config import PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL
+from app.pubsub import PubSub, pubsub
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "principals"
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: str
+    group: str
+    claims: dict = field(default_factory=dict, compare=False, repr=False)
+
+
+class PrincipalCache:
+    """Bounded TTL/LRU cache of bearer token -> authenticated principal.
+
+    Saves the JWT decode and the users lookup on every resolver. Entries for a
+    user are dropped by `invalidate_user` whenever their row changes, and an
+    epoch counter stops a lookup that raced with the change from re-caching
+    the stale principal. Each worker has its own; `invalidate_principal`
+    reaches all of them.
+    """
+
+    def __init__(self, maxsize: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[Principal, float]]" = OrderedDict()
+        self._tokens_by_user: dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    self._remove(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, token: str) -> Optional[Principal]:
+        """Like get, but neither counted in the stats nor refreshing the
+        entry's recency: for callers that only look, such as admission."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            return entry[0]
+
+    def put(self, token: str, principal: Principal, epoch: int) -> None:
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl
+        exp = principal.claims.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, time.monotonic() + (exp - time.time()))
+        with self._lock:
+            if epoch != self.epoch:
+                return
+            if token in self._entries:
+                self._remove(token)
+            self._entries[token] = (principal, expires_at)
+            self._tokens_by_user.setdefault(principal.id, set()).add(token)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            self.epoch += 1
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._remove(token)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.epoch += 1
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
+
+    def _remove(self, token: str) -> None:
+        principal, _ = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(principal.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[principal.id]
+
+
+principal_cache = PrincipalCache()
+
+
+async def invalidate_principal(user_id: int, cache: PrincipalCache = principal_cache, broker: PubSub = pubsub) -> None:
+    """Drop the user's principals from this worker's cache, and through the
+    broker from every worker's (see follow_invalidations)."""
+    cache.invalidate_user(user_id)
+    await broker.publish(INVALIDATION_CHANNEL, {"user_id": user_id})
+
+
+async def follow_invalidations(
+    cache: PrincipalCache = principal_cache, broker: PubSub = pubsub, retry_delay: float = 1.0,
+) -> None:
+    """Apply every worker's invalidate_principal to this worker's cache, until
+    cancelled. When invalidations may have been missed, because the queue
+    overflowed or the broker connection was lost for good, the whole cache is
+    cleared. Ones lost while the Redis backend reconnects are only bounded by
+    PRINCIPAL_CACHE_TTL."""
+    while True:
+        try:
+            async with broker.subscribe(INVALIDATION_CHANNEL) as subscriber:
+                dropped = 0
+                async for message in subscriber:
+                    if subscriber.dropped != dropped:
+                        dropped = subscriber.dropped
+                        cache.clear()
+                    cache.invalidate_user(message["user_id"])
+        except Exception as e:
+            logger.warning("Principal invalidations interrupted, clearing the cache: %s", e)
+            cache.clear()
+        await asyncio.sleep(retry_delay)
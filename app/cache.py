@@ -0,0 +1,153 @@
+import itertools
+import pickle
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import FEED_CACHE_BACKEND, FEED_CACHE_SIZE, FEED_CACHE_TTL, FEED_CACHE_URL
+from app.database import reading_primary
+
+_MISSING = object()
+
+
+class LRUBackend:
+    """In-process backend. Versions are only seen by this process, so with
+    several workers FEED_CACHE_TTL bounds how stale another worker can be.
+
+    Versions are kept for at most `maxsize` names, like the entries. They are
+    drawn from one counter and never reused, so a name forgotten and seen
+    again gets a new version and its older entries are never served.
+    """
+
+    def __init__(self, maxsize: int = FEED_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, tuple[Any, float]]" = OrderedDict()
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._next_version = itertools.count(1)
+
+    async def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        if entry[1] <= time.monotonic():
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    async def set(self, key: str, value: Any, ttl: int) -> None:
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get_version(self, name: str) -> int:
+        version = self._versions.get(name)
+        if version is None:
+            version = self._versions[name] = next(self._next_version)
+            while len(self._versions) > self.maxsize:
+                self._versions.popitem(last=False)
+        self._versions.move_to_end(name)
+        return version
+
+    async def bump_version(self, name: str) -> None:
+        # The next read assigns a new version.
+        self._versions.pop(name, None)
+
+
+class RedisBackend:
+    """Shared backend so every worker sees the same versions. Values are
+    pickled, so the Redis instance must be trusted."""
+
+    def __init__(self, url: str = FEED_CACHE_URL):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise Exception("FEED_CACHE_BACKEND=redis requires the 'redis' package")
+        self._client = redis.from_url(url)
+
+    async def get(self, key: str) -> Any:
+        raw = await self._client.get(key)
+        return _MISSING if raw is None else pickle.loads(raw)
+
+    async def set(self, key: str, value: Any, ttl: int) -> None:
+        await self._client.set(key, pickle.dumps(value), ex=ttl)
+
+    async def get_version(self, name: str) -> int:
+        return int(await self._client.get(f"version:{name}") or 0)
+
+    async def bump_version(self, name: str) -> None:
+        await self._client.incr(f"version:{name}")
+
+
+class GroupFeedCache:
+    """Read-through cache for results that depend only on the caller's group.
+
+    Entries are keyed by the group's current version; writes bump the version
+    instead of deleting keys, and old entries simply age out. The version is
+    read before loading, so a result computed while a write commits is stored
+    under the superseded version and never served afterwards. That only holds
+    for results read from the primary: loaders run on a replica-routed session
+    are switched to the primary, since a lagging replica could still return
+    what the write replaced.
+    """
+
+    def __init__(self, backend, ttl: int = FEED_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    async def get_or_load(
+        self, db: AsyncSession, group: str, key: tuple, loader: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """The cached result for key, or loader()'s, which reads through db.
+        Clients that just wrote bypass the cache, as they bypass replicas."""
+        if self.backend is None or db.info.get("recent_write"):
+            return await loader()
+        version = await self.backend.get_version(f"group:{group}")
+        cache_key = f"feed:{group}:{version}:{key!r}"
+        value = await self.backend.get(cache_key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        async with reading_primary(db):
+            value = await loader()
+        await self.backend.set(cache_key, value, self.ttl)
+        return value
+
+    def scope(
+        self, db: AsyncSession, group: str, *feed: str
+    ) -> Callable[[tuple, Callable[[], Awaitable[Any]]], Awaitable[Any]]:
+        return lambda key, loader: self.get_or_load(db, group, (*feed, *key), loader)
+
+    async def invalidate(self, *groups: Optional[str]) -> None:
+        if self.backend is None:
+            return
+        for group in {g for g in groups if g is not None}:
+            await self.backend.bump_version(f"group:{group}")
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations}
+
+
+def create_backend(name: str = FEED_CACHE_BACKEND):
+    if name == "memory":
+        return LRUBackend()
+    if name == "redis":
+        return RedisBackend()
+    if name == "none":
+        return None
+    raise Exception(f"Unknown FEED_CACHE_BACKEND '{name}'")
+
+
+feed_cache = GroupFeedCache(create_backend())
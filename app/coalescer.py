@@ -0,0 +1,181 @@
+import asyncio
+import contextvars
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Union
+
+from sqlalchemy import insert
+
+from app import models
+from app.config import WRITE_COALESCE_MAX_BATCH, WRITE_COALESCE_MAX_DELAY, WRITE_COALESCING
+from app.database import AsyncSessionLocal, shard_map, use_shard
+from app.metrics import COUNT_BUCKETS, registry
+from app.utils.counters import add_counts
+from app.utils.history import build_histories, load_for_edit
+
+write_batch_size = registry.histogram(
+    "bloggu_write_batch_size", "Comment writes per coalesced transaction.", buckets=COUNT_BUCKETS)
+
+
+@dataclass
+class CreateComment:
+    user_id: int
+    group: str
+    content: str
+
+
+@dataclass
+class UpdateComment:
+    user_id: int
+    group: str
+    comment_id: int
+    new_content: str
+
+
+Write = Union[CreateComment, UpdateComment]
+
+
+@dataclass
+class _Pending:
+    write: Write
+    future: asyncio.Future
+    queued: float
+
+
+class WriteCoalescer:
+    """Group commit for single-comment writes from concurrent requests.
+
+    Writes queue up for at most `max_delay` seconds after the oldest one
+    arrived, or until `max_batch` are waiting, then go to the database in one
+    transaction per shard: one multi-row INSERT for new comments, one for the
+    history rows of edits, one commit. While a batch is being written the next
+    one fills, so a slow commit makes batches bigger rather than queues longer.
+
+    Each caller gets its own comment back, or its own exception. An edit the
+    caller may not make fails alone; if the transaction itself fails, the
+    batch is retried one write per transaction so only the culprit errors.
+    """
+
+    def __init__(
+        self,
+        max_delay: float = WRITE_COALESCE_MAX_DELAY,
+        max_batch: int = WRITE_COALESCE_MAX_BATCH,
+        enabled: bool = WRITE_COALESCING,
+        session_factory=AsyncSessionLocal,
+    ):
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.enabled = enabled
+        self.session_factory = session_factory
+        self._pending: List[_Pending] = []
+        self._writer: Optional[asyncio.Task] = None
+        self._full: Optional[asyncio.Event] = None
+
+    async def submit(self, write: Write) -> models.Comment:
+        """The comment as written, once its batch has committed."""
+        loop = asyncio.get_running_loop()
+        item = _Pending(write, loop.create_future(), loop.time())
+        self._pending.append(item)
+        if self._writer is None:
+            self._full = asyncio.Event()
+            # A context of its own, so batch SQL isn't counted against
+            # whichever request happened to start the writer.
+            self._writer = loop.create_task(self._write_pending(), context=contextvars.Context())
+        elif len(self._pending) >= self.max_batch:
+            self._full.set()
+        return await item.future
+
+    async def _write_pending(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending:
+                wait = self._pending[0].queued + self.max_delay - loop.time()
+                if wait > 0 and len(self._pending) < self.max_batch:
+                    self._full.clear()
+                    try:
+                        async with asyncio.timeout(wait):
+                            await self._full.wait()
+                    except TimeoutError:
+                        pass
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                by_shard = {}
+                for item in batch:
+                    by_shard.setdefault(shard_map.name_for(item.write.group), []).append(item)
+                for shard_batch in by_shard.values():
+                    await self._write(shard_batch)
+        finally:
+            self._writer = None
+
+    async def _write(self, batch: List[_Pending]) -> None:
+        # Callers cancelled while queued (e.g. past their deadline) are dropped.
+        batch = [item for item in batch if not item.future.done()]
+        if not batch:
+            return
+        write_batch_size.observe(len(batch))
+        try:
+            async with self.session_factory() as db:
+                use_shard(db, batch[0].write.group)
+                results = await apply_writes(db, [item.write for item in batch])
+                await db.commit()
+        except Exception as error:
+            if len(batch) == 1:
+                results = [error]
+            else:
+                for item in batch:
+                    await self._write([item])
+                return
+
+        for item, result in zip(batch, results):
+            if item.future.done():
+                continue
+            if isinstance(result, Exception):
+                item.future.set_exception(result)
+            else:
+                item.future.set_result(result)
+
+
+async def apply_writes(db, writes: List[Write]) -> List[Union[models.Comment, Exception]]:
+    """Stage `writes` in db's transaction, in order. Returns each write's
+    resulting comment, or the exception refusing it."""
+    results: List[Union[models.Comment, Exception, None]] = [None] * len(writes)
+    now = datetime.utcnow()
+
+    creates = [(index, write) for index, write in enumerate(writes) if isinstance(write, CreateComment)]
+    if creates:
+        comments = (await db.scalars(
+            insert(models.Comment).returning(models.Comment),
+            [{"user_id": w.user_id, "group": w.group, "content": w.content, "created_at": now} for _, w in creates],
+        )).all()
+        # Ids are assigned in VALUES order (see Mutation.create_comments).
+        for (index, _), comment in zip(creates, sorted(comments, key=lambda c: c.id)):
+            results[index] = comment
+
+    updates = [(index, write) for index, write in enumerate(writes) if isinstance(write, UpdateComment)]
+    if updates:
+        comments = await load_for_edit(db, (w.comment_id for _, w in updates))
+        history_edits = []
+        for index, write in updates:
+            comment = comments.get(write.comment_id)
+            if not comment or comment.user_id != write.user_id:
+                results[index] = Exception("Unauthorized to update this comment")
+                continue
+            history_edits.append((comment.id, comment.content, write.new_content))
+            comment.content = write.new_content
+            comment.updated_at = now
+            # A copy: later edits of the same comment in this batch change it.
+            results[index] = models.Comment(
+                id=comment.id, user_id=comment.user_id, group=comment.group, content=write.new_content,
+                created_at=comment.created_at, updated_at=now,
+            )
+        if history_edits:
+            await db.execute(insert(models.CommentHistory), await build_histories(db, history_edits, now))
+
+    await add_counts(db, [
+        (write.user_id, write.group, 1, 0) if isinstance(write, CreateComment) else (write.user_id, write.group, 0, 1)
+        for write, result in zip(writes, results) if not isinstance(result, Exception)
+    ])
+    return results
+
+
+write_coalescer = WriteCoalescer()
@@ -8,3 +8,100 @@ ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 
 if not SECRET_KEY or not isinstance(SECRET_KEY, str):
     raise ValueError("JWT_SECRET is missing or not a string!")
+
+# Authenticated-principal cache (bearer token -> id/username/group)
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
+# Password hashing: bcrypt work factor and the dedicated worker pool that runs it
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "64"))
+
+# Connection budget: DB_MAX_CONNECTIONS is the most the whole deployment may
+# open (keep it under the server's max_connections, minus headroom for admin
+# and migrations). It is split evenly over the WEB_CONCURRENCY worker
+# processes, and within each over its async engines' pools, one per distinct
+# database (primary, replicas and shards). Idle connections are pinged
+# before reuse and replaced after DB_POOL_RECYCLE seconds.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "100"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# Comment history storage: "delta" keeps a diff per edit plus a full snapshot
+# every HISTORY_SNAPSHOT_INTERVAL edits of a comment; "full" stores both texts.
+HISTORY_STORAGE = os.getenv("HISTORY_STORAGE", "delta")
+HISTORY_SNAPSHOT_INTERVAL = int(os.getenv("HISTORY_SNAPSHOT_INTERVAL", "16"))
+
+# Group feed result cache: "memory" (per process), "redis" (shared) or "none"
+FEED_CACHE_BACKEND = os.getenv("FEED_CACHE_BACKEND", "memory")
+FEED_CACHE_URL = os.getenv("FEED_CACHE_URL", "redis://localhost:6379/0")
+FEED_CACHE_SIZE = int(os.getenv("FEED_CACHE_SIZE", "2048"))
+FEED_CACHE_TTL = int(os.getenv("FEED_CACHE_TTL", "30"))
+
+# GraphQL documents: automatic persisted queries ("auto"), a fixed allowlist
+# loaded from PERSISTED_QUERIES_FILE ("allowlist"), or "off"; plus the size of
+# the parsed/validated document caches.
+PERSISTED_QUERIES = os.getenv("PERSISTED_QUERIES", "auto")
+PERSISTED_QUERIES_FILE = os.getenv("PERSISTED_QUERIES_FILE")
+PERSISTED_QUERY_CACHE_SIZE = int(os.getenv("PERSISTED_QUERY_CACHE_SIZE", "1024"))
+DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", "256"))
+
+# Static GraphQL cost analysis limits, checked before execution
+QUERY_MAX_DEPTH = int(os.getenv("QUERY_MAX_DEPTH", "10"))
+QUERY_MAX_COST = int(os.getenv("QUERY_MAX_COST", "100000"))
+QUERY_MAX_NODES = int(os.getenv("QUERY_MAX_NODES", "50000"))
+
+# Rows fetched per round trip by the streaming export endpoints
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# GraphQL subscriptions: "memory" fans out within this process, "redis" across
+# workers. Each subscriber buffers up to SUBSCRIPTION_QUEUE_SIZE events; when
+# it falls behind, "drop_oldest" discards its oldest event and "disconnect"
+# ends the subscription. With "redis", a lost connection is retried
+# PUBSUB_RECONNECT_ATTEMPTS times with backoff before subscriptions are ended.
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory")
+PUBSUB_URL = os.getenv("PUBSUB_URL", "redis://localhost:6379/0")
+PUBSUB_RECONNECT_ATTEMPTS = int(os.getenv("PUBSUB_RECONNECT_ATTEMPTS", "8"))
+SUBSCRIPTION_QUEUE_SIZE = int(os.getenv("SUBSCRIPTION_QUEUE_SIZE", "100"))
+SUBSCRIPTION_SLOW_CONSUMER = os.getenv("SUBSCRIPTION_SLOW_CONSUMER", "drop_oldest")
+
+# Metrics: /metrics in Prometheus text format. A request that runs the same
+# statement N_PLUS_ONE_THRESHOLD times or more is logged as a likely N+1;
+# METRICS_IN_RESPONSE adds per-request SQL figures to GraphQL extensions.
+METRICS_IN_RESPONSE = os.getenv("METRICS_IN_RESPONSE", "false").lower() == "true"
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+
+# Admission control for /graphql and the auth routes. Each principal (or
+# client address, before login) gets a token bucket of RATE_LIMIT_PER_SECOND
+# requests refilling up to RATE_LIMIT_BURST (0 disables it), then 429s.
+# Concurrency is capped by a limit that adapts to latency and pool saturation
+# between ADMISSION_MIN_LIMIT and ADMISSION_MAX_LIMIT; beyond it requests get
+# an immediate 503 instead of queueing for a connection. Requests still
+# running after REQUEST_DEADLINE seconds are cancelled with a 503.
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() == "true"
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", "20"))
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "4"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "500"))
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "50"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "100"))
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "10"))
+
+# Group commit for createComment/updateComment: writes from concurrent
+# requests wait up to WRITE_COALESCE_MAX_DELAY seconds (the most latency
+# coalescing adds) or until WRITE_COALESCE_MAX_BATCH are queued, then share
+# one transaction and one commit.
+WRITE_COALESCING = os.getenv("WRITE_COALESCING", "false").lower() == "true"
+WRITE_COALESCE_MAX_DELAY = float(os.getenv("WRITE_COALESCE_MAX_DELAY", "0.002"))
+WRITE_COALESCE_MAX_BATCH = int(os.getenv("WRITE_COALESCE_MAX_BATCH", "256"))
+
+# Cold comment history: python -m app.jobs.archive_histories moves history rows
+# older than HISTORY_ARCHIVE_AFTER_DAYS into compressed, read-only segment
+# files under HISTORY_ARCHIVE_DIR (a subdirectory per shard), with the rows of
+# at most HISTORY_SEGMENT_COMMENTS comments per segment. Every worker reading
+# a shard's histories needs the same directory.
+HISTORY_ARCHIVE_DIR = os.getenv("HISTORY_ARCHIVE_DIR", "./history_archive")
+HISTORY_ARCHIVE_AFTER_DAYS = float(os.getenv("HISTORY_ARCHIVE_AFTER_DAYS", "90"))
+HISTORY_SEGMENT_COMMENTS = int(os.getenv("HISTORY_SEGMENT_COMMENTS", "5000"))
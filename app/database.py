@@ -1,22 +1,408 @@
+import asyncio
+import hashlib
+import itertools
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise Exception("DATABASE_URL environment variable not set")
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql.dml import UpdateBase
 
-engine = create_engine(DATABASE_URL,
-                        pool_size=20,
-                        max_overflow=30,
-                        pool_timeout=30,
-                    )
+from app.config import DB_MAX_CONNECTIONS, DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_POOL_TIMEOUT, WEB_CONCURRENCY
+from app.metrics import TimedAsyncQueuePool, instrument_engine
+
+logger = logging.getLogger(__name__)
+
+
+def pool_limits(budget: int, workers: int, engines: int = 1) -> tuple:
+    """(pool_size, max_overflow) per engine so that `workers` processes with
+    `engines` engines each never hold more than `budget` connections. Two
+    fifths are kept open, the rest are opened only under load."""
+    per_engine = budget // (workers * engines)
+    if per_engine < 1:
+        raise Exception(
+            f"DB_MAX_CONNECTIONS={budget} is too small for {workers} workers with {engines} databases each; "
+            f"need at least {workers * engines}"
+        )
+    pool_size = max(1, per_engine * 2 // 5)
+    return pool_size, per_engine - pool_size
+
+
+# No mounted route uses the sync engine (only scripts and the REST routers
+# main.py leaves out), so it holds no idle connections and gets no share.
+engine = create_engine(DATABASE_URL, poolclass=NullPool)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async drivers picked from the DATABASE_URL backend, e.g.
+# postgresql://... -> postgresql+asyncpg://..., sqlite:///... -> sqlite+aiosqlite:///...
+ASYNC_DRIVERS = {
+    "postgresql": "asyncpg",
+    "sqlite": "aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise Exception(f"No async driver configured for database backend '{backend}'")
+    if parsed.get_driver_name() == ASYNC_DRIVERS[backend]:
+        return url
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def parse_pairs(value: str) -> "OrderedDict[str, str]":
+    pairs = OrderedDict()
+    for item in filter(None, (item.strip() for item in value.split(","))):
+        key, sep, target = item.partition("=")
+        if not sep or not key.strip() or not target.strip():
+            raise Exception(f"Expected name=value, got '{item}'")
+        pairs[key.strip()] = target.strip()
+    return pairs
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+# Read replicas: GraphQL queries and exports read from one of the
+# comma-separated DATABASE_REPLICA_URLS, everything else uses DATABASE_URL.
+# REPLICA_POLICY picks replicas "round_robin" or "least_loaded" (fewest
+# connections in use). A client that wrote keeps reading from the primary
+# for READ_YOUR_WRITES_WINDOW seconds, which should exceed replication lag.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_POLICY = os.getenv("REPLICA_POLICY", "round_robin")
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))
+# Where that window is kept: "memory" (per process) or "redis" at
+# READ_YOUR_WRITES_URL, shared by every worker.
+READ_YOUR_WRITES_BACKEND = os.getenv("READ_YOUR_WRITES_BACKEND", "memory")
+READ_YOUR_WRITES_URL = os.getenv("READ_YOUR_WRITES_URL", "redis://localhost:6379/0")
+
+# Sharding: comments and their histories live on one of DATABASE_SHARDS
+# (comma-separated name=url pairs), picked by group through SHARD_MAP
+# (comma-separated group=name pairs; "*=name" is the shard of every other
+# group, by default the first). Users always stay on DATABASE_URL, which may
+# also be one of the shards. Unset, everything lives on DATABASE_URL.
+DATABASE_SHARDS = parse_pairs(os.getenv("DATABASE_SHARDS", ""))
+SHARD_MAP = parse_pairs(os.getenv("SHARD_MAP", ""))
+
+# One async engine per distinct database, the primary's, each replica's and
+# each shard's, and the budget is split over all of them: a worker's pools
+# together hold at most DB_MAX_CONNECTIONS / WEB_CONCURRENCY connections.
+ASYNC_URLS = list(dict.fromkeys([
+    ASYNC_DATABASE_URL,
+    *map(to_async_url, DATABASE_REPLICA_URLS),
+    *(ASYNC_DATABASE_URL if url == DATABASE_URL else to_async_url(url) for url in DATABASE_SHARDS.values()),
+]))
+POOL_SIZE, MAX_OVERFLOW = pool_limits(DB_MAX_CONNECTIONS, WEB_CONCURRENCY, len(ASYNC_URLS))
+POOL_OPTIONS = {
+    "pool_size": POOL_SIZE,
+    "max_overflow": MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+_engines_by_url = {}
+for async_url in ASYNC_URLS:
+    _engines_by_url[async_url] = create_async_engine(async_url, poolclass=TimedAsyncQueuePool, **POOL_OPTIONS)
+    instrument_engine(_engines_by_url[async_url].sync_engine)
+
+async_engine = _engines_by_url[ASYNC_DATABASE_URL]
+replica_engines = [_engines_by_url[to_async_url(url)] for url in DATABASE_REPLICA_URLS]
+shard_engines = {
+    name: async_engine if url == DATABASE_URL else _engines_by_url[to_async_url(url)]
+    for name, url in DATABASE_SHARDS.items()
+}
+
+# Every async engine, for shutdown and after forking.
+async_engines = list(_engines_by_url.values())
+
+
+class ReplicaRouter:
+    def __init__(self, engines: list, policy: str = REPLICA_POLICY):
+        if policy not in ("round_robin", "least_loaded"):
+            raise Exception(f"Unknown REPLICA_POLICY '{policy}'")
+        self.engines = engines
+        self.policy = policy
+        self.reads = [0] * len(engines)
+        self._turn = itertools.count()
+
+    def pick(self) -> Optional[AsyncEngine]:
+        if not self.engines:
+            return None
+        start = next(self._turn) % len(self.engines)
+        index = start
+        if self.policy == "least_loaded":
+            # Ties go round-robin so idle replicas share the load too.
+            index = min(
+                range(len(self.engines)),
+                key=lambda i: (self.engines[i].sync_engine.pool.checkedout(), (i - start) % len(self.engines)),
+            )
+        self.reads[index] += 1
+        return self.engines[index]
+
+    def stats(self) -> dict:
+        return {str(i): reads for i, reads in enumerate(self.reads)}
+
+
+class RecentWrites:
+    """Clients (identified by their Authorization header) that wrote in the
+    last `window` seconds, oldest first so expired entries pop off the front.
+    Kept per process: with several workers, use RedisRecentWrites."""
+
+    def __init__(self, window: float = READ_YOUR_WRITES_WINDOW, maxsize: int = 100_000):
+        self.window = window
+        self.maxsize = maxsize
+        self._until: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def mark(self, client: Optional[str]) -> None:
+        if not client or self.window <= 0:
+            return
+        with self._lock:
+            self._until.pop(client, None)
+            self._until[client] = time.monotonic() + self.window
+            self._prune()
+
+    async def recent(self, client: Optional[str]) -> bool:
+        if not client:
+            return False
+        with self._lock:
+            self._prune()
+            return client in self._until
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        while self._until and (len(self._until) > self.maxsize or next(iter(self._until.values())) <= now):
+            self._until.popitem(last=False)
+
+
+class RedisRecentWrites:
+    """The same window kept in Redis, so every worker sees every client's
+    writes: one key per client, named by a hash of its Authorization header
+    and expiring with the window. While Redis can't be reached every client
+    counts as having written, and reads from the primary."""
+
+    def __init__(self, url: str = READ_YOUR_WRITES_URL, window: float = READ_YOUR_WRITES_WINDOW):
+        try:
+            import redis.asyncio as redis
+            from redis.exceptions import RedisError
+        except ImportError:
+            raise Exception("READ_YOUR_WRITES_BACKEND=redis requires the 'redis' package")
+        self._client = redis.from_url(url)
+        self._errors = (RedisError, OSError)
+        self.window = window
+
+    @staticmethod
+    def _key(client: str) -> str:
+        return "recent-write:" + hashlib.sha256(client.encode()).hexdigest()
+
+    async def mark(self, client: Optional[str]) -> None:
+        if not client or self.window <= 0:
+            return
+        try:
+            await self._client.set(self._key(client), 1, px=max(1, int(self.window * 1000)))
+        except self._errors as e:
+            logger.warning("Could not record a write in Redis; the client may read a lagging replica: %s", e)
+
+    async def recent(self, client: Optional[str]) -> bool:
+        if not client or self.window <= 0:
+            return False
+        try:
+            return bool(await self._client.exists(self._key(client)))
+        except self._errors:
+            return True
+
+
+def create_recent_writes(name: str = READ_YOUR_WRITES_BACKEND):
+    if name == "memory":
+        return RecentWrites()
+    if name == "redis":
+        return RedisRecentWrites()
+    raise Exception(f"Unknown READ_YOUR_WRITES_BACKEND '{name}'")
+
+
+class ShardMap:
+    """Which shard holds each group's comments. Without shards every group
+    maps to the primary."""
+
+    def __init__(self, engines: dict, groups: dict):
+        self.engines = engines or {"primary": async_engine}
+        for group, name in groups.items():
+            if name not in self.engines:
+                raise Exception(f"SHARD_MAP sends group '{group}' to unknown shard '{name}'")
+        self.groups = {group: name for group, name in groups.items() if group != "*"}
+        self.default = groups.get("*", next(iter(self.engines)))
+
+    def name_for(self, group: str) -> str:
+        return self.groups.get(group, self.default)
+
+    def engine_for(self, group: str) -> AsyncEngine:
+        return self.engines[self.name_for(group)]
+
+
+replica_router = ReplicaRouter(replica_engines)
+recent_writes = create_recent_writes()
+shard_map = ShardMap(shard_engines, SHARD_MAP)
+
+
+class RoutingSession(Session):
+    """Session bound to the primary, or to a group's shard for everything but
+    users once use_shard() was called. use_replica() sends reads that would
+    go to the primary to a replica instead; flushes and INSERT/UPDATE/DELETE
+    statements never go to a replica."""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        bind = super().get_bind(mapper, clause=clause, **kwargs)
+        replica = self.info.get("replica")
+        if (
+            replica is None or self.info.get("primary_reads") or bind is not async_engine.sync_engine
+            or self._flushing or isinstance(clause, UpdateBase)
+        ):
+            return bind
+        return replica.sync_engine
+
+
+async def use_replica(db: AsyncSession, client: Optional[str] = None) -> bool:
+    """Send db's reads to a replica, unless there is none or `client` wrote
+    recently. Call it before db runs anything."""
+    if await recent_writes.recent(client):
+        # Shared caches are skipped too; see GroupFeedCache.get_or_load.
+        db.info["recent_write"] = True
+        return False
+    engine = replica_router.pick()
+    if engine is None:
+        return False
+    db.info["replica"] = engine
+    return True
+
+
+@asynccontextmanager
+async def reading_primary(db: AsyncSession):
+    """Within the block, db reads from the primary even if use_replica() was
+    called; so do other operations running on db concurrently."""
+    db.info["primary_reads"] = db.info.get("primary_reads", 0) + 1
+    try:
+        yield
+    finally:
+        db.info["primary_reads"] -= 1
+
+
+def use_shard(db: AsyncSession, group: str) -> None:
+    """Send db's statements on comments and histories (anything but users)
+    to the shard holding `group`. Call it before db touches those tables."""
+    if not shard_engines:
+        return
+    session = db.sync_session
+    session.bind_table(Base.metadata.tables["users"], async_engine.sync_engine)
+    session.bind = shard_map.engine_for(group).sync_engine
+
+
+class RequestSession(AsyncSession):
+    """AsyncSession that serializes its I/O.
+
+    GraphQL resolves sibling fields and DataLoader batches concurrently, but an
+    AsyncSession (and its connection) only supports one operation at a time.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._io_lock = asyncio.Lock()
+
+    async def execute(self, *args, **kwargs):
+        async with self._io_lock:
+            return await super().execute(*args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        async with self._io_lock:
+            return await super().scalar(*args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        async with self._io_lock:
+            return await super().get(*args, **kwargs)
+
+    async def delete(self, *args, **kwargs):
+        async with self._io_lock:
+            return await super().delete(*args, **kwargs)
+
+    async def flush(self, *args, **kwargs):
+        async with self._io_lock:
+            return await super().flush(*args, **kwargs)
+
+    async def refresh(self, *args, **kwargs):
+        async with self._io_lock:
+            return await super().refresh(*args, **kwargs)
+
+    async def commit(self):
+        async with self._io_lock:
+            return await super().commit()
+
+    async def rollback(self):
+        async with self._io_lock:
+            return await super().rollback()
+
+    async def close(self):
+        async with self._io_lock:
+            return await super().close()
+
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=RequestSession, sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False,
+)
+
 Base = declarative_base()
 
+
+class PoolStats:
+    """Counts connection checkouts/checkins so leaked sessions are visible."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+
+    @property
+    def checked_out(self) -> int:
+        return self.checkouts - self.checkins
+
+    def on_checkout(self, *args):
+        with self._lock:
+            self.checkouts += 1
+
+    def on_checkin(self, *args):
+        with self._lock:
+            self.checkins += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "checked_out": self.checkouts - self.checkins,
+            }
+
+
+pool_stats = PoolStats()
+event.listen(engine, "checkout", pool_stats.on_checkout)
+event.listen(engine, "checkin", pool_stats.on_checkin)
+event.listen(async_engine.sync_engine, "checkout", pool_stats.on_checkout)
+event.listen(async_engine.sync_engine, "checkin", pool_stats.on_checkin)
+for extra_engine in async_engines[1:]:
+    event.listen(extra_engine.sync_engine, "checkout", pool_stats.on_checkout)
+    event.listen(extra_engine.sync_engine, "checkin", pool_stats.on_checkin)
+
 # Dependency for FastAPI to get DB session
 def get_db():
     db = SessionLocal()
@@ -24,3 +410,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
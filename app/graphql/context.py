@@ -0,0 +1,11 @@
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_async_db
+from app.graphql.loaders import create_loaders
+
+
+# One session per GraphQL request, shared by every resolver through
+# info.context["db"]. FastAPI closes it when the request finishes.
+async def get_context(db: AsyncSession = Depends(get_async_db)):
+    return {"db": db, "loaders": create_loaders(db)}
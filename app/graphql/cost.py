@@ -0,0 +1,201 @@
+from typing import Awaitable, Callable, Dict, Optional
+
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLList,
+    GraphQLNonNull,
+    GraphQLObjectType,
+    InlineFragmentNode,
+    ListValueNode,
+    OperationType,
+    VariableNode,
+    get_operation_ast,
+    value_from_ast_untyped,
+)
+from strawberry.extensions import SchemaExtension
+
+from app.config import QUERY_MAX_COST, QUERY_MAX_DEPTH, QUERY_MAX_NODES
+from app.graphql.pagination import DEFAULT_PAGE_SIZE
+
+# Cost charged once per returned instance of a field. Object fields default to
+# 1 and scalars to 0; these weigh the fields that run their own queries.
+FIELD_COSTS: Dict[str, int] = {
+    "Query.allUsers": 5,
+    "Query.allComments": 5,
+    "Query.allCommentHistories": 5,
+    "Query.users": 2,
+    "Query.comments": 2,
+    "Query.commentHistories": 2,
+    "Query.searchComments": 5,
+    "UserTypeConnection.totalCount": 10,
+    "CommentTypeConnection.totalCount": 10,
+    "CommentHistoryTypeConnection.totalCount": 10,
+    "CommentHistoryType.oldValue": 1,
+    "CommentHistoryType.newValue": 1,
+    "UserType.commentCount": 1,
+    "UserType.editCount": 1,
+}
+
+# Expected length of list fields that have no `first` argument to bound them.
+# Root lists are charged by their actual length instead when QueryCost is
+# given a counter for them (see list_counts).
+LIST_SIZES: Dict[str, int] = {
+    "Query.allUsers": 1000,
+    "Query.allComments": 1000,
+    "Query.allCommentHistories": 1000,
+    "UserType.comments": 50,
+    "CommentType.histories": 20,
+}
+DEFAULT_LIST_SIZE = 100
+
+# List fields whose length equals the length of one of their arguments.
+LIST_SIZE_ARGUMENTS: Dict[str, str] = {
+    "Mutation.createComments": "contents",
+    "Mutation.updateComments": "edits",
+}
+
+
+def _unwrap(type_):
+    is_list = False
+    while isinstance(type_, (GraphQLNonNull, GraphQLList)):
+        is_list = is_list or isinstance(type_, GraphQLList)
+        type_ = type_.of_type
+    return type_, is_list
+
+
+class QueryCost(SchemaExtension):
+    """Static cost analysis of the operation before any resolver runs.
+
+    Every field's cost is multiplied by how many times it is expected to be
+    resolved: `first` on paginated fields, the argument length for bulk
+    mutations, and LIST_SIZES estimates for unbounded lists. The operation is
+    rejected when its depth, total cost or estimated number of returned
+    objects exceeds the limits; the figures are reported in
+    extensions.cost either way.
+
+    `list_counts` maps root list fields to async functions of the request
+    context returning their actual length (None if unknown). Those selected
+    are counted first, so a list too long for the limits is refused as a
+    whole rather than resolved.
+    """
+
+    def __init__(
+        self,
+        max_depth: int = QUERY_MAX_DEPTH,
+        max_cost: int = QUERY_MAX_COST,
+        max_nodes: int = QUERY_MAX_NODES,
+        field_costs: Optional[Dict[str, int]] = None,
+        list_sizes: Optional[Dict[str, int]] = None,
+        list_counts: Optional[Dict[str, Callable[[dict], Awaitable[Optional[int]]]]] = None,
+    ):
+        self.max_depth = max_depth
+        self.max_cost = max_cost
+        self.max_nodes = max_nodes
+        self.field_costs = FIELD_COSTS if field_costs is None else field_costs
+        self.list_sizes = LIST_SIZES if list_sizes is None else list_sizes
+        self.list_counts = list_counts or {}
+        self.report = None
+        self._counts: Dict[str, int] = {}
+
+    async def on_execute(self):
+        context = self.execution_context
+        operation = get_operation_ast(context.graphql_document, context.operation_name)
+        if operation is None:
+            yield
+            return
+        self._fragments = {
+            d.name.value: d for d in context.graphql_document.definitions
+            if d.kind == "fragment_definition"
+        }
+        self._variables = context.variables or {}
+
+        root = context.schema._schema.get_root_type(operation.operation)
+        if operation.operation == OperationType.QUERY:
+            for node in self._fields(operation.selection_set):
+                key = f"{root.name}.{node.name.value}"
+                if key in self.list_counts and key not in self._counts:
+                    count = await self.list_counts[key](context.context)
+                    if count is not None:
+                        self._counts[key] = count
+        self._cost = self._nodes = self._depth = 0
+        self._walk(operation.selection_set, root, 1, 1)
+        self.report = {
+            "requested": self._cost,
+            "nodes": self._nodes,
+            "depth": self._depth,
+            "maximum": {"cost": self.max_cost, "nodes": self.max_nodes, "depth": self.max_depth},
+        }
+
+        for name, value, limit in (
+            ("depth", self._depth, self.max_depth),
+            ("cost", self._cost, self.max_cost),
+            ("nodes", self._nodes, self.max_nodes),
+        ):
+            if value > limit:
+                raise GraphQLError(
+                    f"Query {name} {value} exceeds the maximum of {limit}",
+                    extensions={"code": "QUERY_TOO_COMPLEX", "limit": name, "value": value, "maximum": limit},
+                )
+        yield
+
+    def get_results(self):
+        return {"cost": self.report} if self.report else {}
+
+    def _argument(self, node: FieldNode, name: str):
+        for argument in node.arguments or ():
+            if argument.name.value == name:
+                if isinstance(argument.value, VariableNode):
+                    return self._variables.get(argument.value.name.value)
+                if isinstance(argument.value, ListValueNode):
+                    return argument.value.values
+                return value_from_ast_untyped(argument.value, self._variables)
+        return None
+
+    def _fields(self, selection_set):
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                yield selection
+            elif isinstance(selection, InlineFragmentNode):
+                yield from self._fields(selection.selection_set)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self._fragments.get(selection.name.value)
+                if fragment:
+                    yield from self._fields(fragment.selection_set)
+
+    def _size(self, key: str, node: FieldNode, is_list: bool, sized_by_parent: bool) -> int:
+        if any(arg.name.value == "first" for arg in node.arguments or ()):
+            first = self._argument(node, "first")
+            return DEFAULT_PAGE_SIZE if first is None else max(int(first), 0)
+        if not is_list or sized_by_parent:
+            return 1
+        if key in LIST_SIZE_ARGUMENTS:
+            values = self._argument(node, LIST_SIZE_ARGUMENTS[key])
+            return len(values) if values is not None else DEFAULT_LIST_SIZE
+        if key in self._counts:
+            return self._counts[key]
+        return self.list_sizes.get(key, DEFAULT_LIST_SIZE)
+
+    def _walk(self, selection_set, parent_type, multiplier: int, depth: int, sized_by_parent: bool = False):
+        self._depth = max(self._depth, depth)
+        for node in self._fields(selection_set):
+            name = node.name.value
+            if name.startswith("__"):
+                continue
+            field = parent_type.fields.get(name)
+            if field is None:
+                continue
+            key = f"{parent_type.name}.{name}"
+            field_type, is_list = _unwrap(field.type)
+            is_object = isinstance(field_type, GraphQLObjectType)
+
+            count = multiplier * self._size(key, node, is_list, sized_by_parent)
+            self._cost += self.field_costs.get(key, 1 if is_object else 0) * count
+            if is_object:
+                self._nodes += count
+                if node.selection_set:
+                    # A `first` on this field already sizes the lists below it
+                    # (connection edges).
+                    has_first = any(arg.name.value == "first" for arg in node.arguments or ())
+                    self._walk(node.selection_set, field_type, count, depth + 1, has_first)
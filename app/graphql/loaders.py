@@ -0,0 +1,74 @@
+from collections import defaultdict
+from typing import List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from strawberry.dataloader import DataLoader
+
+from app import models
+from app.graphql.projection import all_columns
+from app.utils.history import load_history_values
+from app.utils.history_archive import load_archived, merge_archived
+
+
+# Per-request batching loaders. Each nested relationship field resolves
+# through one of these, so a list of N parents costs one extra query per
+# relationship instead of N. They load every column the GraphQL types can
+# expose, as plain rows, since one load may serve several selections.
+def create_loaders(db: AsyncSession) -> dict:
+    async def load_users(user_ids: List[int]) -> list:
+        users = (await db.execute(select(*all_columns(models.User)).where(models.User.id.in_(user_ids)))).all()
+        by_id = {u.id: u for u in users}
+        return [by_id.get(user_id) for user_id in user_ids]
+
+    async def load_comments(comment_ids: List[int]) -> list:
+        comments = (await db.execute(select(*all_columns(models.Comment)).where(models.Comment.id.in_(comment_ids)))).all()
+        by_id = {c.id: c for c in comments}
+        return [by_id.get(comment_id) for comment_id in comment_ids]
+
+    async def load_comments_by_user(user_ids: List[int]) -> List[list]:
+        comments = (await db.execute(
+            select(*all_columns(models.Comment))
+            .where(models.Comment.user_id.in_(user_ids))
+            .order_by(models.Comment.id)
+        )).all()
+        by_user = defaultdict(list)
+        for c in comments:
+            by_user[c.user_id].append(c)
+        return [by_user[user_id] for user_id in user_ids]
+
+    async def load_histories_by_comment(comment_ids: List[int]) -> List[list]:
+        histories = (await db.execute(
+            select(*all_columns(models.CommentHistory))
+            .where(models.CommentHistory.comment_id.in_(comment_ids))
+            .order_by(models.CommentHistory.id)
+        )).all()
+        by_comment = defaultdict(list)
+        for h in histories:
+            by_comment[h.comment_id].append(h)
+        archived = await load_archived(db, models.CommentArchive.comment_id.in_(comment_ids))
+        return [
+            merge_archived(by_comment[comment_id], {comment_id: archived.get(comment_id, [])}, key=lambda h: h.id)
+            for comment_id in comment_ids
+        ]
+
+    async def load_user_stats(user_ids: List[int]) -> list:
+        stats = (await db.execute(
+            select(models.UserStats.user_id, models.UserStats.comment_count, models.UserStats.edit_count)
+            .where(models.UserStats.user_id.in_(user_ids))
+        )).all()
+        by_user = {s.user_id: s for s in stats}
+        return [by_user.get(user_id) for user_id in user_ids]
+
+    async def load_history_values_batch(history_ids: List[int]) -> List[tuple]:
+        values = await load_history_values(db, history_ids)
+        return [values.get(history_id) for history_id in history_ids]
+
+    return {
+        "user": DataLoader(load_fn=load_users),
+        "comment": DataLoader(load_fn=load_comments),
+        "comments_by_user": DataLoader(load_fn=load_comments_by_user),
+        "histories_by_comment": DataLoader(load_fn=load_histories_by_comment),
+        "history_values": DataLoader(load_fn=load_history_values_batch),
+        "user_stats": DataLoader(load_fn=load_user_stats),
+    }
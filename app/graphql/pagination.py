@@ -0,0 +1,117 @@
+import base64
+import json
+from datetime import datetime
+from typing import Awaitable, Callable, Generic, List, Optional, Sequence, TypeVar
+
+import strawberry
+from sqlalchemy import Select, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+T = TypeVar("T")
+
+
+@strawberry.type
+class PageInfo:
+    has_next_page: bool
+    end_cursor: Optional[str]
+
+
+@strawberry.type
+class Edge(Generic[T]):
+    cursor: str
+    node: T
+
+
+@strawberry.type
+class Connection(Generic[T]):
+    edges: List[Edge[T]]
+    page_info: PageInfo
+    count_fn: strawberry.Private[Callable[[], Awaitable[int]]]
+
+    @strawberry.field
+    async def total_count(self) -> int:
+        # Only runs the COUNT query when the client selects totalCount.
+        return await self.count_fn()
+
+
+def encode_cursor(values: Sequence) -> str:
+    raw = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(raw).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> list:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if len(raw) != len(columns):
+            raise ValueError
+        return [
+            datetime.fromisoformat(v) if col.type.python_type is datetime else v
+            for v, col in zip(raw, columns)
+        ]
+    except Exception:
+        raise Exception("Invalid cursor")
+
+
+async def paginate(
+    db: AsyncSession,
+    stmt: Select,
+    columns: Sequence,
+    first: Optional[int],
+    after: Optional[str],
+    to_nodes: Callable[[list], Awaitable[list]],
+    cached: Optional[Callable] = None,
+    extra: Optional[Callable[[Optional[tuple], int], Awaitable[list]]] = None,
+    extra_count: Optional[Callable[[], Awaitable[int]]] = None,
+) -> Connection:
+    """Keyset pagination over `columns` (ascending), e.g. (created_at, id).
+
+    Each page is a bounded index range scan regardless of table size, unlike
+    OFFSET which has to walk every skipped row. Columns may also be labelled
+    expressions such as a search rank. to_nodes gets the result rows, which
+    carry the keyset columns after stmt's own. `cached`, when given, is a
+    read-through cache called as cached(key, loader) for the page and count.
+    `extra`, when given, is called as extra(after, n) to load up to n rows
+    from outside stmt (and not in it) past the keyset `after` (None on the
+    first page), as (keyset values, row) pairs in keyset order; they are
+    merged into the pages. `extra_count` then counts them for totalCount.
+    """
+    first = DEFAULT_PAGE_SIZE if first is None else first
+    if first < 0 or first > MAX_PAGE_SIZE:
+        raise Exception(f"first must be between 0 and {MAX_PAGE_SIZE}")
+
+    async def load_page():
+        page_stmt = stmt
+        start = tuple(decode_cursor(after, columns)) if after else None
+        if start:
+            page_stmt = page_stmt.where(tuple_(*columns) > tuple_(*start))
+        rows = (await db.execute(page_stmt.add_columns(*columns).order_by(*columns).limit(first + 1))).all()
+        keyed = [(tuple(row[-len(columns):]), row) for row in rows]
+        if extra:
+            more = await extra(start, first + 1)
+            keyed = sorted(keyed + more, key=lambda pair: tuple(pair[0]))[:first + 1]
+        page = keyed[:first]
+        cursors = [encode_cursor(key) for key, _ in page]
+        return list(zip(cursors, await to_nodes([row for _, row in page]))), len(keyed) > first
+
+    async def load_count():
+        count = await db.scalar(select(func.count()).select_from(stmt.order_by(None).subquery()))
+        return count + await extra_count() if extra_count else count
+
+    if cached:
+        edges, has_next_page = await cached(("page", first, after), load_page)
+        count_fn = lambda: cached(("count",), load_count)
+    else:
+        edges, has_next_page = await load_page()
+        count_fn = load_count
+
+    return Connection(
+        edges=[Edge(cursor=cursor, node=node) for cursor, node in edges],
+        page_info=PageInfo(
+            has_next_page=has_next_page,
+            end_cursor=edges[-1][0] if edges else None,
+        ),
+        count_fn=count_fn,
+    )
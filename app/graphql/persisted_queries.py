@@ -0,0 +1,103 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from graphql import GraphQLError
+from strawberry.extensions import SchemaExtension
+
+from app.config import PERSISTED_QUERIES, PERSISTED_QUERIES_FILE, PERSISTED_QUERY_CACHE_SIZE
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class PersistedQueryStore:
+    """sha256 -> query text. In "auto" mode it's a bounded LRU filled by
+    clients on a miss; in "allowlist" mode it's fixed at startup."""
+
+    def __init__(self, mode: str = PERSISTED_QUERIES, maxsize: int = PERSISTED_QUERY_CACHE_SIZE):
+        self.mode = mode
+        self.maxsize = maxsize
+        self._queries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        if mode == "allowlist":
+            if not PERSISTED_QUERIES_FILE:
+                raise Exception("PERSISTED_QUERIES=allowlist requires PERSISTED_QUERIES_FILE")
+            self.load(PERSISTED_QUERIES_FILE)
+
+    def load(self, path: str) -> None:
+        # Either {"<sha256>": "<query>", ...} or a plain list of query texts.
+        with open(path) as f:
+            data = json.load(f)
+        queries = data.values() if isinstance(data, dict) else data
+        for query in queries:
+            self._queries[query_hash(query)] = query
+        if isinstance(data, dict):
+            for sha, query in data.items():
+                if query_hash(query) != sha:
+                    raise Exception(f"Allowlisted query {sha} does not match its hash")
+
+    def get(self, sha: str) -> Optional[str]:
+        with self._lock:
+            query = self._queries.get(sha)
+            if query is not None and self.mode == "auto":
+                self._queries.move_to_end(sha)
+            return query
+
+    def put(self, sha: str, query: str) -> None:
+        if self.mode != "auto":
+            return
+        with self._lock:
+            self._queries[sha] = query
+            self._queries.move_to_end(sha)
+            while len(self._queries) > self.maxsize:
+                self._queries.popitem(last=False)
+
+    def __contains__(self, sha: str) -> bool:
+        with self._lock:
+            return sha in self._queries
+
+
+persisted_queries = PersistedQueryStore()
+
+
+def _error(message: str, code: str) -> GraphQLError:
+    return GraphQLError(message, extensions={"code": code})
+
+
+class PersistedQueries(SchemaExtension):
+    """Automatic persisted queries (Apollo APQ protocol).
+
+    Clients send extensions.persistedQuery.sha256Hash and omit the query;
+    on PERSISTED_QUERY_NOT_FOUND they retry once with the full text, which is
+    then remembered. In allowlist mode only documents from the allowlist
+    file run, whether sent by hash or in full.
+    """
+
+    def __init__(self, store: PersistedQueryStore = persisted_queries):
+        self.store = store
+
+    def on_operation(self):
+        context = self.execution_context
+        persisted = (context.operation_extensions or {}).get("persistedQuery")
+        sha = persisted.get("sha256Hash") if isinstance(persisted, dict) else None
+
+        if sha:
+            if context.query:
+                if query_hash(context.query) != sha:
+                    raise _error("provided sha does not match query", "PERSISTED_QUERY_HASH_MISMATCH")
+                if self.store.mode == "allowlist" and sha not in self.store:
+                    raise _error("Query is not in the allowlist", "PERSISTED_QUERY_NOT_ALLOWED")
+                self.store.put(sha, context.query)
+            else:
+                context.query = self.store.get(sha)
+                if context.query is None:
+                    code = "PERSISTED_QUERY_NOT_ALLOWED" if self.store.mode == "allowlist" else "PERSISTED_QUERY_NOT_FOUND"
+                    raise _error("PersistedQueryNotFound", code)
+        elif self.store.mode == "allowlist" and context.query and query_hash(context.query) not in self.store:
+            raise _error("Query is not in the allowlist", "PERSISTED_QUERY_NOT_ALLOWED")
+
+        yield
@@ -0,0 +1,78 @@
+from typing import Dict, Iterable, List, Set, Tuple
+
+from strawberry.types import Info
+from strawberry.types.nodes import FragmentSpread, InlineFragment
+
+from app import models
+
+# Columns each GraphQL field needs from its type's table, by schema name.
+# Relationship fields list the keys their loaders are called with. Columns
+# no field maps to (hashed_password, created_at, delta, ...) are never
+# loaded for a GraphQL object.
+FIELD_COLUMNS: Dict[type, Dict[str, Tuple[str, ...]]] = {
+    models.User: {
+        "id": ("id",),
+        "username": ("username",),
+        "group": ("group",),
+        "comments": ("id", "group"),
+        "commentCount": ("id", "group"),
+        "editCount": ("id", "group"),
+    },
+    models.Comment: {
+        "id": ("id",),
+        "content": ("content",),
+        "userId": ("user_id",),
+        "author": ("user_id",),
+        "histories": ("id",),
+    },
+    models.CommentHistory: {
+        "id": ("id",),
+        "commentId": ("comment_id",),
+        "comment": ("comment_id",),
+        "timestamp": ("timestamp",),
+        # Either text may have to be rebuilt from the other (see app.utils.history).
+        "oldValue": ("old_value", "new_value"),
+        "newValue": ("old_value", "new_value"),
+    },
+}
+
+
+def _flatten(selections):
+    for selection in selections:
+        if isinstance(selection, (FragmentSpread, InlineFragment)):
+            yield from _flatten(selection.selections)
+        else:
+            yield selection
+
+
+def selected_fields(info: Info, *path: str) -> Set[str]:
+    """Names of the fields selected on the object the current field returns,
+    or on the one reached through `path`, e.g. ("edges", "node") for a
+    connection. Fragments are flattened and aliased fields merged."""
+    selections = info.selected_fields[0].selections
+    for name in path:
+        selections = [child for s in _flatten(selections) if s.name == name for child in s.selections]
+    return {selection.name for selection in _flatten(selections)}
+
+
+def columns_for(model, fields: Iterable[str]) -> List:
+    """The model's columns needed to resolve `fields`, in table order. The
+    primary key is always included so nodes stay identifiable."""
+    needs = FIELD_COLUMNS[model]
+    names = {"id"}
+    for field in fields:
+        names.update(needs.get(field, ()))
+    return [getattr(model, column.key) for column in model.__table__.columns if column.key in names]
+
+
+def all_columns(model) -> List:
+    """Every column some field of the model's GraphQL type may need."""
+    return columns_for(model, FIELD_COLUMNS[model])
+
+
+def projection(info: Info, model, *path: str) -> List:
+    return columns_for(model, selected_fields(info, *path))
+
+
+def projection_key(columns: Iterable) -> str:
+    return ",".join(column.key for column in columns)
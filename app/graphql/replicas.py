@@ -0,0 +1,25 @@
+from strawberry.extensions import SchemaExtension
+from strawberry.types.graphql import OperationType
+
+from app.database import recent_writes, use_replica
+
+
+class ReplicaRouting(SchemaExtension):
+    """Runs queries on a read replica and everything else on the primary.
+
+    The request's session is routed before any resolver touches it. After a
+    mutation its client reads from the primary for READ_YOUR_WRITES_WINDOW
+    seconds, so it sees its own writes despite replication lag.
+    """
+
+    async def on_execute(self):
+        execution_context = self.execution_context
+        request = execution_context.context.get("request")
+        client = request.headers.get("Authorization") if request is not None else None
+        operation_type = execution_context.operation_type
+
+        if operation_type == OperationType.QUERY:
+            await use_replica(execution_context.context["db"], client)
+        yield
+        if operation_type == OperationType.MUTATION:
+            await recent_writes.mark(client)
@@ -1,13 +1,52 @@
+import asyncio
 import strawberry
-from typing import List, Optional
-from sqlalchemy.orm import Session
-from fastapi import Request
+from strawberry.types import Info
+from typing import AsyncGenerator, List, Optional
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException, Request
+from strawberry.extensions import ParserCache, ValidationCache
 from strawberry.fastapi import GraphQLRouter
 from datetime import datetime
 
-from app import models, database, utils
-from app.auth.auth import get_current_user
-from app.models.user import User as UserModel
+from app import models, utils
+from app.auth.auth import get_current_user_async, parse_bearer_header
+from app.auth.principal_cache import Principal, invalidate_principal
+from app.cache import feed_cache
+from app.coalescer import CreateComment, UpdateComment, write_coalescer
+from app.config import DOCUMENT_CACHE_SIZE, METRICS_IN_RESPONSE, PERSISTED_QUERIES
+from app.database import replica_engines
+from app.graphql.context import get_context
+from app.graphql.cost import QueryCost
+from app.graphql.loaders import create_loaders
+from app.graphql.pagination import Connection, paginate
+from app.graphql.persisted_queries import PersistedQueries
+from app.graphql.projection import columns_for, projection, projection_key, selected_fields
+from app.graphql.replicas import ReplicaRouting
+from app.metrics import ResolverMetrics
+from app.pubsub import pubsub
+from app.utils.counters import add_counts, count_edits, remove_user_counts
+from app.utils.history import build_histories, build_history, load_for_edit, load_history_values
+from app.utils.history_archive import count_archived, find_archived, load_archived, load_cold_page, merge_archived
+from app.utils.search import search_comments_query
+from app.utils.shards import move_user_comments
+
+async def viewer(info: Info) -> Principal:
+    return await context_viewer(info.context)
+
+
+async def context_viewer(context: dict) -> Principal:
+    # The authenticated user, looked up at most once per request even when
+    # many fields ask for it concurrently.
+    if "current_user" not in context:
+        # WebSocket clients send the token in their connection params.
+        params = context.get("connection_params")
+        header = params.get("Authorization") if isinstance(params, dict) else None
+        context["current_user"] = asyncio.ensure_future(get_current_user_async(
+            context["request"], context["db"], header and parse_bearer_header(header)
+        ))
+    return await context["current_user"]
+
 
 @strawberry.type
 class UserType:
@@ -15,200 +54,589 @@ class UserType:
     username: str
     group: str
 
+    @strawberry.field
+    async def comments(self, info: Info) -> List["CommentType"]:
+        if self.group != (await viewer(info)).group:
+            return []
+        comments = await info.context["loaders"]["comments_by_user"].load(self.id)
+        return [to_comment_type(c) for c in comments]
+
+    # Counters of other groups' users are as private as their comments.
+    @strawberry.field
+    async def comment_count(self, info: Info) -> Optional[int]:
+        if self.group != (await viewer(info)).group:
+            return None
+        stats = await info.context["loaders"]["user_stats"].load(self.id)
+        return stats.comment_count if stats else 0
+
+    @strawberry.field
+    async def edit_count(self, info: Info) -> Optional[int]:
+        if self.group != (await viewer(info)).group:
+            return None
+        stats = await info.context["loaders"]["user_stats"].load(self.id)
+        return stats.edit_count if stats else 0
+
 @strawberry.type
 class CommentType:
     id: int
     content: str
     user_id: int
 
+    @strawberry.field
+    async def author(self, info: Info) -> Optional[UserType]:
+        user = await info.context["loaders"]["user"].load(self.user_id)
+        return to_user_type(user) if user else None
+
+    @strawberry.field
+    async def histories(self, info: Info) -> List["CommentHistoryType"]:
+        histories = await info.context["loaders"]["histories_by_comment"].load(self.id)
+        return [to_comment_history_type(h) for h in histories]
+
 @strawberry.type
 class CommentHistoryType:
     id: int
     comment_id: int
     timestamp: datetime
-    old_value: str
-    new_value: str
+    stored_old_value: strawberry.Private[Optional[str]]
+    stored_new_value: strawberry.Private[Optional[str]]
+
+    # Delta-stored rows are rebuilt only when their text is selected.
+    @strawberry.field
+    async def old_value(self, info: Info) -> str:
+        if self.stored_old_value is not None:
+            return self.stored_old_value
+        return (await info.context["loaders"]["history_values"].load(self.id))[0]
+
+    @strawberry.field
+    async def new_value(self, info: Info) -> str:
+        if self.stored_new_value is not None:
+            return self.stored_new_value
+        return (await info.context["loaders"]["history_values"].load(self.id))[1]
+
+    @strawberry.field
+    async def comment(self, info: Info) -> Optional[CommentType]:
+        comment = await info.context["loaders"]["comment"].load(self.comment_id)
+        return to_comment_type(comment) if comment else None
+
 
+@strawberry.type
+class GroupStatsType:
+    group: str
+    comment_count: int
+    edit_count: int
 
-def to_user_type(user: UserModel) -> UserType:
-    return UserType(id=user.id, username=user.username, group=user.group)
 
+@strawberry.input
+class CommentEditInput:
+    comment_id: int
+    new_content: str
 
-def to_comment_type(comment: models.Comment) -> CommentType:
-    return CommentType(id=comment.id, content=comment.content, user_id=comment.user_id)
 
+# Query results are column projections of the selected fields (see
+# app.graphql.projection), so anything not selected may be missing.
+def to_user_type(user) -> UserType:
+    return UserType(
+        id=user.id,
+        username=getattr(user, "username", None),
+        group=getattr(user, "group", None),
+    )
 
-def to_comment_history_type(history: models.CommentHistory) -> CommentHistoryType:
+
+def to_comment_type(comment) -> CommentType:
+    return CommentType(
+        id=comment.id,
+        content=getattr(comment, "content", None),
+        user_id=getattr(comment, "user_id", None),
+    )
+
+
+def to_comment_history_type(
+    history,
+    old_value: Optional[str] = None,
+    new_value: Optional[str] = None,
+) -> CommentHistoryType:
     return CommentHistoryType(
         id=history.id,
-        comment_id=history.comment_id,
-        timestamp=history.timestamp,
-        old_value=history.old_value,
-        new_value=history.new_value,
+        comment_id=getattr(history, "comment_id", None),
+        timestamp=getattr(history, "timestamp", None),
+        stored_old_value=old_value if old_value is not None else getattr(history, "old_value", None),
+        stored_new_value=new_value if new_value is not None else getattr(history, "new_value", None),
+    )
+
+
+def comment_channel(group: str, event: str) -> str:
+    return f"comments:{group}:{event}"
+
+
+def comment_message(comment: models.Comment) -> dict:
+    return {"id": comment.id, "content": comment.content, "user_id": comment.user_id}
+
+
+async def publish_comments(group: str, event: str, messages: List[dict]) -> None:
+    for message in messages:
+        await pubsub.publish(comment_channel(group, event), message)
+
+
+async def group_events(info: Info, event: str):
+    """Messages for one comment event in the viewer's group, for as long as
+    the client stays subscribed."""
+    user = await viewer(info)
+    db: AsyncSession = info.context["db"]
+    async with pubsub.subscribe(comment_channel(user.group, event)) as subscriber:
+        # The WebSocket's session lives as long as the connection; hand its
+        # database connection back to the pool while waiting for events.
+        await db.close()
+        async for message in subscriber:
+            # Fresh loaders per event, as for a request: cached rows would go
+            # stale and pile up over a long-lived connection.
+            info.context["loaders"] = create_loaders(db)
+            yield message
+            await db.close()
+
+
+def nodes_of(to_type):
+    async def to_nodes(rows):
+        return [to_type(row) for row in rows]
+    return to_nodes
+
+
+def history_nodes(db: AsyncSession):
+    async def to_nodes(histories):
+        # Cached feeds must not need the database when served, so rebuild
+        # delta-stored texts up front while the feed cache is on.
+        values = {}
+        missing = [h.id for h in histories if hasattr(h, "new_value") and h.new_value is None]
+        if feed_cache.enabled and missing:
+            values = await load_history_values(db, missing)
+        return [to_comment_history_type(h, *values.get(h.id, ())) for h in histories]
+    return to_nodes
+
+
+def users_query(columns):
+    return select(*columns)
+
+
+def group_comments_query(user: Principal, columns):
+    return select(*columns).where(models.Comment.group == user.group)
+
+
+def group_histories_query(user: Principal, columns):
+    return (
+        select(*columns)
+        .join(models.Comment, models.Comment.id == models.CommentHistory.comment_id)
+        .where(models.Comment.group == user.group)
     )
 
 
+USER_ORDER = (models.User.id,)
+COMMENT_ORDER = (models.Comment.created_at, models.Comment.id)
+HISTORY_ORDER = (models.CommentHistory.timestamp, models.CommentHistory.id)
+
+
 @strawberry.type
 class Query:
     @strawberry.field
-    def all_users(self, info) -> List[UserType]:
+    async def all_users(self, info: Info) -> List[UserType]:
         request: Request = info.context["request"]
-        db: Session = next(database.get_db())
-        user: UserModel = get_current_user(request,db)
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
         
-        users = db.query(models.User).all()
+        columns = projection(info, models.User)
+        users = (await db.execute(users_query(columns).order_by(*USER_ORDER))).all()
         return [to_user_type(u) for u in users]
 
     @strawberry.field
-    def user_by_id(self, info, user_id: int) -> Optional[UserType]:
+    async def users(self, info: Info, first: Optional[int] = None, after: Optional[str] = None) -> Connection[UserType]:
+        request: Request = info.context["request"]
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
+        columns = projection(info, models.User, "edges", "node")
+        return await paginate(db, users_query(columns), USER_ORDER, first, after, nodes_of(to_user_type))
+
+    @strawberry.field
+    async def user_by_id(self, info: Info, user_id: int) -> Optional[UserType]:
         request: Request = info.context["request"]
-        db: Session = next(database.get_db())
-        user: UserModel = get_current_user(request,db)
-        u = db.query(models.User).filter(models.User.id == user_id).first()
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
+        columns = projection(info, models.User)
+        u = (await db.execute(users_query(columns).where(models.User.id == user_id))).first()
         return to_user_type(u) if u else None
 
     @strawberry.field
-    def all_comments(self, info) -> List[CommentType]:
+    async def all_comments(self, info: Info) -> List[CommentType]:
+        request: Request = info.context["request"]
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
+
+        columns = projection(info, models.Comment)
+
+        async def load():
+            comments = (await db.execute(group_comments_query(user, columns).order_by(*COMMENT_ORDER))).all()
+            return [to_comment_type(c) for c in comments]
+
+        return await feed_cache.get_or_load(db, user.group, ("all_comments", projection_key(columns)), load)
+
+    @strawberry.field
+    async def comments(self, info: Info, first: Optional[int] = None, after: Optional[str] = None) -> Connection[CommentType]:
         request: Request = info.context["request"]
-        db: Session = next(database.get_db())
-        user: UserModel = get_current_user(request, db)
-        comments = (
-            db.query(models.Comment)
-            .join(models.User)
-            .filter(models.User.group == user.group)
-            .all()
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
+        columns = projection(info, models.Comment, "edges", "node")
+        return await paginate(
+            db, group_comments_query(user, columns), COMMENT_ORDER, first, after, nodes_of(to_comment_type),
+            cached=feed_cache.scope(db, user.group, "comments", projection_key(columns)),
         )
-        return [to_comment_type(c) for c in comments]
 
     @strawberry.field
-    def comment_by_id(self, info, comment_id: int) -> Optional[CommentType]:
+    async def search_comments(
+        self, info: Info, query: str, first: Optional[int] = None, after: Optional[str] = None
+    ) -> Connection[CommentType]:
         request: Request = info.context["request"]
-        db: Session = next(database.get_db())
-        user: UserModel = get_current_user(request, db)
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
 
-        comment = db.query(models.Comment).filter(models.Comment.id == comment_id).first()
-        if comment:
-            comment_user = db.query(models.User).filter(models.User.id == comment.user_id).first()
-            if comment_user and comment_user.group == user.group:
-                return to_comment_type(comment)
-        return None
+        columns = projection(info, models.Comment, "edges", "node")
+        stmt, order = search_comments_query(db.get_bind(models.Comment).dialect.name, user.group, query, columns)
+        return await paginate(db, stmt, order, first, after, nodes_of(to_comment_type))
 
     @strawberry.field
-    def all_comment_histories(self, info) -> List[CommentHistoryType]:
+    async def comment_by_id(self, info: Info, comment_id: int) -> Optional[CommentType]:
         request: Request = info.context["request"]
-        db: Session = next(database.get_db())
-        user: UserModel = get_current_user(request, db)
-        histories = (
-            db.query(models.CommentHistory)
-            .join(models.Comment)
-            .join(models.User, models.Comment.user_id == models.User.id)
-            .filter(models.User.group == user.group)
-            .all()
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
+
+        columns = projection(info, models.Comment)
+        comment = (await db.execute(
+            group_comments_query(user, columns)
+            .where(models.Comment.id == comment_id)
+        )).first()
+        return to_comment_type(comment) if comment else None
+
+    @strawberry.field
+    async def all_comment_histories(self, info: Info) -> List[CommentHistoryType]:
+        request: Request = info.context["request"]
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
+
+        # Archived rows are merged in by timestamp, so it is always loaded.
+        columns = columns_for(models.CommentHistory, {"timestamp", *selected_fields(info)})
+
+        async def load():
+            histories = (await db.execute(group_histories_query(user, columns).order_by(*HISTORY_ORDER))).all()
+            archived = await load_archived(db, models.Comment.group == user.group)
+            histories = merge_archived(histories, archived, key=lambda h: (h.timestamp or datetime.min, h.id))
+            return await history_nodes(db)(histories)
+
+        return await feed_cache.get_or_load(db, user.group, ("all_comment_histories", projection_key(columns)), load)
+
+    @strawberry.field
+    async def comment_histories(self, info: Info, first: Optional[int] = None, after: Optional[str] = None) -> Connection[CommentHistoryType]:
+        request: Request = info.context["request"]
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
+        columns = projection(info, models.CommentHistory, "edges", "node")
+
+        async def archived(start, limit):
+            rows = await load_cold_page(db, user.group, start, limit)
+            return [((row.timestamp or datetime.min, row.id), row) for row in rows]
+
+        return await paginate(
+            db, group_histories_query(user, columns), HISTORY_ORDER, first, after, history_nodes(db),
+            cached=feed_cache.scope(db, user.group, "comment_histories", projection_key(columns)),
+            extra=archived,
+            extra_count=lambda: count_archived(db, models.Comment.group == user.group),
         )
-        return [to_comment_history_type(h) for h in histories]
 
     @strawberry.field
-    def comment_history_by_id(self, info, history_id: int) -> Optional[CommentHistoryType]:
+    async def comment_history_by_id(self, info: Info, history_id: int) -> Optional[CommentHistoryType]:
         request: Request = info.context["request"]
-        db: Session = next(database.get_db())
-        user: UserModel = get_current_user(request, db)
-        history = db.query(models.CommentHistory).filter(models.CommentHistory.id == history_id).first()
-        if history:
-            comment = db.query(models.Comment).filter(models.Comment.id == history.comment_id).first()
-            comment_user = db.query(models.User).filter(models.User.id == comment.user_id).first()
-            if comment_user and comment_user.group == user.group:
-                return to_comment_history_type(history)
-        return None
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
+        columns = projection(info, models.CommentHistory)
+        history = (await db.execute(
+            group_histories_query(user, columns)
+            .where(models.CommentHistory.id == history_id)
+        )).first()
+        if history is None:
+            history = await find_archived(db, user.group, history_id)
+        return to_comment_history_type(history) if history else None
+
+    @strawberry.field
+    async def group_stats(self, info: Info) -> GroupStatsType:
+        request: Request = info.context["request"]
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
+        stats = (await db.execute(
+            select(models.GroupStats.comment_count, models.GroupStats.edit_count)
+            .where(models.GroupStats.group == user.group)
+        )).first()
+        return GroupStatsType(
+            group=user.group,
+            comment_count=stats.comment_count if stats else 0,
+            edit_count=stats.edit_count if stats else 0,
+        )
 
 
 @strawberry.type
 class Mutation:
     # user
     @strawberry.mutation
-    def create_user(self, info, username: str, password: str, group: str) -> UserType:
-        db: Session = next(database.get_db())
-        hashed_password = utils.security.hash_password(password)
+    async def create_user(self, info: Info, username: str, password: str, group: str) -> UserType:
+        db: AsyncSession = info.context["db"]
+        hashed_password = await utils.security.hash_password_async(password)
         db_user = models.User(username=username, group=group, hashed_password=hashed_password)
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         return to_user_type(db_user)
 
     @strawberry.mutation
-    def update_user(self, info, username: Optional[str] = None, group: Optional[str] = None) -> Optional[UserType]:
+    async def update_user(self, info: Info, username: Optional[str] = None, group: Optional[str] = None) -> Optional[UserType]:
         request: Request = info.context["request"]
-        db: Session = next(database.get_db())
-        user: UserModel = get_current_user(request, db)
+        db: AsyncSession = info.context["db"]
+        principal: Principal = await get_current_user_async(request, db)
+        user = await db.get(models.User, principal.id)
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
 
+        old_group = user.group
         if username:
             user.username = username
-        if group:
+        if group and group != user.group:
             user.group = group
-
-        db.commit()
-        db.refresh(user)
+            # Commits db too; the comments may have to change shards.
+            await move_user_comments(db, user.id, old_group, group)
+        else:
+            await db.commit()
+        await db.refresh(user)
+        await invalidate_principal(user.id)
+        if user.group != old_group:
+            await feed_cache.invalidate(old_group, user.group)
         return to_user_type(user)
 
     @strawberry.mutation
-    def delete_user(self, info) -> bool:
+    async def delete_user(self, info: Info) -> bool:
         request: Request = info.context["request"]
-        db: Session = next(database.get_db())
-        user: UserModel = get_current_user(request, db)
-
-        db.delete(user)
-        db.commit()
+        db: AsyncSession = info.context["db"]
+        principal: Principal = await get_current_user_async(request, db)
+        user = await db.get(models.User, principal.id)
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+
+        # Their comments go first: comments.user_id can't be left dangling.
+        user_comment_ids = select(models.Comment.id).where(models.Comment.user_id == user.id)
+        await db.execute(delete(models.CommentHistory).where(models.CommentHistory.comment_id.in_(user_comment_ids)))
+        await db.execute(delete(models.CommentArchive).where(models.CommentArchive.comment_id.in_(user_comment_ids)))
+        comment_ids = (await db.scalars(
+            delete(models.Comment).where(models.Comment.user_id == user.id).returning(models.Comment.id)
+        )).all()
+        await remove_user_counts(db, user.id)
+        await db.delete(user)
+        await db.commit()
+        await invalidate_principal(principal.id)
+        await feed_cache.invalidate(principal.group)
+        await publish_comments(principal.group, "deleted", [{"id": comment_id} for comment_id in comment_ids])
         return True
 
     # comments
     @strawberry.mutation
-    def create_comment(self, info, content: str) -> CommentType:
+    async def create_comment(self, info: Info, content: str) -> CommentType:
         request: Request = info.context["request"]
-        db: Session = next(database.get_db())
-        user: UserModel = get_current_user(request, db)
-
-        db_comment = models.Comment(user_id=user.id, content=content)
-        db.add(db_comment)
-        db.commit()
-        db.refresh(db_comment)
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
+
+        if write_coalescer.enabled:
+            # Don't hold a pooled connection while the batch fills.
+            await db.close()
+            db_comment = await write_coalescer.submit(CreateComment(user_id=user.id, group=user.group, content=content))
+        else:
+            db_comment = models.Comment(user_id=user.id, group=user.group, content=content)
+            db.add(db_comment)
+            await add_counts(db, [(user.id, user.group, 1, 0)])
+            await db.commit()
+            await db.refresh(db_comment)
+        await feed_cache.invalidate(user.group)
+        await publish_comments(user.group, "added", [comment_message(db_comment)])
         return to_comment_type(db_comment)
 
     @strawberry.mutation
-    def update_comment(self, info, comment_id: int, new_content: str) -> CommentType:
+    async def update_comment(self, info: Info, comment_id: int, new_content: str) -> CommentType:
         request: Request = info.context["request"]
-        db: Session = next(database.get_db())
-        user: UserModel = get_current_user(request, db)
-
-        comment = db.query(models.Comment).filter(models.Comment.id == comment_id).first()
-        if not comment or comment.user_id != user.id:
-            raise Exception("Unauthorized to update this comment")
-
-        old_value = comment.content
-        comment.content = new_content
-
-        db_history = models.CommentHistory(
-            comment_id=comment.id,
-            timestamp=datetime.utcnow(),
-            old_value=old_value,
-            new_value=new_content,
-        )
-        db.add(db_history)
-        db.commit()
-        db.refresh(comment)
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
+
+        if write_coalescer.enabled:
+            await db.close()
+            comment = await write_coalescer.submit(
+                UpdateComment(user_id=user.id, group=user.group, comment_id=comment_id, new_content=new_content)
+            )
+        else:
+            comment = (await load_for_edit(db, [comment_id])).get(comment_id)
+            if not comment or comment.user_id != user.id:
+                raise Exception("Unauthorized to update this comment")
+
+            now = datetime.utcnow()
+            old_value = comment.content
+            comment.content = new_content
+            comment.updated_at = now
+
+            db_history = await build_history(db, comment.id, old_value, new_content, now)
+            db.add(db_history)
+            await add_counts(db, [(user.id, user.group, 0, 1)])
+            await db.commit()
+            await db.refresh(comment)
+        await feed_cache.invalidate(user.group)
+        await publish_comments(user.group, "updated", [comment_message(comment)])
         return to_comment_type(comment)
 
     @strawberry.mutation
-    def delete_comment(self, info, comment_id: int) -> bool:
+    async def delete_comment(self, info: Info, comment_id: int) -> bool:
         request: Request = info.context["request"]
-        db: Session = next(database.get_db())
-        user: UserModel = get_current_user(request, db)
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
 
-        comment = db.query(models.Comment).filter(models.Comment.id == comment_id).first()
+        comment = await db.get(models.Comment, comment_id)
         if not comment or comment.user_id != user.id:
             raise Exception("Unauthorized to delete this comment")
-        db.delete(comment)
-        db.commit()
+        edits = await count_edits(db, [comment_id])
+        await add_counts(db, [(user.id, user.group, -1, -edits)])
+        await db.execute(delete(models.CommentArchive).where(models.CommentArchive.comment_id == comment_id))
+        await db.delete(comment)
+        await db.commit()
+        await feed_cache.invalidate(user.group)
+        await publish_comments(user.group, "deleted", [{"id": comment_id}])
         return True
 
+    # bulk comments: authorize once, one transaction, executemany writes
+    @strawberry.mutation
+    async def create_comments(self, info: Info, contents: List[str]) -> List[CommentType]:
+        request: Request = info.context["request"]
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
+        if not contents:
+            return []
+
+        now = datetime.utcnow()
+        comments = (await db.scalars(
+            insert(models.Comment).returning(models.Comment),
+            [{"user_id": user.id, "group": user.group, "content": content, "created_at": now} for content in contents],
+        )).all()
+        await add_counts(db, [(user.id, user.group, len(comments), 0)])
+        await db.commit()
+        await feed_cache.invalidate(user.group)
+        # Ids are assigned in VALUES order, so sorting restores input order
+        # without forcing per-row inserts on backends lacking sentinel support.
+        comments = sorted(comments, key=lambda c: c.id)
+        await publish_comments(user.group, "added", [comment_message(c) for c in comments])
+        return [to_comment_type(c) for c in comments]
+
+    @strawberry.mutation
+    async def update_comments(self, info: Info, edits: List[CommentEditInput]) -> List[CommentType]:
+        request: Request = info.context["request"]
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
+        if not edits:
+            return []
+
+        comment_ids = {edit.comment_id for edit in edits}
+        comments = await load_for_edit(db, comment_ids)
+        if len(comments) != len(comment_ids) or any(c.user_id != user.id for c in comments.values()):
+            raise Exception("Unauthorized to update these comments")
+
+        now = datetime.utcnow()
+        history_edits = []
+        for edit in edits:
+            comment = comments[edit.comment_id]
+            history_edits.append((comment.id, comment.content, edit.new_content))
+            comment.content = edit.new_content
+            comment.updated_at = now
+
+        await db.execute(insert(models.CommentHistory), await build_histories(db, history_edits, now))
+        await add_counts(db, [(user.id, user.group, 0, len(history_edits))])
+        await db.commit()
+        await feed_cache.invalidate(user.group)
+        await publish_comments(user.group, "updated", [comment_message(comments[edit.comment_id]) for edit in edits])
+        return [to_comment_type(comments[edit.comment_id]) for edit in edits]
 
-schema = strawberry.Schema(query=Query, mutation=Mutation)
-graphql_app = GraphQLRouter(schema)
\ No newline at end of file
+    @strawberry.mutation
+    async def delete_comments(self, info: Info, comment_ids: List[int]) -> bool:
+        request: Request = info.context["request"]
+        db: AsyncSession = info.context["db"]
+        user: Principal = await get_current_user_async(request, db)
+        if not comment_ids:
+            return True
+
+        owners = (await db.scalars(
+            select(models.Comment.user_id).where(models.Comment.id.in_(comment_ids))
+        )).all()
+        if len(owners) != len(set(comment_ids)) or any(owner != user.id for owner in owners):
+            raise Exception("Unauthorized to delete these comments")
+
+        edits = await count_edits(db, comment_ids)
+        await add_counts(db, [(user.id, user.group, -len(owners), -edits)])
+        await db.execute(delete(models.CommentHistory).where(models.CommentHistory.comment_id.in_(comment_ids)))
+        await db.execute(delete(models.CommentArchive).where(models.CommentArchive.comment_id.in_(comment_ids)))
+        await db.execute(delete(models.Comment).where(models.Comment.id.in_(comment_ids)))
+        await db.commit()
+        await feed_cache.invalidate(user.group)
+        await publish_comments(user.group, "deleted", [{"id": comment_id} for comment_id in set(comment_ids)])
+        return True
+
+
+@strawberry.type
+class Subscription:
+    @strawberry.subscription
+    async def comment_added(self, info: Info) -> AsyncGenerator[CommentType, None]:
+        async for message in group_events(info, "added"):
+            yield CommentType(**message)
+
+    @strawberry.subscription
+    async def comment_updated(self, info: Info) -> AsyncGenerator[CommentType, None]:
+        async for message in group_events(info, "updated"):
+            yield CommentType(**message)
+
+    @strawberry.subscription
+    async def comment_deleted(self, info: Info) -> AsyncGenerator[int, None]:
+        async for message in group_events(info, "deleted"):
+            yield message["id"]
+
+
+async def count_users(context: dict) -> Optional[int]:
+    try:
+        await context_viewer(context)
+    except HTTPException:
+        return None  # The resolver reports it.
+    return await context["db"].scalar(select(func.count()).select_from(models.User))
+
+
+def count_group(column):
+    async def count(context: dict) -> Optional[int]:
+        try:
+            user = await context_viewer(context)
+        except HTTPException:
+            return None
+        return await context["db"].scalar(select(column).where(models.GroupStats.group == user.group)) or 0
+    return count
+
+
+# The unpaginated root lists are charged by their length: the group's
+# counters hold it for comments and histories (archived ones included).
+ROOT_LIST_COUNTS = {
+    "Query.allUsers": count_users,
+    "Query.allComments": count_group(models.GroupStats.comment_count),
+    "Query.allCommentHistories": count_group(models.GroupStats.edit_count),
+}
+
+extensions = [
+    lambda: ResolverMetrics(in_response=METRICS_IN_RESPONSE),
+    lambda: ParserCache(maxsize=DOCUMENT_CACHE_SIZE),
+    lambda: ValidationCache(maxsize=DOCUMENT_CACHE_SIZE),
+    lambda: QueryCost(list_counts=ROOT_LIST_COUNTS),
+]
+if PERSISTED_QUERIES != "off":
+    extensions.insert(0, PersistedQueries)
+if replica_engines:
+    extensions.append(ReplicaRouting)
+
+schema = strawberry.Schema(query=Query, mutation=Mutation, subscription=Subscription, extensions=extensions)
+graphql_app = GraphQLRouter(schema, context_getter=get_context)
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""Move old comment history rows from the database into segment files.
+
+    python -m app.jobs.archive_histories
+    python -m app.jobs.archive_histories --older-than 30 --vacuum
+
+For every comment with history rows older than the cutoff, its rows up to
+the newest such one are written to a new segment of its shard's archive
+and deleted from comment_histories, in batches of HISTORY_SEGMENT_COMMENTS
+comments: one segment and one transaction each. Queries keep returning the
+archived rows; see app.utils.history_archive. --vacuum afterwards returns
+the freed space (SQLite rewrites the whole database file).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Dict
+
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app import models
+from app.config import HISTORY_ARCHIVE_AFTER_DAYS, HISTORY_SEGMENT_COMMENTS
+from app.database import AsyncSessionLocal, async_engines, shard_map
+from app.utils.counters import UPSERT_DIALECTS
+from app.utils.history import replay
+from app.utils.history_archive import ArchivedHistory, HistoryArchive, history_archives, write_segment
+
+logger = logging.getLogger("bloggu.archive_histories")
+
+
+async def archive_batch(db: AsyncSession, archive: HistoryArchive, bounds: Dict[int, int]) -> int:
+    """Archive each comment's rows up to bounds[comment_id] in db's
+    transaction, and commit. Returns how many rows moved."""
+    history = models.CommentHistory
+    # Locks the comments on Postgres, so they can't be edited or deleted
+    # meanwhile; on SQLite a concurrent write makes the commit fail instead.
+    groups = dict((await db.execute(
+        select(models.Comment.id, models.Comment.group).where(models.Comment.id.in_(bounds)).with_for_update()
+    )).all())
+    comment_ids = list(groups)
+    rows = (await db.scalars(
+        select(history).where(history.comment_id.in_(comment_ids)).order_by(history.comment_id, history.id)
+    )).all()
+
+    chains: Dict[int, list] = {}
+    for row in rows:
+        chains.setdefault(row.comment_id, []).append(row)
+    cold, snapshots = {}, []
+    for comment_id, chain in chains.items():
+        # Replays from the first row, which is a snapshot: the table's rows
+        # of a comment always start with one (see below).
+        values = replay(chain)
+        old = [row for row in chain if row.id <= bounds[comment_id]]
+        cold[comment_id] = [ArchivedHistory(row.id, comment_id, row.timestamp, *values[row.id]) for row in old]
+        # The first row left behind starts the chain from now on.
+        if len(old) < len(chain) and chain[len(old)].old_value is None:
+            snapshots.append({"id": chain[len(old)].id, "old_value": values[old[-1].id][1]})
+    cold = {comment_id: rows for comment_id, rows in cold.items() if rows}
+    if not cold:
+        await db.rollback()
+        return 0
+
+    path = archive.new_segment_path()
+    write_segment(path, cold, groups)
+    try:
+        table = history.__table__
+        await db.execute(
+            delete(table).where(table.c.comment_id == bindparam("comment"), table.c.id <= bindparam("bound")),
+            [{"comment": comment_id, "bound": bounds[comment_id]} for comment_id in cold],
+        )
+        if snapshots:
+            await db.execute(update(history), snapshots)
+        insert = UPSERT_DIALECTS[db.get_bind(models.CommentArchive).dialect.name](models.CommentArchive)
+        await db.execute(
+            insert.on_conflict_do_update(
+                index_elements=["comment_id"],
+                set_={"edit_count": models.CommentArchive.edit_count + insert.excluded.edit_count},
+            ),
+            [
+                {"comment_id": comment_id, "first_id": rows[0].id, "edit_count": len(rows)}
+                for comment_id, rows in sorted(cold.items())
+            ],
+        )
+        await db.commit()
+    except BaseException:
+        os.remove(path)
+        raise
+    return sum(len(rows) for rows in cold.values())
+
+
+async def archive_shard(name: str, engine: AsyncEngine, cutoff: datetime) -> int:
+    history = models.CommentHistory
+    async with AsyncSessionLocal(bind=engine) as db:
+        bounds = dict((await db.execute(
+            select(history.comment_id, func.max(history.id))
+            .where(history.timestamp < cutoff)
+            .group_by(history.comment_id)
+            .order_by(history.comment_id)
+        )).all())
+    comment_ids = list(bounds)
+    archived = 0
+    for start in range(0, len(comment_ids), HISTORY_SEGMENT_COMMENTS):
+        batch = {comment_id: bounds[comment_id] for comment_id in comment_ids[start:start + HISTORY_SEGMENT_COMMENTS]}
+        async with AsyncSessionLocal(bind=engine) as db:
+            archived += await archive_batch(db, history_archives[name], batch)
+    logger.info("Shard %s: archived %d history rows of %d comments", name, archived, len(comment_ids))
+    return archived
+
+
+async def vacuum(engine: AsyncEngine) -> None:
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.exec_driver_sql("VACUUM" if conn.dialect.name == "sqlite" else "VACUUM comment_histories")
+
+
+async def archive(older_than_days: float, vacuum_after: bool = False) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    archived = 0
+    for name, engine in shard_map.engines.items():
+        archived += await archive_shard(name, engine, cutoff)
+        if vacuum_after:
+            await vacuum(engine)
+    for engine in async_engines:
+        await engine.dispose()
+    return archived
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.jobs.archive_histories", description=__doc__.split("\n")[0])
+    parser.add_argument("--older-than", type=float, default=HISTORY_ARCHIVE_AFTER_DAYS, metavar="DAYS",
+                        help=f"archive rows older than this (default {HISTORY_ARCHIVE_AFTER_DAYS:g})")
+    parser.add_argument("--vacuum", action="store_true", help="vacuum each database afterwards")
+    args = parser.parse_args(argv)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    asyncio.run(archive(args.older_than, args.vacuum))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
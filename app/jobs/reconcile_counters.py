@@ -0,0 +1,53 @@
+"""Rebuild the comment and edit counters from the comment tables.
+
+    python -m app.jobs.reconcile_counters
+    python -m app.jobs.reconcile_counters --check
+
+Runs once over the primary and every shard, one transaction each, and
+reports how many user and group counters had drifted. With --check nothing
+is changed, and the exit status is 1 if any had. Writers wait while a
+database is being rebuilt, so schedule it off-peak.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+
+from app.database import AsyncSessionLocal, async_engines, shard_map
+from app.utils.counters import rebuild_counts
+
+logger = logging.getLogger("bloggu.reconcile_counters")
+
+
+async def reconcile(check: bool = False) -> int:
+    """Counters found wrong, over all databases holding comments."""
+    drifted = 0
+    for name, engine in shard_map.engines.items():
+        async with AsyncSessionLocal(bind=engine) as db:
+            changed = await rebuild_counts(db)
+            if check:
+                await db.rollback()
+            else:
+                await db.commit()
+        logger.info("Shard %s: %d user and %d group counters %s", name, changed["users"], changed["groups"],
+                    "wrong" if check else "fixed")
+        drifted += changed["users"] + changed["groups"]
+    for engine in async_engines:
+        await engine.dispose()
+    return drifted
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.jobs.reconcile_counters", description=__doc__.split("\n")[0])
+    parser.add_argument("--check", action="store_true", help="only report drift; exit with 1 if there is any")
+    args = parser.parse_args(argv)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    drifted = asyncio.run(reconcile(args.check))
+    return 1 if args.check and drifted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+import logging
+import re
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from inspect import isawaitable
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from strawberry.extensions import SchemaExtension
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames, self.buckets = name, help, labelnames, buckets
+        # labels -> [count per bucket (last is +Inf), sum]
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Registry:
+    """Process-local metrics in Prometheus text format. Values kept elsewhere
+    come from collectors: callables returning (name, type, help, value)
+    tuples, read at scrape time."""
+
+    def __init__(self):
+        self.metrics: List = []
+        self.collectors: List[Callable[[], Iterable[Tuple[str, str, str, float]]]] = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        self.metrics.append(Counter(*args, **kwargs))
+        return self.metrics[-1]
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        self.metrics.append(Histogram(*args, **kwargs))
+        return self.metrics[-1]
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for name, kind, help, value in collector():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_duration = registry.histogram(
+    "bloggu_http_request_duration_seconds", "HTTP request latency.", ("route", "method", "status"))
+sql_duration = registry.histogram("bloggu_sql_statement_duration_seconds", "SQL statement latency.")
+sql_per_request = registry.histogram(
+    "bloggu_sql_statements_per_request", "SQL statements issued per HTTP request.", ("route",), COUNT_BUCKETS)
+sql_repeated = registry.counter(
+    "bloggu_sql_repeated_statements_total",
+    "Requests that ran one statement at least N_PLUS_ONE_THRESHOLD times (likely N+1).", ("route",))
+pool_wait = registry.histogram("bloggu_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.")
+resolver_duration = registry.histogram(
+    "bloggu_graphql_resolver_duration_seconds", "GraphQL resolver latency.", ("field",))
+
+
+@dataclass
+class RequestMetrics:
+    """Counters for the request being served, found through a context variable
+    so engine events (which know nothing about requests) can reach them."""
+
+    started: float = field(default_factory=time.perf_counter)
+    statements: int = 0
+    sql_seconds: float = 0.0
+    pool_wait_seconds: float = 0.0
+    by_statement: Dict[str, int] = field(default_factory=dict)
+
+
+current_request: ContextVar[Optional[RequestMetrics]] = ContextVar("current_request", default=None)
+
+# IN lists expand to one placeholder per value; collapse them so the same
+# query with different batch sizes counts as one statement.
+_IN_LIST = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|\$\d+|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|\$\d+|:\w+)\s*\)")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append((context, time.perf_counter()))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()[1]
+    sql_duration.observe(elapsed)
+    request = current_request.get()
+    if request is not None:
+        request.statements += 1
+        request.sql_seconds += elapsed
+        key = _IN_LIST.sub("(?)", statement)
+        request.by_statement[key] = request.by_statement.get(key, 0) + 1
+
+
+def _handle_error(exception_context):
+    # A statement that raised never reaches after_cursor_execute; drop its
+    # start time so the connection's stack doesn't grow with every error.
+    conn = exception_context.connection
+    started = conn.info.get("query_started") if conn is not None else None
+    if started and started[-1][0] is exception_context.execution_context:
+        started.pop()
+
+
+def instrument_engine(engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Records how long each checkout waited for a free connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - started
+            pool_wait.observe(elapsed)
+            request = current_request.get()
+            if request is not None:
+                request.pool_wait_seconds += elapsed
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request and the SQL it runs, and
+    logging statements repeated often enough to suggest an N+1 pattern."""
+
+    def __init__(self, app, threshold: int = 10):
+        self.app = app
+        self.threshold = threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request = RequestMetrics()
+        token = current_request.set(request)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_request.reset(token)
+            # Routes of included routers can have an empty relative path
+            # (GraphQLRouter's); those match exactly one URL.
+            route = scope.get("route")
+            route = (route.path or scope["path"]) if route is not None else "unmatched"
+            http_duration.observe(time.perf_counter() - request.started, route, scope["method"], str(status[0]))
+            sql_per_request.observe(request.statements, route)
+            repeated = {sql: n for sql, n in request.by_statement.items() if n >= self.threshold}
+            if repeated:
+                sql_repeated.inc(1, route)
+                for sql, n in repeated.items():
+                    logger.warning(
+                        "Possible N+1 on %s %s: statement ran %d times: %s", scope["method"], route, n, " ".join(sql.split())
+                    )
+
+
+class ResolverMetrics(SchemaExtension):
+    """Times every field with its own resolver; plain attribute fields are
+    skipped to keep the overhead per field negligible. With in_response the
+    request's SQL figures are added to the response extensions."""
+
+    _custom: Dict[Tuple[str, str], bool] = {}
+
+    def __init__(self, in_response: bool = False):
+        self.in_response = in_response
+
+    def resolve(self, _next, root, info, *args, **kwargs):
+        key = (info.parent_type.name, info.field_name)
+        timed = self._custom.get(key)
+        if timed is None:
+            field = info.parent_type.fields.get(info.field_name)
+            definition = field.extensions.get("strawberry-definition") if field else None
+            timed = self._custom[key] = getattr(definition, "base_resolver", None) is not None
+        if not timed:
+            return _next(root, info, *args, **kwargs)
+
+        started = time.perf_counter()
+        result = _next(root, info, *args, **kwargs)
+        if isawaitable(result):
+            return self._await(result, key, started)
+        resolver_duration.observe(time.perf_counter() - started, ".".join(key))
+        return result
+
+    async def _await(self, result, key, started):
+        try:
+            return await result
+        finally:
+            resolver_duration.observe(time.perf_counter() - started, ".".join(key))
+
+    def get_results(self):
+        request = current_request.get()
+        if not self.in_response or request is None:
+            return {}
+        return {"metrics": {
+            "sqlStatements": request.statements,
+            "sqlMs": round(request.sql_seconds * 1000, 3),
+            "poolWaitMs": round(request.pool_wait_seconds * 1000, 3),
+            "elapsedMs": round((time.perf_counter() - request.started) * 1000, 3),
+        }}
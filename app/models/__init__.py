@@ -1,3 +1,6 @@
 from .user import User
 from .comment import Comment
 from .comment_history import CommentHistory
+from .user_stats import UserStats
+from .group_stats import GroupStats
+from .comment_archive import CommentArchive
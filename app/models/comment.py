@@ -1,18 +1,52 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, ForeignKey, Integer, Text, DateTime
+from sqlalchemy import DDL, Column, ForeignKey, Index, Integer, String, Text, DateTime, event
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        Index("ix_comments_group_created_at_id", "group", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    # Copy of the author's users.group so group feeds don't need a join.
+    group = Column(String, nullable=False)
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, nullable=True)
 
     user = relationship("User", back_populates="comments")
-    histories = relationship("CommentHistory", back_populates="comment")
+    histories = relationship("CommentHistory", back_populates="comment", cascade="all, delete-orphan")
+
+
+# Full-text search index over content, maintained by the database itself so
+# every write path (ORM, bulk statements, raw SQL) keeps it in sync. Postgres
+# uses a generated tsvector column with a GIN index; SQLite an external-content
+# FTS5 table fed by triggers. Neither is mapped: see app.utils.search.
+SEARCH_DDL = {
+    "postgresql": [
+        "ALTER TABLE comments ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', content)) STORED",
+        "CREATE INDEX ix_comments_search_vector ON comments USING gin (search_vector)",
+    ],
+    "sqlite": [
+        "CREATE VIRTUAL TABLE comments_fts USING fts5("
+        "content, content='comments', content_rowid='id', tokenize='porter unicode61')",
+        "CREATE TRIGGER comments_fts_insert AFTER INSERT ON comments BEGIN "
+        "INSERT INTO comments_fts(rowid, content) VALUES (new.id, new.content); END",
+        "CREATE TRIGGER comments_fts_delete AFTER DELETE ON comments BEGIN "
+        "INSERT INTO comments_fts(comments_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+        "CREATE TRIGGER comments_fts_update AFTER UPDATE OF content ON comments BEGIN "
+        "INSERT INTO comments_fts(comments_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        "INSERT INTO comments_fts(rowid, content) VALUES (new.id, new.content); END",
+    ],
+}
+
+for dialect, statements in SEARCH_DDL.items():
+    for statement in statements:
+        event.listen(Comment.__table__, "after_create", DDL(statement).execute_if(dialect=dialect))
+event.listen(Comment.__table__, "before_drop", DDL("DROP TABLE IF EXISTS comments_fts").execute_if(dialect="sqlite"))
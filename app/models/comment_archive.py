@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer
+from app.database import Base
+
+class CommentArchive(Base):
+    """Marks a comment whose oldest history rows were moved to segment files;
+    see app.utils.history_archive. Reads only look in the archive for comments
+    with a row here, and deleting the comment deletes its row."""
+
+    __tablename__ = "comment_archives"
+
+    comment_id = Column(Integer, primary_key=True)
+    # Lowest archived history id. Segments may still hold rows of a deleted
+    # comment whose id was reused; those are older and skipped.
+    first_id = Column(Integer, nullable=False)
+    edit_count = Column(Integer, nullable=False, default=0)
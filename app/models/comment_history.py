@@ -1,17 +1,24 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, ForeignKey, DateTime, Integer, Text
+from sqlalchemy import Column, ForeignKey, DateTime, Index, Integer, Text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 class CommentHistory(Base):
     __tablename__ = "comment_histories"
+    __table_args__ = (
+        Index("ix_comment_histories_timestamp_id", "timestamp", "id"),
+        # Never hand out an id again, even once its row was archived.
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    comment_id = Column(Integer, ForeignKey("comments.id"), nullable=False)
+    comment_id = Column(Integer, ForeignKey("comments.id"), nullable=False, index=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
-    old_value = Column(Text, nullable=False)
-    new_value = Column(Text, nullable=False)
+    # See app.utils.history for how full and delta rows use these columns.
+    old_value = Column(Text, nullable=True)
+    new_value = Column(Text, nullable=True)
+    delta = Column(Text, nullable=True)
 
     comment = relationship("Comment", back_populates="histories")
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String
+from app.database import Base
+
+class GroupStats(Base):
+    """Comments and edits of one group, the sum of its users' UserStats."""
+
+    __tablename__ = "group_stats"
+
+    group = Column(String, primary_key=True)
+    comment_count = Column(Integer, nullable=False, default=0)
+    edit_count = Column(Integer, nullable=False, default=0)
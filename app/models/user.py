@@ -7,7 +7,7 @@ class User(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True, nullable=False)
-    group = Column(String, nullable=False)
+    group = Column(String, nullable=False, index=True)
     hashed_password = Column(String, nullable=False)
 
     comments = relationship("Comment", back_populates="user")
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String
+from app.database import Base
+
+class UserStats(Base):
+    """Comments and edits (history rows) of one user, kept by every write
+    path in the same transaction; see app.utils.counters. Lives next to the
+    comments, so on the user's group shard."""
+
+    __tablename__ = "user_stats"
+
+    # No foreign key: with sharding, users are in another database.
+    user_id = Column(Integer, primary_key=True)
+    group = Column(String, nullable=False, index=True)
+    comment_count = Column(Integer, nullable=False, default=0)
+    edit_count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Set
+
+from app.config import (
+    PUBSUB_BACKEND,
+    PUBSUB_RECONNECT_ATTEMPTS,
+    PUBSUB_URL,
+    SUBSCRIPTION_QUEUE_SIZE,
+    SUBSCRIPTION_SLOW_CONSUMER,
+)
+
+logger = logging.getLogger(__name__)
+
+_CLOSED = object()
+
+
+class MemoryBackend:
+    """Delivers straight to this process's subscribers."""
+
+    def start(self, deliver: Callable[[str, dict], None], close: Callable[[str], None]) -> None:
+        self._deliver = deliver
+
+    async def publish(self, channel: str, message: dict) -> None:
+        self._deliver(channel, message)
+
+    async def subscribe(self, channel: str) -> None:
+        pass
+
+    async def unsubscribe(self, channel: str) -> None:
+        pass
+
+
+class RedisBackend:
+    """Relays messages through Redis so subscribers on every worker see
+    events published by any of them. One connection per process listens to
+    the channels that have local subscribers.
+
+    When that connection fails, the reader reconnects and resubscribes with
+    exponential backoff, up to `reconnect_attempts` times in a row; then it
+    ends every local subscription. Events published meanwhile are lost."""
+
+    def __init__(self, url: str = PUBSUB_URL, reconnect_attempts: int = PUBSUB_RECONNECT_ATTEMPTS):
+        try:
+            import redis.asyncio as redis
+            from redis.exceptions import RedisError
+        except ImportError:
+            raise Exception("PUBSUB_BACKEND=redis requires the 'redis' package")
+        self._client = redis.from_url(url)
+        self._pubsub = self._client.pubsub()
+        self._errors = (RedisError, OSError)
+        self._channels: Set[str] = set()
+        self._reader = None
+        self.reconnect_attempts = reconnect_attempts
+
+    def start(self, deliver: Callable[[str, dict], None], close: Callable[[str], None]) -> None:
+        self._deliver = deliver
+        self._close = close
+
+    async def publish(self, channel: str, message: dict) -> None:
+        await self._client.publish(channel, json.dumps(message))
+
+    async def subscribe(self, channel: str) -> None:
+        await self._pubsub.subscribe(channel)
+        self._channels.add(channel)
+        if self._reader is None:
+            self._reader = asyncio.ensure_future(self._read())
+
+    async def unsubscribe(self, channel: str) -> None:
+        self._channels.discard(channel)
+        try:
+            await self._pubsub.unsubscribe(channel)
+        except self._errors:
+            # The reader resubscribes from _channels when it reconnects.
+            pass
+
+    async def _reconnect(self) -> None:
+        old, self._pubsub = self._pubsub, self._client.pubsub()
+        try:
+            await old.aclose()
+        except self._errors:
+            pass
+        if self._channels:
+            await self._pubsub.subscribe(*self._channels)
+
+    async def _read(self) -> None:
+        failures = 0
+        while True:
+            try:
+                if failures:
+                    await self._reconnect()
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except self._errors as e:
+                failures += 1
+                if failures > self.reconnect_attempts:
+                    logger.error("Redis pub/sub connection lost, ending local subscriptions: %s", e)
+                    self._reader = None
+                    self._close("Subscription closed: lost the connection to the event broker")
+                    return
+                delay = min(0.1 * 2 ** (failures - 1), 10.0)
+                logger.warning("Redis pub/sub read failed, reconnecting in %.1fs: %s", delay, e)
+                await asyncio.sleep(delay)
+                continue
+            failures = 0
+            if message is not None:
+                self._deliver(message["channel"].decode(), json.loads(message["data"]))
+
+
+class Subscriber:
+    """One consumer's bounded queue of messages."""
+
+    def __init__(self, maxsize: int, policy: str):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        self.reason = None
+
+    def put(self, message: dict) -> None:
+        """Queue a message without waiting, applying the slow-consumer policy
+        when the queue is full."""
+        if self.closed:
+            return
+        if self.queue.full():
+            if self.policy == "disconnect":
+                self.close("Subscription closed: the client is not keeping up with events")
+                return
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    def close(self, reason: str) -> None:
+        """End the subscription: the consumer gets `reason` as an error next."""
+        if self.closed:
+            return
+        self.closed = True
+        self.reason = reason
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(_CLOSED)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        message = await self.queue.get()
+        if message is _CLOSED:
+            raise Exception(self.reason)
+        return message
+
+
+class PubSub:
+    """Fans published messages out to every local subscriber of a channel.
+
+    Publishing never waits on subscribers: each one has its own bounded queue,
+    and a subscriber that falls behind loses messages (or its subscription)
+    rather than growing memory or slowing down the publisher.
+    """
+
+    def __init__(self, backend, queue_size: int = SUBSCRIPTION_QUEUE_SIZE, policy: str = SUBSCRIPTION_SLOW_CONSUMER):
+        if policy not in ("drop_oldest", "disconnect"):
+            raise Exception(f"Unknown SUBSCRIPTION_SLOW_CONSUMER '{policy}'")
+        self.backend = backend
+        self.queue_size = queue_size
+        self.policy = policy
+        self._channels: Dict[str, Set[Subscriber]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.disconnected = 0
+        backend.start(self._deliver, self._close_all)
+
+    async def publish(self, channel: str, message: dict) -> None:
+        self.published += 1
+        await self.backend.publish(channel, message)
+
+    def _deliver(self, channel: str, message: dict) -> None:
+        for subscriber in self._channels.get(channel, ()):
+            if subscriber.closed:
+                continue
+            dropped = subscriber.dropped
+            subscriber.put(message)
+            if subscriber.closed:
+                self.disconnected += 1
+            else:
+                self.delivered += 1
+                self.dropped += subscriber.dropped - dropped
+
+    def _close_all(self, reason: str) -> None:
+        for subscribers in self._channels.values():
+            for subscriber in subscribers:
+                if not subscriber.closed:
+                    subscriber.close(reason)
+                    self.disconnected += 1
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str) -> AsyncIterator[Subscriber]:
+        subscriber = Subscriber(self.queue_size, self.policy)
+        subscribers = self._channels.setdefault(channel, set())
+        subscribers.add(subscriber)
+        try:
+            if len(subscribers) == 1:
+                await self.backend.subscribe(channel)
+            yield subscriber
+        finally:
+            subscribers.discard(subscriber)
+            if not subscribers and self._channels.get(channel) is subscribers:
+                del self._channels[channel]
+                await self.backend.unsubscribe(channel)
+
+    def stats(self) -> dict:
+        return {
+            "channels": len(self._channels),
+            "subscribers": sum(len(s) for s in self._channels.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "disconnected": self.disconnected,
+        }
+
+
+def create_backend(name: str = PUBSUB_BACKEND):
+    if name == "memory":
+        return MemoryBackend()
+    if name == "redis":
+        return RedisBackend()
+    raise Exception(f"Unknown PUBSUB_BACKEND '{name}'")
+
+
+pubsub = PubSub(create_backend())
@@ -18,7 +18,10 @@ def get_comment(comment_id: int, db: Session = Depends(get_db)):
 
 @router.post("/newcomment", response_model=schemas.CommentOut, status_code=201)
 def create_comment(comment: schemas.CommentCreate, db: Session = Depends(get_db)):
-    db_comment = models.Comment(**comment.dict())
+    user = db.query(models.User).filter(models.User.id == comment.user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    db_comment = models.Comment(**comment.dict(), group=user.group)
     db.add(db_comment)
     db.commit()
     db.refresh(db_comment)
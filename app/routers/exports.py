@@ -0,0 +1,183 @@
+import csv
+import io
+import json
+import zlib
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, List, Literal, Optional
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.auth.auth import get_current_user_async
+from app.config import EXPORT_BATCH_SIZE
+from app.database import AsyncSessionLocal, get_async_db, use_replica, use_shard
+from app.utils.history import replay_row
+from app.utils.history_archive import archive_entries, read_archived
+
+router = APIRouter(prefix="/exports", tags=["Exports"])
+
+COMMENT_COLUMNS = ["id", "user_id", "group", "content", "created_at", "updated_at"]
+HISTORY_COLUMNS = ["id", "comment_id", "timestamp", "old_value", "new_value"]
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps are stored as naive UTC; convert aware ones to match."""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def encode(records: List[tuple], columns: List[str], format: str) -> str:
+    if format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(map(_value, record) for record in records)
+        return buffer.getvalue()
+    return "".join(
+        json.dumps(dict(zip(columns, map(_value, record)))) + "\n"
+        for record in records
+    )
+
+
+def gzipped(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    async def compress():
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+        async for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    return compress()
+
+
+async def stream_rows(
+    request: Request, group: str, stmt, columns: List[str], format: str, to_records: Callable,
+    last_records: Optional[Callable[[], List[tuple]]] = None,
+) -> AsyncIterator[bytes]:
+    """Encode the rows of stmt batch by batch from a server-side cursor,
+    then those of last_records() if given.
+
+    The export gets its own session, on the group's shard (or a read replica
+    when unsharded and there is one): the request's session is closed once
+    the endpoint returns, before the body is streamed.
+    """
+    if format == "csv":
+        yield encode([columns], columns, "csv").encode()
+    async with AsyncSessionLocal() as db:
+        use_shard(db, group)
+        await use_replica(db, request.headers.get("Authorization"))
+        result = await db.stream(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield encode(to_records(rows), columns, format).encode()
+    if last_records:
+        yield encode(last_records(), columns, format).encode()
+
+
+def export_response(chunks: AsyncIterator[bytes], name: str, format: str, gzip: bool) -> StreamingResponse:
+    filename = f"{name}.{format}"
+    media_type = MEDIA_TYPES[format]
+    if gzip:
+        chunks, filename, media_type = gzipped(chunks), filename + ".gz", "application/gzip"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/comments")
+async def export_comments(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    since: Optional[datetime] = None,
+    gzip: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    user = await get_current_user_async(request, db)
+    since = naive_utc(since)
+    stmt = (
+        select(*(getattr(models.Comment, column) for column in COMMENT_COLUMNS))
+        .where(models.Comment.group == user.group)
+        .order_by(models.Comment.id)
+    )
+    if since is not None:
+        stmt = stmt.where(func.coalesce(models.Comment.updated_at, models.Comment.created_at) >= since)
+
+    chunks = stream_rows(request, user.group, stmt, COMMENT_COLUMNS, format, lambda rows: [tuple(row) for row in rows])
+    return export_response(chunks, "comments", format, gzip)
+
+
+@router.get("/comment-histories")
+async def export_comment_histories(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    since: Optional[datetime] = None,
+    gzip: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    user = await get_current_user_async(request, db)
+    since = naive_utc(since)
+    history = models.CommentHistory
+    # Rows come per comment in id order so delta rows can be replayed while
+    # streaming, holding only the previous text of the current comment.
+    stmt = (
+        select(history.id, history.comment_id, history.timestamp, history.old_value, history.new_value, history.delta)
+        .join(models.Comment, models.Comment.id == history.comment_id)
+        .where(models.Comment.group == user.group)
+        .order_by(history.comment_id, history.id)
+    )
+    if since is not None:
+        # Earlier rows of the same comments are still read (not exported) to
+        # rebuild texts from their snapshots.
+        stmt = stmt.where(history.comment_id.in_(
+            select(history.comment_id).where(history.timestamp >= since)
+        ))
+
+    def is_since(timestamp: Optional[datetime]) -> bool:
+        # The column is nullable; rows without a time are only in full exports.
+        return since is None or (timestamp is not None and timestamp >= since)
+
+    # A comment's archived rows go out just before its rows in the table,
+    # read from the segments one batch of comments at a time.
+    first_ids = (await archive_entries(db, models.Comment.group == user.group)).get(user.group, {})
+    pending = sorted(first_ids)
+    state = {"comment_id": None, "previous_new": None, "archived_ids": set()}
+
+    def archived_records(through: Optional[int] = None):
+        """Records of the pending comments up to `through`, or of all left."""
+        count = len(pending) if through is None else bisect_right(pending, through)
+        comment_ids = pending[:count]
+        del pending[:count]
+        records = []
+        for comment_id, rows in sorted(read_archived(user.group, {c: first_ids[c] for c in comment_ids}).items()):
+            for row in rows:
+                if comment_id == through:
+                    state["archived_ids"].add(row.id)
+                if is_since(row.timestamp):
+                    records.append(tuple(row))
+        return records
+
+    def to_records(rows):
+        records = []
+        for row in rows:
+            if row.comment_id != state["comment_id"]:
+                state["comment_id"], state["previous_new"], state["archived_ids"] = row.comment_id, None, set()
+                records.extend(archived_records(through=row.comment_id))
+            old_value, new_value = replay_row(row, state["previous_new"])
+            state["previous_new"] = new_value
+            # Rows an interrupted archive run left in the table as well went
+            # out with the archived ones.
+            if row.id not in state["archived_ids"] and is_since(row.timestamp):
+                records.append((row.id, row.comment_id, row.timestamp, old_value, new_value))
+        return records
+
+    chunks = stream_rows(request, user.group, stmt, HISTORY_COLUMNS, format, to_records, archived_records)
+    return export_response(chunks, "comment_histories", format, gzip)
@@ -0,0 +1,36 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.admission import concurrency_limit
+from app.auth.principal_cache import principal_cache
+from app.cache import feed_cache
+from app.database import MAX_OVERFLOW, POOL_SIZE, async_engine, pool_stats
+from app.metrics import registry
+from app.pubsub import pubsub
+
+router = APIRouter(tags=["Metrics"])
+
+
+def collect_stats():
+    pool = async_engine.sync_engine.pool
+    yield "bloggu_pool_checked_out", "gauge", "Connections checked out of the pools.", pool_stats.checked_out
+    yield "bloggu_pool_size", "gauge", "Connections held by the async pool.", pool.checkedin() + pool.checkedout()
+    yield "bloggu_pool_limit", "gauge", "Most connections each async pool may open.", POOL_SIZE + MAX_OVERFLOW
+    for name, value in principal_cache.stats().items():
+        kind = "gauge" if name == "size" else "counter"
+        yield f"bloggu_principal_cache_{name}", kind, f"Principal cache {name}.", value
+    for name, value in feed_cache.stats().items():
+        yield f"bloggu_feed_cache_{name}", "counter", f"Group feed cache {name}.", value
+    for name, value in concurrency_limit.stats().items():
+        yield f"bloggu_admission_{name}", "gauge", f"Admission control concurrency {name}.", value
+    for name, value in pubsub.stats().items():
+        kind = "gauge" if name in ("channels", "subscribers") else "counter"
+        yield f"bloggu_pubsub_{name}", kind, f"Subscription broker {name}.", value
+
+
+registry.collectors.append(collect_stats)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
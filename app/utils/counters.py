@@ -0,0 +1,147 @@
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, literal, or_, select, text, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+# Every write to comments or histories changes the counters in its own
+# transaction, through add_counts() or remove_user_counts(). They hold:
+#   comment_count  rows in comments
+#   edit_count     rows in comment_histories of those comments, plus their
+#                  archived ones (comment_archives.edit_count)
+# so rebuild_counts() can recompute them from the tables at any time.
+
+UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _upsert(dialect: str, model, key: str, replace: Tuple[str, ...] = ()):
+    """INSERT adding to the counters of an existing row instead of failing."""
+    stmt = UPSERT_DIALECTS[dialect](model)
+    changes = {
+        name: getattr(model, name) + getattr(stmt.excluded, name) for name in ("comment_count", "edit_count")
+    }
+    changes.update({name: getattr(stmt.excluded, name) for name in replace})
+    return stmt.on_conflict_do_update(index_elements=[key], set_=changes)
+
+
+async def add_counts(db: AsyncSession, changes: Iterable[Tuple[Optional[int], str, int, int]]) -> None:
+    """Apply (user_id, group, comments, edits) changes to the user and group
+    counters in db's transaction, one statement per table. A None user_id
+    changes the group's counters only."""
+    users: Dict[int, list] = {}
+    groups: Dict[str, list] = {}
+    for user_id, group, comments, edits in changes:
+        if user_id is not None:
+            counts = users.setdefault(user_id, [group, 0, 0])
+            counts[1] += comments
+            counts[2] += edits
+        counts = groups.setdefault(group, [0, 0])
+        counts[0] += comments
+        counts[1] += edits
+
+    dialect = db.get_bind(models.UserStats).dialect.name
+    # Sorted, so concurrent transactions lock counter rows in the same order.
+    if users:
+        await db.execute(_upsert(dialect, models.UserStats, "user_id", replace=("group",)), [
+            {"user_id": user_id, "group": group, "comment_count": comments, "edit_count": edits}
+            for user_id, (group, comments, edits) in sorted(users.items())
+        ])
+    if groups:
+        await db.execute(_upsert(dialect, models.GroupStats, "group"), [
+            {"group": group, "comment_count": comments, "edit_count": edits}
+            for group, (comments, edits) in sorted(groups.items())
+        ])
+
+
+async def remove_user_counts(db: AsyncSession, user_id: int) -> Tuple[int, int]:
+    """Drop a user's counters and take them off their group's. Returns the
+    (comments, edits) they had."""
+    stats = (await db.execute(
+        delete(models.UserStats)
+        .where(models.UserStats.user_id == user_id)
+        .returning(models.UserStats.group, models.UserStats.comment_count, models.UserStats.edit_count)
+    )).first()
+    if stats is None:
+        return 0, 0
+    await db.execute(
+        update(models.GroupStats)
+        .where(models.GroupStats.group == stats.group)
+        .values(
+            comment_count=models.GroupStats.comment_count - stats.comment_count,
+            edit_count=models.GroupStats.edit_count - stats.edit_count,
+        )
+    )
+    return stats.comment_count, stats.edit_count
+
+
+async def count_edits(db: AsyncSession, comment_ids) -> int:
+    """History rows of the given comments, archived ones included, to take
+    off when they are deleted."""
+    hot = await db.scalar(
+        select(func.count(models.CommentHistory.id)).where(models.CommentHistory.comment_id.in_(comment_ids))
+    )
+    archived = await db.scalar(
+        select(func.coalesce(func.sum(models.CommentArchive.edit_count), 0))
+        .where(models.CommentArchive.comment_id.in_(comment_ids))
+    )
+    return hot + archived
+
+
+async def rebuild_counts(db: AsyncSession) -> Dict[str, int]:
+    """Recompute every counter in db's database from comments and histories
+    in db's transaction. Returns how many user and group rows were wrong."""
+    if db.get_bind(models.UserStats).dialect.name == "postgresql":
+        # Hold off writers until the new counters are committed; SQLite
+        # transactions already exclude each other.
+        await db.execute(text("LOCK TABLE comments, comment_histories IN SHARE MODE"))
+
+    before = await _snapshot(db)
+
+    histories = union_all(
+        select(models.CommentHistory.comment_id, literal(1).label("edits")),
+        select(models.CommentArchive.comment_id, models.CommentArchive.edit_count),
+    ).subquery()
+    edits = (
+        select(models.Comment.user_id, func.sum(histories.c.edits).label("edits"))
+        .join(histories, histories.c.comment_id == models.Comment.id)
+        .group_by(models.Comment.user_id)
+        .subquery()
+    )
+    await db.execute(delete(models.UserStats))
+    await db.execute(delete(models.GroupStats))
+    await db.execute(insert(models.UserStats).from_select(
+        ["user_id", "group", "comment_count", "edit_count"],
+        select(
+            models.Comment.user_id,
+            func.max(models.Comment.group),
+            func.count(models.Comment.id),
+            func.coalesce(func.max(edits.c.edits), 0),
+        )
+        .outerjoin(edits, edits.c.user_id == models.Comment.user_id)
+        .group_by(models.Comment.user_id),
+    ))
+    await db.execute(insert(models.GroupStats).from_select(
+        ["group", "comment_count", "edit_count"],
+        select(
+            models.UserStats.group,
+            func.sum(models.UserStats.comment_count),
+            func.sum(models.UserStats.edit_count),
+        ).group_by(models.UserStats.group),
+    ))
+
+    after = await _snapshot(db)
+    # Rows differing in any column, counted once per key.
+    changed = lambda model: len({row[0] for row in before[model] ^ after[model]})
+    return {"users": changed(models.UserStats), "groups": changed(models.GroupStats)}
+
+
+async def _snapshot(db: AsyncSession) -> dict:
+    # Rows counted down to zero are as good as the missing ones a rebuild leaves.
+    return {
+        model: {tuple(row) for row in (await db.execute(
+            select(model.__table__).where(or_(model.comment_count != 0, model.edit_count != 0))
+        )).all()}
+        for model in (models.UserStats, models.GroupStats)
+    }
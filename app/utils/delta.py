@@ -0,0 +1,39 @@
+import json
+import re
+from difflib import SequenceMatcher
+
+_TOKEN = re.compile(r"\s+|\w+|[^\w\s]")
+
+
+def _tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(text)
+
+
+def make_delta(old: str, new: str) -> str:
+    """Encode `new` as edits against `old`.
+
+    The result is a JSON list where [start, end] copies old[start:end] and a
+    string is inserted verbatim. Diffing runs on word tokens, which keeps it
+    fast on long comments while still finding the unchanged spans.
+    """
+    old_tokens = _tokenize(old)
+    new_tokens = _tokenize(new)
+    offsets = [0]
+    for token in old_tokens:
+        offsets.append(offsets[-1] + len(token))
+
+    ops: list = []
+    matcher = SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([offsets[i1], offsets[i2]])
+        elif j2 > j1:
+            ops.append("".join(new_tokens[j1:j2]))
+    return json.dumps(ops, ensure_ascii=False, separators=(",", ":"))
+
+
+def apply_delta(old: str, delta: str) -> str:
+    return "".join(
+        old[op[0]:op[1]] if isinstance(op, list) else op
+        for op in json.loads(delta)
+    )
@@ -0,0 +1,169 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app import models
+from app.config import HISTORY_SNAPSHOT_INTERVAL, HISTORY_STORAGE
+from app.utils.delta import apply_delta, make_delta
+
+# A history row is stored in one of two shapes:
+#   full:  old_value and new_value set, delta NULL
+#   delta: delta set (old_value -> new_value); old_value is only kept on
+#          snapshot rows, otherwise it equals the previous row's new_value.
+# Any row with old_value set starts a chain that can be replayed on its own.
+
+
+def is_snapshot(history: models.CommentHistory) -> bool:
+    return history.old_value is not None
+
+
+async def load_for_edit(db: AsyncSession, comment_ids: Iterable[int]) -> Dict[int, models.Comment]:
+    """The comments about to be edited, by id, locked until db's transaction
+    ends so concurrent edits can't build history rows on a stale text.
+    Postgres locks the rows. SQLite has no row locks and reads outside any
+    transaction, so a no-op UPDATE first takes its database write lock."""
+    comment_ids = set(comment_ids)
+    if db.get_bind(models.Comment).dialect.name == "sqlite":
+        await db.execute(
+            update(models.Comment).where(models.Comment.id.in_(comment_ids)).values(id=models.Comment.id),
+            execution_options={"synchronize_session": False},
+        )
+    comments = (await db.scalars(
+        select(models.Comment)
+        .where(models.Comment.id.in_(comment_ids))
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )).all()
+    return {comment.id: comment for comment in comments}
+
+
+async def build_histories(
+    db: AsyncSession,
+    edits: List[Tuple[int, str, str]],
+    timestamp: Optional[datetime] = None,
+    storage: str = HISTORY_STORAGE,
+) -> List[dict]:
+    """Row values for a batch of (comment_id, old_value, new_value) edits,
+    applied in order. Ready for a single executemany INSERT."""
+    timestamp = timestamp or datetime.utcnow()
+    if storage != "delta":
+        return [
+            {"comment_id": comment_id, "timestamp": timestamp, "old_value": old_value, "new_value": new_value}
+            for comment_id, old_value, new_value in edits
+        ]
+
+    # Edits since the latest snapshot of each comment; no entry means the
+    # comment has no snapshot yet.
+    comment_ids = {comment_id for comment_id, _, _ in edits}
+    latest = aliased(models.CommentHistory)
+    last_snapshot = (
+        select(func.max(latest.id))
+        .where(latest.comment_id == models.CommentHistory.comment_id, latest.old_value.is_not(None))
+        .scalar_subquery()
+    )
+    since_snapshot = dict((await db.execute(
+        select(models.CommentHistory.comment_id, func.count(models.CommentHistory.id) - 1)
+        .where(
+            models.CommentHistory.comment_id.in_(comment_ids),
+            models.CommentHistory.id >= last_snapshot,
+        )
+        .group_by(models.CommentHistory.comment_id)
+    )).all())
+
+    rows = []
+    for comment_id, old_value, new_value in edits:
+        since = since_snapshot.get(comment_id)
+        snapshot = since is None or since + 1 >= HISTORY_SNAPSHOT_INTERVAL
+        since_snapshot[comment_id] = 0 if snapshot else since + 1
+        rows.append({
+            "comment_id": comment_id,
+            "timestamp": timestamp,
+            "old_value": old_value if snapshot else None,
+            "new_value": None,
+            "delta": make_delta(old_value, new_value),
+        })
+    return rows
+
+
+async def build_history(
+    db: AsyncSession,
+    comment_id: int,
+    old_value: str,
+    new_value: str,
+    timestamp: Optional[datetime] = None,
+    storage: str = HISTORY_STORAGE,
+) -> models.CommentHistory:
+    [row] = await build_histories(db, [(comment_id, old_value, new_value)], timestamp, storage)
+    return models.CommentHistory(**row)
+
+
+def replay_row(row: models.CommentHistory, previous_new: Optional[str]) -> Tuple[str, str]:
+    """(old_value, new_value) of one row given the previous row's new_value."""
+    old_value = row.old_value if row.old_value is not None else previous_new
+    if old_value is None:
+        raise Exception(f"History {row.id} has no snapshot to rebuild from")
+    new_value = row.new_value if row.delta is None else apply_delta(old_value, row.delta)
+    return old_value, new_value
+
+
+def replay(rows: Iterable[models.CommentHistory]) -> Dict[int, Tuple[str, str]]:
+    """Rebuild (old_value, new_value) for consecutive rows of one comment."""
+    values = {}
+    previous_new = None
+    for row in rows:
+        values[row.id] = replay_row(row, previous_new)
+        previous_new = values[row.id][1]
+    return values
+
+
+async def load_history_values(db: AsyncSession, history_ids: List[int]) -> Dict[int, Tuple[str, str]]:
+    """Rebuild the texts of many history rows, reading each chain only from
+    the nearest snapshot at or before the oldest requested row."""
+    targets = (await db.execute(
+        select(models.CommentHistory.id, models.CommentHistory.comment_id)
+        .where(models.CommentHistory.id.in_(history_ids))
+    )).all()
+    if not targets:
+        return {}
+
+    bounds = {}
+    for history_id, comment_id in targets:
+        low, high = bounds.get(comment_id, (history_id, history_id))
+        bounds[comment_id] = (min(low, history_id), max(high, history_id))
+
+    snapshots = (await db.execute(
+        select(models.CommentHistory.comment_id, models.CommentHistory.id)
+        .where(
+            models.CommentHistory.comment_id.in_(bounds),
+            models.CommentHistory.old_value.is_not(None),
+            models.CommentHistory.id <= max(high for _, high in bounds.values()),
+        )
+    )).all()
+    starts = {}
+    for comment_id, history_id in snapshots:
+        if history_id <= bounds[comment_id][0]:
+            starts[comment_id] = max(starts.get(comment_id, history_id), history_id)
+
+    rows = (await db.scalars(
+        select(models.CommentHistory)
+        .where(or_(*(
+            and_(
+                models.CommentHistory.comment_id == comment_id,
+                models.CommentHistory.id.between(starts.get(comment_id, low), high),
+            )
+            for comment_id, (low, high) in bounds.items()
+        )))
+        .order_by(models.CommentHistory.comment_id, models.CommentHistory.id)
+    )).all()
+
+    chains = defaultdict(list)
+    for row in rows:
+        chains[row.comment_id].append(row)
+    values = {}
+    for chain in chains.values():
+        values.update(replay(chain))
+    return values
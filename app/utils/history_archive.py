@@ -0,0 +1,300 @@
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import struct
+import time
+import uuid
+import zlib
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.config import HISTORY_ARCHIVE_DIR
+from app.database import shard_map
+
+# Cold history rows live in segment files, written once by the archive job
+# (app.jobs.archive_histories) and never changed afterwards:
+#
+#   magic    8 bytes
+#   blocks   per comment, zlib-compressed JSON of its rows in id order:
+#            [[id, timestamp, old_value, new_value], ...]
+#   comments (comment_id, block offset, block length), sorted by comment_id
+#   ids      (history_id, comment_id), sorted by history_id
+#   keys     (group key, timestamp, history_id, comment_id), sorted: each
+#            group's rows in (timestamp, id) order, the order of a page
+#   footer   offsets and lengths of the three indexes, lowest and highest id,
+#            magic
+#
+# Rows are stored with both texts, so no delta chain crosses into a segment.
+# Segments are memory-mapped and the indexes binary-searched in place; only
+# the blocks of the comments asked for are decompressed. The group key is a
+# hash of the comment's group when archived, so moving a user to another
+# group takes their archived rows back into the table (app.utils.shards).
+
+MAGIC = b"BLGHSEG2"
+COMMENT_ENTRY = struct.Struct("<qQI")
+ID_ENTRY = struct.Struct("<qq")
+KEY_ENTRY = struct.Struct("<qqqq")
+FOOTER = struct.Struct("<QIQIQIqq8s")
+EPOCH = datetime(1970, 1, 1)
+
+
+def group_key(group: str) -> int:
+    return int.from_bytes(hashlib.blake2b(group.encode(), digest_size=8).digest(), "little", signed=True)
+
+
+def micros(timestamp: Optional[datetime]) -> int:
+    """A row's timestamp as a keys entry; missing ones sort first, as in a
+    page (datetime.min)."""
+    return ((timestamp or datetime.min) - EPOCH) // timedelta(microseconds=1)
+
+
+class ArchivedHistory(NamedTuple):
+    id: int
+    comment_id: int
+    timestamp: Optional[datetime]
+    old_value: str
+    new_value: str
+
+
+def write_segment(path: str, histories: Dict[int, List[ArchivedHistory]], groups: Dict[int, str]) -> None:
+    """Write each comment's rows (in id order) as a new segment at path,
+    keyed for paging by the comment's group in groups. It appears under that
+    name only once complete."""
+    comments, ids, keys = [], [], []
+    partial = path + ".partial"
+    with open(partial, "wb") as f:
+        f.write(MAGIC)
+        for comment_id in sorted(histories):
+            rows = histories[comment_id]
+            block = zlib.compress(json.dumps([
+                [row.id, row.timestamp.isoformat() if row.timestamp else None, row.old_value, row.new_value]
+                for row in rows
+            ]).encode())
+            comments.append(COMMENT_ENTRY.pack(comment_id, f.tell(), len(block)))
+            f.write(block)
+            ids.extend((row.id, comment_id) for row in rows)
+            key = group_key(groups[comment_id])
+            keys.extend((key, micros(row.timestamp), row.id, comment_id) for row in rows)
+        ids.sort()
+        keys.sort()
+        comments_at = f.tell()
+        f.write(b"".join(comments))
+        ids_at = f.tell()
+        f.write(b"".join(ID_ENTRY.pack(*entry) for entry in ids))
+        keys_at = f.tell()
+        f.write(b"".join(KEY_ENTRY.pack(*entry) for entry in keys))
+        f.write(FOOTER.pack(
+            comments_at, len(comments), ids_at, len(ids), keys_at, len(keys), ids[0][0], ids[-1][0], MAGIC,
+        ))
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(partial, path)
+
+
+class Segment:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (self._comments_at, self._comments, self._ids_at, self._ids, self._keys_at, self._keys,
+         self.min_id, self.max_id, magic) = FOOTER.unpack_from(self._map, len(self._map) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a history segment")
+
+    def _find(self, at: int, count: int, entry: struct.Struct, key: int) -> Optional[tuple]:
+        index = bisect_left(range(count), key, key=lambda i: entry.unpack_from(self._map, at + i * entry.size)[0])
+        if index < count:
+            found = entry.unpack_from(self._map, at + index * entry.size)
+            if found[0] == key:
+                return found
+        return None
+
+    def histories(self, comment_id: int) -> List[ArchivedHistory]:
+        found = self._find(self._comments_at, self._comments, COMMENT_ENTRY, comment_id)
+        if found is None:
+            return []
+        _, offset, length = found
+        return [
+            ArchivedHistory(history_id, comment_id, datetime.fromisoformat(timestamp) if timestamp else None, old, new)
+            for history_id, timestamp, old, new in json.loads(zlib.decompress(self._map[offset:offset + length]))
+        ]
+
+    def comment_of(self, history_id: int) -> Optional[int]:
+        if not self.min_id <= history_id <= self.max_id:
+            return None
+        found = self._find(self._ids_at, self._ids, ID_ENTRY, history_id)
+        return found[1] if found else None
+
+    def keys(self, group: int, after: tuple = ()) -> Iterator[Tuple[int, int, int]]:
+        """(timestamp, history_id, comment_id) of group's rows after the
+        (timestamp, history_id) keyset `after`, in that order."""
+        start = bisect_right(
+            range(self._keys), (group, *after), key=lambda i: KEY_ENTRY.unpack_from(self._map, self._keys_at + i * KEY_ENTRY.size)[:3],
+        )
+        for i in range(start, self._keys):
+            key, *entry = KEY_ENTRY.unpack_from(self._map, self._keys_at + i * KEY_ENTRY.size)
+            if key != group:
+                return
+            yield tuple(entry)
+
+
+class HistoryArchive:
+    """The segments of one shard, in one directory. New segments are picked
+    up on the next read after the archive job adds them.
+
+    A row can be in more than one segment, or still in the table as well, if
+    the job stopped between writing a segment and committing; readers keep
+    one copy per id."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._segments: Dict[str, Segment] = {}
+        self._listed = None
+
+    def segments(self) -> List[Segment]:
+        try:
+            listed = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if listed != self._listed:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith(".seg"))
+            self._segments = {
+                name: self._segments.get(name) or Segment(os.path.join(self.directory, name)) for name in names
+            }
+            self._listed = listed
+        return list(self._segments.values())
+
+    def histories(self, comment_ids: Iterable[int]) -> Dict[int, List[ArchivedHistory]]:
+        by_comment: Dict[int, Dict[int, ArchivedHistory]] = {}
+        for segment in self.segments():
+            for comment_id in comment_ids:
+                for row in segment.histories(comment_id):
+                    by_comment.setdefault(comment_id, {})[row.id] = row
+        return {comment_id: sorted(rows.values()) for comment_id, rows in by_comment.items()}
+
+    def find(self, history_id: int) -> Optional[ArchivedHistory]:
+        for segment in self.segments():
+            comment_id = segment.comment_of(history_id)
+            if comment_id is not None:
+                return next(row for row in segment.histories(comment_id) if row.id == history_id)
+        return None
+
+    def keys(self, group: str, after: tuple = ()) -> Iterator[Tuple[int, int, int]]:
+        """Segment.keys over all segments, in order and once per id."""
+        last = None
+        for entry in heapq.merge(*(segment.keys(group_key(group), after) for segment in self.segments())):
+            if entry[1] != last:
+                last = entry[1]
+                yield entry
+
+    def new_segment_path(self) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.seg")
+
+
+history_archives = {name: HistoryArchive(os.path.join(HISTORY_ARCHIVE_DIR, name)) for name in shard_map.engines}
+
+
+def archive_for(group: str) -> HistoryArchive:
+    return history_archives[shard_map.name_for(group)]
+
+
+async def archive_entries(db: AsyncSession, *criteria) -> Dict[str, Dict[int, int]]:
+    """first_id of the archived comments matching criteria (on comments or
+    comment_archives), by group and comment id."""
+    entries = (await db.execute(
+        select(models.CommentArchive.comment_id, models.CommentArchive.first_id, models.Comment.group)
+        .join(models.Comment, models.Comment.id == models.CommentArchive.comment_id)
+        .where(*criteria)
+    )).all()
+    by_group: Dict[str, Dict[int, int]] = {}
+    for comment_id, first_id, group in entries:
+        by_group.setdefault(group, {})[comment_id] = first_id
+    return by_group
+
+
+def read_archived(group: str, first_ids: Dict[int, int]) -> Dict[int, List[ArchivedHistory]]:
+    """Archived rows of these comments of group, by comment id, in id order."""
+    return {
+        comment_id: [row for row in rows if row.id >= first_ids[comment_id]]
+        for comment_id, rows in archive_for(group).histories(first_ids).items()
+    }
+
+
+async def load_archived(db: AsyncSession, *criteria) -> Dict[int, List[ArchivedHistory]]:
+    """Archived rows of the comments matching criteria (on comments or
+    comment_archives), by comment id, in id order."""
+    archived = {}
+    for group, first_ids in (await archive_entries(db, *criteria)).items():
+        archived.update(read_archived(group, first_ids))
+    return archived
+
+
+async def load_cold_page(
+    db: AsyncSession, group: str, after: Optional[Tuple[datetime, int]], limit: int,
+) -> List[ArchivedHistory]:
+    """Up to limit archived rows of group's comments after the (timestamp,
+    id) keyset `after`, in that order, minus any still in the table as well:
+    the archived part of a page of a connection. Reads the segments' keys
+    from `after` on, and the blocks of the comments returned."""
+    archive = archive_for(group)
+    keys = archive.keys(group, (micros(after[0]), after[1]) if after else ())
+    page: List[ArchivedHistory] = []
+    while len(page) < limit:
+        entries = list(islice(keys, limit - len(page)))
+        if not entries:
+            break
+        # Skips rows of deleted comments, of other groups with the same key,
+        # and (only after an interrupted archive run) rows still in the table.
+        first_ids = (await archive_entries(
+            db, models.Comment.group == group, models.CommentArchive.comment_id.in_({c for _, _, c in entries}),
+        )).get(group, {})
+        hot_ids = set((await db.scalars(
+            select(models.CommentHistory.id).where(models.CommentHistory.id.in_([h for _, h, _ in entries]))
+        )).all())
+        wanted = [
+            (history_id, comment_id) for _, history_id, comment_id in entries
+            if history_id >= first_ids.get(comment_id, history_id + 1) and history_id not in hot_ids
+        ]
+        rows = {row.id: row for rows in archive.histories({c for _, c in wanted}).values() for row in rows}
+        page.extend(rows[history_id] for history_id, _ in wanted)
+    return page
+
+
+async def count_archived(db: AsyncSession, *criteria) -> int:
+    """How many archived rows the comments matching criteria (on comments or
+    comment_archives) have, from comment_archives alone."""
+    return await db.scalar(
+        select(func.coalesce(func.sum(models.CommentArchive.edit_count), 0))
+        .join(models.Comment, models.Comment.id == models.CommentArchive.comment_id)
+        .where(*criteria)
+    )
+
+
+async def find_archived(db: AsyncSession, group: str, history_id: int) -> Optional[ArchivedHistory]:
+    """The archived row with this id, if its comment is in `group`."""
+    row = archive_for(group).find(history_id)
+    if row is None:
+        return None
+    first_id = await db.scalar(
+        select(models.CommentArchive.first_id)
+        .join(models.Comment, models.Comment.id == models.CommentArchive.comment_id)
+        .where(models.CommentArchive.comment_id == row.comment_id, models.Comment.group == group)
+    )
+    return row if first_id is not None and row.id >= first_id else None
+
+
+def merge_archived(hot: list, archived: Dict[int, List[ArchivedHistory]], key: Callable) -> list:
+    """Rows from the table plus the archived ones not among them, by key."""
+    hot_ids = {row.id for row in hot}
+    cold = [row for rows in archived.values() for row in rows if row.id not in hot_ids]
+    if not cold:
+        return list(hot)
+    return sorted([*hot, *cold], key=key)
@@ -0,0 +1,54 @@
+import re
+from typing import Sequence, Tuple
+
+from sqlalchemy import Column, Float, Integer, MetaData, Select, Table, Text, false, func, literal_column, select
+
+from app import models
+
+# The SQLite FTS5 table created alongside comments (see app.models.comment).
+# It has its own MetaData so create_all never tries to create it as a plain table.
+comments_fts = Table(
+    "comments_fts",
+    MetaData(),
+    Column("rowid", Integer),
+    Column("content", Text),
+    Column("rank", Float),
+)
+
+search_vector = literal_column("comments.search_vector")
+
+
+def search_terms(query: str) -> list:
+    return re.findall(r"\w+", query)
+
+
+def fts5_query(query: str) -> str:
+    """Match every word of the query, each quoted so FTS5 operators and
+    punctuation in user input are taken literally."""
+    return " ".join(f'"{term}"' for term in search_terms(query))
+
+
+def search_comments_query(dialect: str, group: str, query: str, columns: Sequence = (models.Comment,)) -> Tuple[Select, tuple]:
+    """Comments (or the given columns of them) of a group matching every word
+    of query, and the keyset order (best match first, then id) to paginate
+    them by."""
+    stmt = select(*columns).where(models.Comment.group == group)
+    if not search_terms(query):
+        return stmt.where(false()), (models.Comment.id,)
+
+    if dialect == "postgresql":
+        tsquery = func.plainto_tsquery("english", query)
+        # ts_rank grows with relevance; negate it so the keyset stays ascending.
+        rank = (-func.ts_rank_cd(search_vector, tsquery, type_=Float)).label("rank")
+        stmt = stmt.where(search_vector.op("@@")(tsquery))
+    elif dialect == "sqlite":
+        # FTS5's rank is bm25(), which is already smaller for better matches.
+        rank = comments_fts.c.rank.label("rank")
+        stmt = (
+            stmt.join(comments_fts, comments_fts.c.rowid == models.Comment.id)
+            .where(comments_fts.c.content.match(fts5_query(query)))
+        )
+    else:
+        raise Exception(f"Full-text search is not supported on {dialect}")
+
+    return stmt, (rank, models.Comment.id)
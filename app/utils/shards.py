@@ -0,0 +1,114 @@
+import logging
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.database import AsyncSessionLocal, shard_map, use_shard
+from app.utils.counters import add_counts, remove_user_counts
+from app.utils.history_archive import load_archived
+
+logger = logging.getLogger(__name__)
+
+
+def _copy(row: dict, **changes) -> dict:
+    values = {key: value for key, value in row.items() if key != "id"}
+    values.update(changes)
+    return values
+
+
+async def move_user_comments(db: AsyncSession, user_id: int, old_group: str, new_group: str) -> None:
+    """Commit db, which holds the change of a user's group, and move the
+    user's comments, their histories and the user's counters along to the
+    new group.
+
+    Archived histories become table rows again either way, as segments key
+    them by group; the next archive run files them under the new one.
+    Within one shard that's an UPDATE in db's transaction. Across shards it
+    takes three commits, as they are separate databases: the copies go into
+    the new shard first, then db commits, then the originals are deleted.
+    Copies get new ids on their shard. If db fails to commit the copies are
+    deleted again; if the originals can't be deleted that is logged, as they
+    still show in the old group until removed.
+    """
+    user_comment_ids = select(models.Comment.id).where(models.Comment.user_id == user_id)
+    if shard_map.engine_for(old_group) is shard_map.engine_for(new_group):
+        archived = [
+            {**history._asdict(), "delta": None}
+            for rows in (await load_archived(db, models.Comment.user_id == user_id)).values() for history in rows
+        ]
+        if archived:
+            # Leaves out the rows an interrupted archive run left in the table.
+            hot_ids = set((await db.scalars(
+                select(models.CommentHistory.id)
+                .where(models.CommentHistory.comment_id.in_(user_comment_ids))
+                .where(models.CommentHistory.id <= max(history["id"] for history in archived))
+            )).all())
+            restored = [history for history in archived if history["id"] not in hot_ids]
+            if restored:
+                await db.execute(insert(models.CommentHistory), restored)
+            await db.execute(delete(models.CommentArchive).where(models.CommentArchive.comment_id.in_(user_comment_ids)))
+        await db.execute(
+            update(models.Comment)
+            .where(models.Comment.user_id == user_id)
+            .values(group=new_group)
+        )
+        comments, edits = await remove_user_counts(db, user_id)
+        await add_counts(db, [(user_id, new_group, comments, edits)])
+        await db.commit()
+        return
+
+    async with AsyncSessionLocal() as source, AsyncSessionLocal() as target:
+        use_shard(source, old_group)
+        use_shard(target, new_group)
+
+        comments = (await source.execute(
+            select(models.Comment.__table__).where(models.Comment.user_id == user_id).order_by(models.Comment.id)
+        )).all()
+        histories = {history.id: dict(history._mapping) for history in (await source.execute(
+            select(models.CommentHistory.__table__).where(models.CommentHistory.comment_id.in_(user_comment_ids))
+        )).all()}
+        for rows in (await load_archived(source, models.Comment.user_id == user_id)).values():
+            for history in rows:
+                histories.setdefault(history.id, {**history._asdict(), "delta": None})
+        histories = [histories[history_id] for history_id in sorted(histories)]
+        # Don't hold a read open on the old shard while the others commit.
+        await source.commit()
+
+        new_ids = []
+        if comments:
+            # Ids are assigned in VALUES order; histories keep their order
+            # too, which delta chains rely on.
+            new_ids = sorted((await target.scalars(
+                insert(models.Comment).returning(models.Comment.id),
+                [_copy(comment._mapping, group=new_group) for comment in comments],
+            )).all())
+            new_id = dict(zip((comment.id for comment in comments), new_ids))
+            if histories:
+                await target.execute(insert(models.CommentHistory), [
+                    _copy(history, comment_id=new_id[history["comment_id"]]) for history in histories
+                ])
+            await add_counts(target, [(user_id, new_group, len(comments), len(histories))])
+        await target.commit()
+
+        try:
+            await db.commit()
+        except Exception:
+            if new_ids:
+                await target.execute(delete(models.CommentHistory).where(models.CommentHistory.comment_id.in_(new_ids)))
+                await target.execute(delete(models.Comment).where(models.Comment.id.in_(new_ids)))
+                await remove_user_counts(target, user_id)
+                await target.commit()
+            raise
+
+        try:
+            await source.execute(delete(models.CommentHistory).where(models.CommentHistory.comment_id.in_(user_comment_ids)))
+            await source.execute(delete(models.CommentArchive).where(models.CommentArchive.comment_id.in_(user_comment_ids)))
+            await source.execute(delete(models.Comment).where(models.Comment.user_id == user_id))
+            await remove_user_counts(source, user_id)
+            await source.commit()
+        except Exception:
+            logger.exception(
+                "User %d moved to group %s, but their %d comments are still on shard %s",
+                user_id, new_group, len(comments), shard_map.name_for(old_group),
+            )
@@ -0,0 +1,2 @@
+"""Benchmark suite: a seeded dataset generator and timed scenarios for every
+GraphQL resolver and the auth routes. See `python -m benchmarks --help`."""
@@ -0,0 +1,57 @@
+"""Compare two benchmark reports scenario by scenario.
+
+    python -m benchmarks.compare before.json after.json --threshold 10
+
+Exits with status 1 when any scenario's p95 latency grew, or its throughput
+dropped, by more than the threshold percentage.
+"""
+import argparse
+import json
+import sys
+
+
+def change(before: float, after: float) -> float:
+    return (after - before) / before * 100 if before else 0.0
+
+
+def compare(before: dict, after: dict, threshold: float) -> bool:
+    """Print a table of changes; True if anything regressed past threshold."""
+    key = lambda result: (result["scenario"], result["concurrency"])
+    baseline = {key(result): result for result in before["results"]}
+    regressed = False
+
+    print(f"{'scenario':32} {'c':>3} {'p50':>9} {'p95':>9} {'rps':>9} {'sql':>7}")
+    for result in after["results"]:
+        old = baseline.get(key(result))
+        if old is None:
+            print(f"{result['scenario']:32} {result['concurrency']:>3} (new)")
+            continue
+        p95 = change(old["p95_ms"], result["p95_ms"])
+        rps = change(old["throughput_rps"], result["throughput_rps"])
+        flag = p95 > threshold or -rps > threshold
+        regressed = regressed or flag
+        print(
+            f"{result['scenario']:32} {result['concurrency']:>3} "
+            f"{change(old['p50_ms'], result['p50_ms']):+8.1f}% {p95:+8.1f}% {rps:+8.1f}% "
+            f"{result['sql_statements_per_op'] - old['sql_statements_per_op']:+7.1f}"
+            + ("  REGRESSION" if flag else "")
+        )
+    return regressed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare", description=__doc__.split("\n")[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed change in percent")
+    args = parser.parse_args(argv)
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    return 1 if compare(before, after, args.threshold) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
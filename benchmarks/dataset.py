@@ -0,0 +1,150 @@
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import func, insert, select
+
+from app import models
+from app.database import AsyncSessionLocal, Base, engine
+from app.utils.history import build_histories
+from app.utils.security import hash_password
+
+PASSWORD = "benchmark-password"
+EPOCH = datetime(2024, 1, 1)
+
+WORDS = (
+    "release notes deploy review merge branch schema query cache index latency "
+    "throughput worker request response token group comment history edit draft "
+    "feature bug fix test build pipeline rollback metric alert dashboard migration "
+    "database replica shard backup restore search ranking feed subscription export"
+).split()
+
+SCALES = {
+    "small": {"users": 50, "groups": 5, "comments_per_user": 20, "edits_per_comment": 3},
+    "medium": {"users": 500, "groups": 10, "comments_per_user": 40, "edits_per_comment": 5},
+    "large": {"users": 5000, "groups": 25, "comments_per_user": 40, "edits_per_comment": 8},
+}
+
+
+@dataclass
+class Dataset:
+    """What was generated, with the ids scenarios need to address it. Tables
+    are recreated first, so comment ids follow generation order."""
+
+    users: int
+    groups: int
+    comments: int
+    histories: int
+    # usernames, comment ids and history ids by group
+    usernames: Dict[str, List[str]] = field(default_factory=dict)
+    comment_ids: Dict[str, List[int]] = field(default_factory=dict)
+    history_ids: Dict[str, List[int]] = field(default_factory=dict)
+    # comment ids by username
+    user_comment_ids: Dict[str, List[int]] = field(default_factory=dict)
+
+    def summary(self) -> dict:
+        return {"users": self.users, "groups": self.groups, "comments": self.comments, "histories": self.histories}
+
+
+def sentence(rng: random.Random, low: int = 6, high: int = 24) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def revise(rng: random.Random, text: str) -> str:
+    """A small edit to text, like a user fixing a few words."""
+    words = text.split()
+    for _ in range(rng.randint(1, 3)):
+        position = rng.randrange(len(words) + 1)
+        if words and rng.random() < 0.5:
+            words[min(position, len(words) - 1)] = rng.choice(WORDS)
+        else:
+            words.insert(position, rng.choice(WORDS))
+    return " ".join(words)
+
+
+async def generate(
+    users: int,
+    groups: int,
+    comments_per_user: int,
+    edits_per_comment: int,
+    seed: int = 0,
+    batch_size: int = 1000,
+) -> Dataset:
+    """Recreate every table and fill it with the same data for the same
+    arguments: users spread over groups, each with comments and edit
+    histories stored with the configured HISTORY_STORAGE."""
+    rng = random.Random(seed)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    dataset = Dataset(users=users, groups=groups, comments=0, histories=0)
+    # bcrypt is slow by design; every generated user shares one hash.
+    hashed_password = hash_password(PASSWORD)
+    user_rows = []
+    for index in range(users):
+        username, group = f"user{index}", f"group{index % groups}"
+        user_rows.append({"username": username, "group": group, "hashed_password": hashed_password})
+        dataset.usernames.setdefault(group, []).append(username)
+
+    comment_rows, edits = [], []
+    for user_id, user in enumerate(user_rows, start=1):
+        for _ in range(rng.randint(comments_per_user // 2, comments_per_user * 3 // 2)):
+            comment_id = len(comment_rows) + 1
+            created_at = EPOCH + timedelta(seconds=comment_id)
+            text = sentence(rng)
+            edit_count = rng.randint(0, edits_per_comment * 2)
+            for _ in range(edit_count):
+                new_text = revise(rng, text)
+                edits.append((comment_id, text, new_text))
+                text = new_text
+            comment_rows.append({
+                "user_id": user_id, "group": user["group"], "content": text,
+                "created_at": created_at, "updated_at": EPOCH + timedelta(days=1) if edit_count else None,
+            })
+            dataset.comment_ids.setdefault(user["group"], []).append(comment_id)
+            dataset.user_comment_ids.setdefault(user["username"], []).append(comment_id)
+
+    # Edits are in comment order; batches end on comment boundaries so each
+    # comment's chain is built by a single build_histories call.
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(models.User), user_rows)
+        for start in range(0, len(comment_rows), batch_size):
+            await db.execute(insert(models.Comment), comment_rows[start:start + batch_size])
+        await db.commit()
+
+        start = 0
+        while start < len(edits):
+            end = min(start + batch_size, len(edits))
+            while end < len(edits) and edits[end][0] == edits[end - 1][0]:
+                end += 1
+            batch = edits[start:end]
+            rows = await build_histories(db, batch, timestamp=EPOCH + timedelta(days=1, seconds=start))
+            await db.execute(insert(models.CommentHistory), rows)
+            await db.commit()
+            start = end
+
+        history_comments = (await db.execute(
+            select(models.CommentHistory.id, models.Comment.group)
+            .join(models.Comment)
+            .order_by(models.CommentHistory.id)
+        )).all()
+        dataset.comments = len(comment_rows)
+        dataset.histories = len(history_comments)
+        for history_id, group in history_comments:
+            dataset.history_ids.setdefault(group, []).append(history_id)
+
+    return dataset
+
+
+async def history_storage_bytes() -> int:
+    """Bytes of text stored for comment histories, to compare storage formats."""
+    history = models.CommentHistory
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(
+            func.coalesce(func.sum(
+                func.coalesce(func.length(history.old_value), 0)
+                + func.coalesce(func.length(history.new_value), 0)
+                + func.coalesce(func.length(history.delta), 0)
+            ), 0)
+        ))
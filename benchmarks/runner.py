@@ -0,0 +1,120 @@
+import asyncio
+import math
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import List, Optional
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from benchmarks.scenarios import Bench, Scenario
+
+
+class StatementCounter:
+    """Counts SQL statements and commits sent through the engine the API uses
+    (the async engine's sync_engine, or the sync API's engine)."""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.count = 0
+        self.commits = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def _on_commit(self, *args):
+        self.commits += 1
+
+    @contextmanager
+    def listening(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        event.listen(self.engine, "commit", self._on_commit)
+        try:
+            yield self
+        finally:
+            event.remove(self.engine, "before_cursor_execute", self._on_execute)
+            event.remove(self.engine, "commit", self._on_commit)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+@dataclass
+class Result:
+    scenario: str
+    concurrency: int
+    iterations: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    mean_ms: float
+    throughput_rps: float
+    sql_statements_per_op: float
+    commits_per_op: float = 0.0
+    first_error: Optional[str] = None
+
+
+async def run_scenario(
+    bench: Bench, scenario: Scenario, iterations: int, concurrency: int, warmup: int, engine: Engine,
+) -> Result:
+    """Run scenario `iterations` times from `concurrency` concurrent clients
+    after `warmup` unmeasured runs. Each run gets its own index so scenarios
+    can address distinct rows."""
+    bench.run += 1
+    if scenario.setup:
+        await scenario.setup(bench, warmup + iterations)
+
+    for index in range(warmup):
+        await scenario.run(bench, index)
+
+    latencies: List[float] = []
+    errors: List[str] = []
+    next_index = iter(range(warmup, warmup + iterations))
+
+    async def client():
+        for index in next_index:
+            started = time.perf_counter()
+            error = check(await scenario.run(bench, index))
+            latencies.append(time.perf_counter() - started)
+            if error:
+                errors.append(error)
+
+    with StatementCounter(engine).listening() as statements:
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return Result(
+        scenario=scenario.name,
+        concurrency=concurrency,
+        iterations=iterations,
+        errors=len(errors),
+        p50_ms=ms(percentile(latencies, 0.50)),
+        p95_ms=ms(percentile(latencies, 0.95)),
+        p99_ms=ms(percentile(latencies, 0.99)),
+        mean_ms=ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+        throughput_rps=round(iterations / elapsed, 2) if elapsed else 0.0,
+        sql_statements_per_op=round(statements.count / iterations, 2) if iterations else 0.0,
+        commits_per_op=round(statements.commits / iterations, 3) if iterations else 0.0,
+        first_error=errors[0] if errors else None,
+    )
+
+
+def check(response: httpx.Response) -> Optional[str]:
+    """Why a response counts as failed, or None."""
+    if response.status_code >= 400:
+        return f"HTTP {response.status_code}: {response.text[:200]}"
+    if response.headers.get("content-type", "").startswith("application/json"):
+        body = response.json()
+        if isinstance(body, dict) and body.get("errors"):
+            return body["errors"][0].get("message", "GraphQL error")
+    return None
@@ -0,0 +1,293 @@
+import random
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from jwt import encode
+from sqlalchemy import insert, select
+
+from app import models
+from app.config import ALGORITHM, SECRET_KEY
+from app.database import AsyncSessionLocal
+from benchmarks.dataset import PASSWORD, WORDS, Dataset, sentence
+
+# Number of comments touched by each bulk mutation call.
+BULK_SIZE = 10
+
+
+@dataclass
+class Bench:
+    """State shared by the scenarios of one benchmark run. Requests go
+    straight to the ASGI app, so latencies include FastAPI, Strawberry and
+    the database but no network."""
+
+    client: httpx.AsyncClient
+    dataset: Dataset
+    principal: str = "user0"
+    # Incremented for every scenario run so rows created by repeated runs
+    # (e.g. at several concurrency levels) don't collide.
+    run: int = 0
+    scratch: Dict[str, list] = field(default_factory=dict)
+
+    @property
+    def group(self) -> str:
+        return "group0"
+
+    def token(self, username: str) -> str:
+        return encode({"sub": username}, SECRET_KEY, algorithm=ALGORITHM)
+
+    def graphql(self, query: str, variables: Optional[dict] = None, username: Optional[str] = None) -> Awaitable[httpx.Response]:
+        return self.client.post(
+            "/graphql",
+            json={"query": query, "variables": variables or {}},
+            headers={"Authorization": f"Bearer {self.token(username or self.principal)}"},
+        )
+
+    def name(self, prefix: str, index: int) -> str:
+        return f"bench-{prefix}-{self.run}-{index}"
+
+    async def insert_users(self, usernames: List[str], group: str) -> None:
+        async with AsyncSessionLocal() as db:
+            hashed_password = await db.scalar(
+                select(models.User.hashed_password).where(models.User.username == self.principal)
+            )
+            await db.execute(insert(models.User), [
+                {"username": username, "group": group, "hashed_password": hashed_password}
+                for username in usernames
+            ])
+            await db.commit()
+
+    async def insert_comments(self, username: str, count: int) -> List[int]:
+        async with AsyncSessionLocal() as db:
+            user = await db.scalar(select(models.User).where(models.User.username == username))
+            rng = random.Random(self.run)
+            ids = (await db.scalars(
+                insert(models.Comment).returning(models.Comment.id),
+                [{"user_id": user.id, "group": user.group, "content": sentence(rng)} for _ in range(count)],
+            )).all()
+            await db.commit()
+            return sorted(ids)
+
+
+@dataclass
+class Scenario:
+    name: str
+    run: Callable[[Bench, int], Awaitable[httpx.Response]]
+    # Called once before a run with the number of iterations it will make.
+    setup: Optional[Callable[[Bench, int], Awaitable[None]]] = None
+
+
+SCENARIOS: List[Scenario] = []
+
+
+def scenario(name: str, setup: Optional[Callable[[Bench, int], Awaitable[None]]] = None):
+    def register(run):
+        SCENARIOS.append(Scenario(name, run, setup))
+        return run
+    return register
+
+
+def pick(values: list, index: int):
+    return values[index % len(values)]
+
+
+def text(index: int) -> str:
+    return sentence(random.Random(index))
+
+
+# Query
+
+@scenario("query.allUsers")
+def all_users(bench: Bench, index: int):
+    return bench.graphql("{ allUsers { id username group } }")
+
+
+@scenario("query.users")
+def users(bench: Bench, index: int):
+    return bench.graphql("{ users(first: 20) { edges { node { id username group } } pageInfo { endCursor } } }")
+
+
+@scenario("query.userById")
+def user_by_id(bench: Bench, index: int):
+    return bench.graphql(
+        "query ($id: Int!) { userById(userId: $id) { id username group } }",
+        {"id": index % bench.dataset.users + 1},
+    )
+
+
+@scenario("query.allComments")
+def all_comments(bench: Bench, index: int):
+    return bench.graphql("{ allComments { id content userId } }")
+
+
+@scenario("query.comments")
+def comments(bench: Bench, index: int):
+    return bench.graphql(
+        "{ comments(first: 20) { edges { node { id content userId } } pageInfo { hasNextPage endCursor } } }"
+    )
+
+
+@scenario("query.comments.nested")
+def comments_nested(bench: Bench, index: int):
+    return bench.graphql(
+        "{ comments(first: 20) { edges { node { id content author { username } "
+        "histories { timestamp oldValue newValue } } } } }"
+    )
+
+
+@scenario("query.commentById")
+def comment_by_id(bench: Bench, index: int):
+    return bench.graphql(
+        "query ($id: Int!) { commentById(commentId: $id) { id content userId } }",
+        {"id": pick(bench.dataset.comment_ids[bench.group], index)},
+    )
+
+
+@scenario("query.searchComments")
+def search_comments(bench: Bench, index: int):
+    return bench.graphql(
+        "query ($q: String!) { searchComments(query: $q, first: 20) { edges { node { id content } } } }",
+        {"q": pick(WORDS, index)},
+    )
+
+
+@scenario("query.allCommentHistories")
+def all_comment_histories(bench: Bench, index: int):
+    return bench.graphql("{ allCommentHistories { id commentId timestamp oldValue newValue } }")
+
+
+@scenario("query.commentHistories")
+def comment_histories(bench: Bench, index: int):
+    return bench.graphql(
+        "{ commentHistories(first: 20) { edges { node { id commentId oldValue newValue } } pageInfo { endCursor } } }"
+    )
+
+
+@scenario("query.commentHistoryById")
+def comment_history_by_id(bench: Bench, index: int):
+    return bench.graphql(
+        "query ($id: Int!) { commentHistoryById(historyId: $id) { id oldValue newValue } }",
+        {"id": pick(bench.dataset.history_ids[bench.group], index)},
+    )
+
+
+# Mutation
+
+@scenario("mutation.createUser")
+def create_user(bench: Bench, index: int):
+    return bench.graphql(
+        "mutation ($u: String!, $p: String!, $g: String!) { createUser(username: $u, password: $p, group: $g) { id } }",
+        {"u": bench.name("created", index), "p": PASSWORD, "g": bench.group},
+    )
+
+
+async def setup_update_user(bench: Bench, iterations: int) -> None:
+    # A user of its own with some comments, moved between groups each run.
+    username = bench.name("mover", 0)
+    await bench.insert_users([username], bench.group)
+    await bench.insert_comments(username, 20)
+    bench.scratch["updateUser"] = [username]
+
+
+@scenario("mutation.updateUser", setup=setup_update_user)
+def update_user(bench: Bench, index: int):
+    return bench.graphql(
+        "mutation ($g: String!) { updateUser(group: $g) { id group } }",
+        {"g": f"group{index % bench.dataset.groups}"},
+        username=bench.scratch["updateUser"][0],
+    )
+
+
+async def setup_delete_user(bench: Bench, iterations: int) -> None:
+    bench.scratch["deleteUser"] = [bench.name("deleted", index) for index in range(iterations)]
+    await bench.insert_users(bench.scratch["deleteUser"], bench.group)
+
+
+@scenario("mutation.deleteUser", setup=setup_delete_user)
+def delete_user(bench: Bench, index: int):
+    return bench.graphql("mutation { deleteUser }", username=bench.scratch["deleteUser"][index])
+
+
+@scenario("mutation.createComment")
+def create_comment(bench: Bench, index: int):
+    return bench.graphql(
+        "mutation ($c: String!) { createComment(content: $c) { id } }",
+        {"c": text(index)},
+    )
+
+
+@scenario("mutation.updateComment")
+def update_comment(bench: Bench, index: int):
+    return bench.graphql(
+        "mutation ($id: Int!, $c: String!) { updateComment(commentId: $id, newContent: $c) { id } }",
+        {"id": pick(bench.dataset.user_comment_ids[bench.principal], index), "c": text(index)},
+    )
+
+
+async def setup_delete_comment(bench: Bench, iterations: int) -> None:
+    bench.scratch["deleteComment"] = await bench.insert_comments(bench.principal, iterations)
+
+
+@scenario("mutation.deleteComment", setup=setup_delete_comment)
+def delete_comment(bench: Bench, index: int):
+    return bench.graphql(
+        "mutation ($id: Int!) { deleteComment(commentId: $id) }",
+        {"id": bench.scratch["deleteComment"][index]},
+    )
+
+
+@scenario("mutation.createComments")
+def create_comments(bench: Bench, index: int):
+    return bench.graphql(
+        "mutation ($c: [String!]!) { createComments(contents: $c) { id } }",
+        {"c": [text(index * BULK_SIZE + offset) for offset in range(BULK_SIZE)]},
+    )
+
+
+@scenario("mutation.updateComments")
+def update_comments(bench: Bench, index: int):
+    # Disjoint comments per call, so concurrent calls don't edit the same rows.
+    ids = bench.dataset.user_comment_ids[bench.principal]
+    edits = [
+        {"commentId": pick(ids, index * BULK_SIZE + offset), "newContent": text(index * BULK_SIZE + offset)}
+        for offset in range(min(BULK_SIZE, len(ids)))
+    ]
+    return bench.graphql(
+        "mutation ($e: [CommentEditInput!]!) { updateComments(edits: $e) { id } }",
+        {"e": edits},
+    )
+
+
+async def setup_delete_comments(bench: Bench, iterations: int) -> None:
+    bench.scratch["deleteComments"] = await bench.insert_comments(bench.principal, iterations * BULK_SIZE)
+
+
+@scenario("mutation.deleteComments", setup=setup_delete_comments)
+def delete_comments(bench: Bench, index: int):
+    return bench.graphql(
+        "mutation ($ids: [Int!]!) { deleteComments(commentIds: $ids) }",
+        {"ids": bench.scratch["deleteComments"][index * BULK_SIZE:(index + 1) * BULK_SIZE]},
+    )
+
+
+# REST
+
+@scenario("rest.login")
+def login(bench: Bench, index: int):
+    return bench.client.post("/login", data={"username": f"user{index % bench.dataset.users}", "password": PASSWORD})
+
+
+@scenario("rest.signup")
+def signup(bench: Bench, index: int):
+    return bench.client.post(
+        "/signup",
+        json={"username": bench.name("signup", index), "password": PASSWORD, "group": bench.group},
+    )
+
+
+@scenario("rest.exportComments")
+def export_comments(bench: Bench, index: int):
+    return bench.client.get(
+        "/exports/comments",
+        headers={"Authorization": f"Bearer {bench.token(bench.principal)}"},
+    )
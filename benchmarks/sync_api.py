@@ -0,0 +1,188 @@
+"""The GraphQL API on the blocking sync engine, as it ran before the async
+engine was added, so the two can be benchmarked against each other:
+
+    python -m benchmarks --api sync --concurrency 1,32 --output sync.json
+    python -m benchmarks --history-storage full --concurrency 1,32 --output async.json
+    python -m benchmarks.compare sync.json async.json
+
+Scenarios the sync API doesn't implement show up as new in the comparison.
+
+Resolvers are plain functions on a Session from a pooled sync engine.
+Strawberry calls them on the event loop, so every statement blocks all other
+requests of the process. Only the fields used by the SCENARIOS listed here
+exist, with the same names and results. Histories are read as stored, so the
+dataset must use full history storage (--api sync sets it).
+"""
+from datetime import datetime
+from typing import List, Optional
+
+import strawberry
+from fastapi import Depends, FastAPI, HTTPException
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, sessionmaker
+from strawberry.fastapi import GraphQLRouter
+from strawberry.types import Info
+
+from app import models
+from app.auth.auth import decode_token, parse_bearer_header
+from app.database import DATABASE_URL, POOL_OPTIONS
+
+SCENARIOS = [
+    "query.allUsers",
+    "query.userById",
+    "query.allComments",
+    "query.commentById",
+    "query.allCommentHistories",
+    "query.commentHistoryById",
+    "mutation.createComment",
+    "mutation.updateComment",
+]
+
+engine = create_engine(DATABASE_URL, **POOL_OPTIONS)
+SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_context(db: Session = Depends(get_db)):
+    return {"db": db}
+
+
+def viewer(info: Info) -> models.User:
+    if "user" not in info.context:
+        token = parse_bearer_header(info.context["request"].headers.get("authorization"))
+        user = info.context["db"].scalar(
+            select(models.User).where(models.User.username == decode_token(token)["sub"])
+        )
+        if user is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        info.context["user"] = user
+    return info.context["user"]
+
+
+@strawberry.type
+class UserType:
+    id: int
+    username: str
+    group: str
+
+
+@strawberry.type
+class CommentType:
+    id: int
+    content: str
+    user_id: int
+
+
+@strawberry.type
+class CommentHistoryType:
+    id: int
+    comment_id: int
+    timestamp: datetime
+    old_value: str
+    new_value: str
+
+
+def to_user_type(user: models.User) -> UserType:
+    return UserType(id=user.id, username=user.username, group=user.group)
+
+
+def to_comment_type(comment: models.Comment) -> CommentType:
+    return CommentType(id=comment.id, content=comment.content, user_id=comment.user_id)
+
+
+def to_comment_history_type(history: models.CommentHistory) -> CommentHistoryType:
+    return CommentHistoryType(
+        id=history.id, comment_id=history.comment_id, timestamp=history.timestamp,
+        old_value=history.old_value, new_value=history.new_value,
+    )
+
+
+def group_histories_query(user: models.User):
+    return (
+        select(models.CommentHistory)
+        .join(models.Comment, models.Comment.id == models.CommentHistory.comment_id)
+        .where(models.Comment.group == user.group)
+    )
+
+
+@strawberry.type
+class Query:
+    @strawberry.field
+    def all_users(self, info: Info) -> List[UserType]:
+        viewer(info)
+        return [to_user_type(u) for u in info.context["db"].scalars(select(models.User).order_by(models.User.id))]
+
+    @strawberry.field
+    def user_by_id(self, info: Info, user_id: int) -> Optional[UserType]:
+        viewer(info)
+        user = info.context["db"].get(models.User, user_id)
+        return to_user_type(user) if user else None
+
+    @strawberry.field
+    def all_comments(self, info: Info) -> List[CommentType]:
+        user = viewer(info)
+        comments = info.context["db"].scalars(
+            select(models.Comment)
+            .where(models.Comment.group == user.group)
+            .order_by(models.Comment.created_at, models.Comment.id)
+        )
+        return [to_comment_type(c) for c in comments]
+
+    @strawberry.field
+    def comment_by_id(self, info: Info, comment_id: int) -> Optional[CommentType]:
+        user = viewer(info)
+        comment = info.context["db"].scalar(
+            select(models.Comment).where(models.Comment.group == user.group, models.Comment.id == comment_id)
+        )
+        return to_comment_type(comment) if comment else None
+
+    @strawberry.field
+    def all_comment_histories(self, info: Info) -> List[CommentHistoryType]:
+        user = viewer(info)
+        histories = info.context["db"].scalars(
+            group_histories_query(user).order_by(models.CommentHistory.timestamp, models.CommentHistory.id)
+        )
+        return [to_comment_history_type(h) for h in histories]
+
+    @strawberry.field
+    def comment_history_by_id(self, info: Info, history_id: int) -> Optional[CommentHistoryType]:
+        user = viewer(info)
+        history = info.context["db"].scalar(group_histories_query(user).where(models.CommentHistory.id == history_id))
+        return to_comment_history_type(history) if history else None
+
+
+@strawberry.type
+class Mutation:
+    @strawberry.mutation
+    def create_comment(self, info: Info, content: str) -> CommentType:
+        user = viewer(info)
+        db: Session = info.context["db"]
+        comment = models.Comment(user_id=user.id, group=user.group, content=content)
+        db.add(comment)
+        db.commit()
+        return to_comment_type(comment)
+
+    @strawberry.mutation
+    def update_comment(self, info: Info, comment_id: int, new_content: str) -> CommentType:
+        user = viewer(info)
+        db: Session = info.context["db"]
+        comment = db.scalar(select(models.Comment).where(models.Comment.id == comment_id).with_for_update())
+        if not comment or comment.user_id != user.id:
+            raise Exception("Unauthorized to update this comment")
+        db.add(models.CommentHistory(comment_id=comment.id, old_value=comment.content, new_value=new_content))
+        comment.content = new_content
+        comment.updated_at = datetime.utcnow()
+        db.commit()
+        return to_comment_type(comment)
+
+
+schema = strawberry.Schema(query=Query, mutation=Mutation)
+app = FastAPI(title="Bloggu API (sync engine)")
+app.include_router(GraphQLRouter(schema, context_getter=get_context), prefix="/graphql")
@@ -1,25 +1,42 @@
 # from app.routers import users, comments, comment_histories
-from fastapi import FastAPI, Request
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from app.admission import AdmissionMiddleware
 from app.auth import auth_routes
-from app.database import SessionLocal
-from app.graphql.schema import graphql_app, schema
-from app.auth.auth import get_current_user
-from strawberry.fastapi import GraphQLRouter
+from app.auth.principal_cache import follow_invalidations
+from app.config import N_PLUS_ONE_THRESHOLD
+from app.database import async_engines, engine
+from app.metrics import MetricsMiddleware
+from app.routers import exports, metrics
+from app.graphql.schema import graphql_app
+
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    invalidations = asyncio.create_task(follow_invalidations())
+    yield
+    invalidations.cancel()
+    # The server has drained in-flight requests by now; close pooled
+    # connections instead of leaving them for the database to time out.
+    for async_engine in async_engines:
+        await async_engine.dispose()
+    engine.dispose()
 
-app = FastAPI(title="Bloggu API")
+
+app = FastAPI(title="Bloggu API", lifespan=lifespan)
 
 # app.include_router(users.router)
 # app.include_router(comments.router)
 # app.include_router(comment_histories.router)
-async def get_context(request: Request):
-    db = SessionLocal()
-    try:
-        user = get_current_user(request, db)
-    except:
-        user = None
-    return {"request": request, "db": db, "current_user": user}
-
-graphql_app = GraphQLRouter(schema, context_getter=get_context)
 
 app.include_router(graphql_app, prefix="/graphql")
-app.include_router(auth_routes.router)
\ No newline at end of file
+app.include_router(auth_routes.router)
+app.include_router(exports.router)
+app.include_router(metrics.router)
+
+# Added first so it runs inside MetricsMiddleware, which then sees rejections.
+app.add_middleware(AdmissionMiddleware, paths=("/graphql", "/login", "/signup"))
+app.add_middleware(MetricsMiddleware, threshold=N_PLUS_ONE_THRESHOLD)
@@ -0,0 +1,215 @@
+"""Production server: a supervisor process forking N uvicorn workers.
+
+    python serve.py --workers 4 --port 8000
+
+The app is imported once before forking (unless --no-preload), so workers
+start in milliseconds and share the imported code copy-on-write. All workers
+accept on one inherited listening socket. SIGTERM or SIGINT drains them: each
+stops accepting, finishes in-flight requests for up to --graceful-timeout
+seconds and closes its database pools. Workers that die are replaced.
+
+Each worker sizes its connection pools from DB_MAX_CONNECTIONS divided by the
+worker count and its number of databases (see app.database), so scaling
+workers or adding replicas and shards never exceeds the budget.
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+logger = logging.getLogger("bloggu.serve")
+
+# Exit status of a worker that could not load the app; retrying won't help.
+WORKER_BOOT_ERROR = 3
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python serve.py", description=__doc__.split("\n")[0])
+    parser.add_argument("app", nargs="?", default="main:app", help="module:attribute (default: %(default)s)")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")) or os.cpu_count() or 1,
+                        help="worker processes (default: WEB_CONCURRENCY, else the CPU count)")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+                        help="seconds workers get to finish in-flight requests on shutdown")
+    parser.add_argument("--no-preload", dest="preload", action="store_false",
+                        help="import the app in each worker after forking instead of once before")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    parser.add_argument("--no-access-log", dest="access_log", action="store_false")
+    return parser.parse_args(argv)
+
+
+def load_app(path: str):
+    module, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module), attribute or "app")
+
+
+def bind(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def warn_process_local_state(workers: int) -> None:
+    if workers < 2:
+        return
+    from app.config import FEED_CACHE_BACKEND, PUBSUB_BACKEND
+    from app.database import DATABASE_REPLICA_URLS, READ_YOUR_WRITES_BACKEND
+
+    if FEED_CACHE_BACKEND == "memory":
+        logger.warning("FEED_CACHE_BACKEND=memory with %d workers: a write only invalidates its own "
+                       "worker's cache, others serve stale feeds for up to FEED_CACHE_TTL", workers)
+    if DATABASE_REPLICA_URLS and READ_YOUR_WRITES_BACKEND == "memory":
+        logger.warning("READ_YOUR_WRITES_BACKEND=memory with %d workers: a client's next request may land "
+                       "on another worker and read a replica that lacks its write", workers)
+    if PUBSUB_BACKEND == "memory":
+        logger.warning("PUBSUB_BACKEND=memory with %d workers: subscribers only see events "
+                       "published by their own worker, and a changed user's principal stays cached "
+                       "in the other workers for up to PRINCIPAL_CACHE_TTL", workers)
+
+
+def run_worker(index: int, app, args, sock: socket.socket) -> int:
+    """Body of a forked worker; returns its exit status."""
+    import uvicorn
+
+    forked = time.perf_counter()
+    # Until it serves, a worker simply dies on an exit signal.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        if app is None:
+            app = load_app(args.app)
+        # Never reuse pooled connections inherited from the supervisor.
+        from app.database import async_engines, engine
+
+        engine.dispose(close=False)
+        for async_engine in async_engines:
+            async_engine.sync_engine.dispose(close=False)
+    except Exception:
+        logger.exception("Worker %d failed to load %s", index, args.app)
+        return WORKER_BOOT_ERROR
+
+    config = uvicorn.Config(
+        app,
+        lifespan="on",
+        log_level=args.log_level,
+        access_log=args.access_log,
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+    server = uvicorn.Server(config)
+
+    async def serve():
+        task = asyncio.ensure_future(server.serve(sockets=[sock]))
+        while not server.started and not task.done():
+            await asyncio.sleep(0.005)
+        if server.started:
+            logger.info("Worker %d (pid %d) ready in %.3fs", index, os.getpid(), time.perf_counter() - forked)
+        await task
+
+    # uvicorn handles exit signals while serving and re-raises them after the
+    # graceful shutdown; ignore them by then so the worker exits cleanly.
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    with asyncio.Runner(loop_factory=config.get_loop_factory()) as runner:
+        runner.run(serve())
+    return 0 if server.started else 1
+
+
+class Supervisor:
+    def __init__(self, app, args, sock: socket.socket):
+        self.app = app
+        self.args = args
+        self.sock = sock
+        self.workers = {}  # pid -> worker index
+        self.stopping = False
+        self.failed = False
+
+    def spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                status = run_worker(index, self.app, self.args, self.sock)
+            finally:
+                logging.shutdown()
+                os._exit(status)
+        self.workers[pid] = index
+
+    def stop(self, signum, frame) -> None:
+        if not self.stopping:
+            logger.info("Received %s, draining %d workers", signal.Signals(signum).name, len(self.workers))
+        self.stopping = True
+
+    def reap(self) -> None:
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            index = self.workers.pop(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if self.stopping:
+                continue
+            if code == WORKER_BOOT_ERROR:
+                logger.error("Worker %d could not boot, shutting down", index)
+                self.failed = self.stopping = True
+            else:
+                logger.warning("Worker %d (pid %d) exited with %d, restarting", index, pid, code)
+                self.spawn(index)
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.args.workers):
+            self.spawn(index)
+
+        while not self.stopping:
+            self.reap()
+            time.sleep(0.2)
+
+        for pid in self.workers:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.workers:
+            logger.warning("Worker pid %d did not drain in time, killing it", pid)
+            os.kill(pid, signal.SIGKILL)
+        self.sock.close()
+        logger.info("Shut down")
+        return 1 if self.failed else 0
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("[%(process)d] %(levelname)s: %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(args.log_level.upper())
+    # app.database reads this at import time to size each worker's pools.
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    sys.path.insert(0, os.getcwd())
+
+    sock = bind(args.host, args.port, args.backlog)
+    app = None
+    if args.preload:
+        started = time.perf_counter()
+        app = load_app(args.app)
+        logger.info("Preloaded %s in %.2fs", args.app, time.perf_counter() - started)
+    warn_process_local_state(args.workers)
+
+    logger.info("Listening on %s:%d with %d workers", args.host, args.port, args.workers)
+    return Supervisor(app, args, sock).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
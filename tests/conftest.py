@@ -0,0 +1,55 @@
+import itertools
+import os
+import sys
+import tempfile
+
+# The app reads its settings when first imported, so they are fixed here,
+# before any test module imports it: a fresh SQLite database, no replicas or
+# shards, cheap password hashing and no admission control.
+DATA_DIR = tempfile.mkdtemp(prefix="bloggu-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{DATA_DIR}/test.db"
+os.environ["HISTORY_ARCHIVE_DIR"] = f"{DATA_DIR}/history_archive"
+os.environ["ADMISSION_CONTROL"] = "false"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ.setdefault("JWT_SECRET", "test-secret")
+for name in ("ASYNC_DATABASE_URL", "DATABASE_REPLICA_URLS", "DATABASE_SHARDS", "SHARD_MAP"):
+    os.environ.pop(name, None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+_usernames = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def client():
+    import app.models  # noqa: F401
+    from app.database import Base, engine
+    import main
+
+    Base.metadata.create_all(engine)
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def signup(client):
+    """Sign up a new user and return the headers to act as them."""
+    def signup(group: str = "testers") -> dict:
+        username = f"user{next(_usernames)}"
+        response = client.post("/signup", json={"username": username, "password": "pw", "group": group})
+        assert response.status_code == 201, response.text
+        token = client.post("/login", data={"username": username, "password": "pw"}).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+    return signup
+
+
+@pytest.fixture
+def gql(client):
+    """Run a GraphQL operation and return its data, failing on errors."""
+    def gql(query: str, headers: dict, **variables) -> dict:
+        body = client.post("/graphql", json={"query": query, "variables": variables}, headers=headers).json()
+        assert not body.get("errors"), body["errors"]
+        return body["data"]
+    return gql
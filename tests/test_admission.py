@@ -0,0 +1,105 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app import admission
+from app.admission import AdaptiveLimit, AdmissionMiddleware, TokenBuckets, client_key
+from app.auth.principal_cache import Principal, principal_cache
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_allows_a_burst_then_refills_at_its_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    buckets = TokenBuckets(rate=2, burst=3)
+    assert [buckets.take("a") for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("a") == 0.5
+    assert buckets.take("b") == 0
+    clock.now += 0.5
+    assert buckets.take("a") == 0
+
+
+def test_adaptive_limit_backs_off_once_per_interval_and_grows_when_used(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    limit = AdaptiveLimit(initial=10, min_limit=2, max_limit=20)
+    assert all(limit.try_acquire() for _ in range(10))
+    assert not limit.try_acquire()
+
+    limit.release(0.01, dropped=True)
+    assert limit.limit == 8
+    # The same congestion reported again within one request duration.
+    limit.release(0.01, dropped=True)
+    assert limit.limit == 8
+    clock.now += 1
+    limit.release(0.01, queued=0.009)
+    assert limit.limit == 8 * 0.8
+
+    while limit.inflight:
+        limit.release(0.01)
+    assert limit.inflight == 0
+    for _ in range(6):
+        limit.try_acquire()
+    before = limit.limit
+    limit.release(0.01)
+    assert limit.limit == before + 1 / before
+
+
+def admission_client(deadline: float = 5, **buckets) -> TestClient:
+    async def work(request):
+        await asyncio.sleep(float(request.query_params.get("sleep", 0)))
+        return PlainTextResponse("done")
+
+    middleware = AdmissionMiddleware(Starlette(routes=[Route("/work", work)]), paths=("/work",), deadline=deadline, enabled=True)
+    middleware.limit = AdaptiveLimit(initial=4, min_limit=1, max_limit=10)
+    middleware.buckets = TokenBuckets(**buckets)
+    client = TestClient(middleware)
+    client.middleware = middleware
+    return client
+
+
+def test_rate_limited_clients_get_429_with_retry_after():
+    client = admission_client(rate=0.5, burst=1)
+    assert client.get("/work").status_code == 200
+    response = client.get("/work")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+
+
+def test_a_full_concurrency_limit_sheds_with_503():
+    client = admission_client(rate=0)
+    client.middleware.limit.inflight = client.middleware.limit.limit
+    response = client.get("/work")
+    assert response.status_code == 503
+    assert response.json() == {"detail": "Server is overloaded"}
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_requests_past_the_deadline_are_cancelled_with_503():
+    client = admission_client(deadline=0.05, rate=0)
+    response = client.get("/work", params={"sleep": 5})
+    assert response.status_code == 503
+    assert response.json() == {"detail": "Request deadline exceeded"}
+    assert response.headers["Retry-After"] == "1"
+    # The dropped request counted as congestion and gave its slot back.
+    assert client.middleware.limit.inflight == 0
+    assert client.middleware.limit.limit < 4
+
+
+def test_client_key_does_not_count_as_principal_cache_traffic():
+    principal_cache.put("admission-token", Principal(id=-1, username="cached", group="g"), principal_cache.epoch)
+    before = principal_cache.stats()
+    key = client_key({"client": ("10.0.0.1", 1234)}, {"authorization": "Bearer admission-token"})
+    assert key == "user:cached"
+    assert principal_cache.stats() == before
+    principal_cache.invalidate_user(-1)
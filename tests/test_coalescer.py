@@ -0,0 +1,82 @@
+import asyncio
+
+from sqlalchemy import event, select
+
+from app import models
+from app.coalescer import CreateComment, UpdateComment, WriteCoalescer
+from app.database import AsyncSessionLocal, async_engine
+
+GROUP = "coalesced"
+
+
+def user_id(gql, headers) -> int:
+    return gql('mutation { createComment(content: "first") { userId } }', headers)["createComment"]["userId"]
+
+
+def run_batch(client, writes):
+    """Submit writes concurrently to a fresh coalescer. Returns each caller's
+    result (or exception) and the number of commits."""
+    commits = []
+
+    def count(conn):
+        commits.append(conn)
+
+    async def run():
+        coalescer = WriteCoalescer(max_delay=0.05, max_batch=100, enabled=True)
+        return await asyncio.gather(*(coalescer.submit(write) for write in writes), return_exceptions=True)
+
+    event.listen(async_engine.sync_engine, "commit", count)
+    try:
+        results = client.portal.call(run)
+    finally:
+        event.remove(async_engine.sync_engine, "commit", count)
+    return results, len(commits)
+
+
+def test_concurrent_writes_share_one_commit_and_fail_alone(client, signup, gql):
+    alice, bob = signup(group=GROUP), signup(group=GROUP)
+    alice_id, bob_id = user_id(gql, alice), user_id(gql, bob)
+    comment = gql('mutation { createComment(content: "draft") { id } }', alice)["createComment"]["id"]
+
+    results, commits = run_batch(client, [
+        CreateComment(user_id=alice_id, group=GROUP, content="one"),
+        UpdateComment(user_id=alice_id, group=GROUP, comment_id=comment, new_content="edited"),
+        UpdateComment(user_id=bob_id, group=GROUP, comment_id=comment, new_content="not bob's"),
+        CreateComment(user_id=bob_id, group=GROUP, content="two"),
+        UpdateComment(user_id=alice_id, group=GROUP, comment_id=comment, new_content="edited again"),
+    ])
+    assert commits == 1
+    assert [(r.user_id, r.content) for r in (results[0], results[3])] == [(alice_id, "one"), (bob_id, "two")]
+    assert [(r.id, r.content) for r in (results[1], results[4])] == [(comment, "edited"), (comment, "edited again")]
+    assert str(results[2]) == "Unauthorized to update this comment"
+
+    histories = gql('query($id: Int!) { commentById(commentId: $id) { content histories { oldValue newValue } } }',
+                    alice, id=comment)["commentById"]
+    assert histories == {"content": "edited again", "histories": [
+        {"oldValue": "draft", "newValue": "edited"}, {"oldValue": "edited", "newValue": "edited again"},
+    ]}
+
+
+def test_a_failed_batch_is_retried_one_write_at_a_time(client, signup, gql):
+    headers = signup(group=GROUP)
+    author = user_id(gql, headers)
+    comment = gql('mutation { createComment(content: "draft") { id } }', headers)["createComment"]["id"]
+
+    # content is NOT NULL: the batch's INSERT fails, and then only this write.
+    results, commits = run_batch(client, [
+        CreateComment(user_id=author, group=GROUP, content="kept"),
+        CreateComment(user_id=author, group=GROUP, content=None),
+        UpdateComment(user_id=author, group=GROUP, comment_id=comment, new_content="edited"),
+    ])
+    assert commits == 2
+    assert results[0].content == "kept"
+    assert isinstance(results[1], Exception) and "NOT NULL" in str(results[1])
+    assert results[2].content == "edited"
+
+    async def stored():
+        async with AsyncSessionLocal() as db:
+            return set((await db.scalars(
+                select(models.Comment.content).where(models.Comment.user_id == author)
+            )).all())
+
+    assert client.portal.call(stored) == {"first", "kept", "edited"}
@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+
+from sqlalchemy import update
+
+from app import models
+from app.coalescer import CreateComment, UpdateComment, WriteCoalescer
+from app.config import HISTORY_ARCHIVE_DIR
+from app.database import DATABASE_URL, AsyncSessionLocal, engine
+from app.utils.counters import rebuild_counts
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATS = """{
+  groupStats { group commentCount editCount }
+  allUsers { id commentCount editCount }
+}"""
+
+
+def stats(gql, headers) -> dict:
+    data = gql(STATS, headers)
+    group = data["groupStats"]
+    # Other groups' counters are hidden (null).
+    users = {
+        user["id"]: (user["commentCount"], user["editCount"])
+        for user in data["allUsers"] if user["commentCount"] is not None
+    }
+    return {"group": (group["commentCount"], group["editCount"]), "users": users}
+
+
+def drift(client) -> dict:
+    """What a rebuild would change, without changing it."""
+    async def run():
+        async with AsyncSessionLocal() as db:
+            changed = await rebuild_counts(db)
+            await db.rollback()
+            return changed
+    return client.portal.call(run)
+
+
+def reconcile(*args) -> int:
+    # The job must open the database the app under test uses.
+    env = {**os.environ, "DATABASE_URL": DATABASE_URL, "HISTORY_ARCHIVE_DIR": HISTORY_ARCHIVE_DIR}
+    result = subprocess.run(
+        [sys.executable, "-m", "app.jobs.reconcile_counters", *args], cwd=ROOT, env=env, capture_output=True,
+    )
+    assert b"Traceback" not in result.stderr, result.stderr.decode()
+    return result.returncode
+
+
+def test_counters_follow_every_kind_of_write(client, signup, gql):
+    alice, bob = signup(group="counted"), signup(group="counted")
+    ids = [c["id"] for c in gql(
+        'mutation { createComments(contents: ["a", "b", "c"]) { id userId } }', alice)["createComments"]]
+    alice_id = gql('query($id: Int!) { commentById(commentId: $id) { userId } }', alice, id=ids[0])["commentById"]["userId"]
+    gql("mutation($edits: [CommentEditInput!]!) { updateComments(edits: $edits) { id } }", alice,
+        edits=[{"commentId": ids[0], "newContent": "a1"}, {"commentId": ids[1], "newContent": "b1"}])
+    bob_comment = gql('mutation { createComment(content: "x") { id userId } }', bob)["createComment"]
+    bob_id = bob_comment["userId"]
+    gql('mutation($id: Int!) { updateComment(commentId: $id, newContent: "x1") { id } }', bob, id=bob_comment["id"])
+
+    async def coalesced():
+        coalescer = WriteCoalescer(max_delay=0.01, enabled=True)
+        for write in (CreateComment(user_id=alice_id, group="counted", content="d"),
+                      UpdateComment(user_id=alice_id, group="counted", comment_id=ids[2], new_content="c1")):
+            await coalescer.submit(write)
+    client.portal.call(coalesced)
+
+    # alice: 4 comments, 3 edits; bob: 1 and 1.
+    assert stats(gql, alice) == {"group": (5, 4), "users": {alice_id: (4, 3), bob_id: (1, 1)}}
+    gql('mutation($id: Int!) { deleteComment(commentId: $id) }', alice, id=ids[0])
+    gql('mutation($ids: [Int!]!) { deleteComments(commentIds: $ids) }', alice, ids=[ids[1]])
+    assert stats(gql, alice) == {"group": (3, 2), "users": {alice_id: (2, 1), bob_id: (1, 1)}}
+
+    assert gql("mutation { deleteUser }", bob) == {"deleteUser": True}
+    assert stats(gql, alice) == {"group": (2, 1), "users": {alice_id: (2, 1)}}
+
+    gql('mutation { updateUser(group: "recounted") { group } }', alice)
+    assert stats(gql, alice) == {"group": (2, 1), "users": {alice_id: (2, 1)}}
+    assert stats(gql, signup(group="counted"))["group"] == (0, 0)
+    assert drift(client) == {"users": 0, "groups": 0}
+
+
+def test_reconcile_check_exits_1_on_drift_and_reconcile_fixes_it(client, signup, gql):
+    headers = signup(group="drifting")
+    gql('mutation { createComment(content: "counted") { id } }', headers)
+    with engine.begin() as conn:
+        conn.execute(
+            update(models.GroupStats)
+            .where(models.GroupStats.group == "drifting")
+            .values(comment_count=models.GroupStats.comment_count + 1)
+        )
+    assert drift(client)["groups"] >= 1
+
+    assert reconcile("--check") == 1
+    assert stats(gql, headers)["group"] == (2, 0)
+    assert reconcile() == 0
+    assert reconcile("--check") == 0
+    assert stats(gql, headers)["group"] == (1, 0)
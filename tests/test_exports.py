@@ -0,0 +1,45 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+
+def export(client, headers, path, since):
+    response = client.get(f"/exports/{path}", params={"since": since.isoformat()}, headers=headers)
+    assert response.status_code == 200, response.text
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_since_finds_edited_comments_and_accepts_any_timezone(client, signup, gql):
+    headers = signup(group="exporters")
+    old = gql('mutation { createComment(content: "old") { id } }', headers)["createComment"]["id"]
+    edited = gql('mutation { createComment(content: "edited") { id } }', headers)["createComment"]["id"]
+    since = datetime.now(timezone.utc)
+    gql('mutation($id: Int!) { updateComment(commentId: $id, newContent: "new") { id } }', headers, id=edited)
+
+    for value in (since, since.astimezone(timezone(timedelta(hours=-5))), since.replace(tzinfo=None)):
+        comments = export(client, headers, "comments", value)
+        assert [c["id"] for c in comments] == [edited]
+        assert comments[0]["updated_at"] is not None
+        histories = export(client, headers, "comment-histories", value)
+        assert [(h["comment_id"], h["new_value"]) for h in histories] == [(edited, "new")]
+    earlier = since - timedelta(minutes=1)
+    assert [c["id"] for c in export(client, headers, "comments", earlier)] == [old, edited]
+
+
+def test_since_skips_histories_without_a_timestamp(client, signup, gql):
+    from sqlalchemy import func, select, update
+    from app import models
+    from app.database import engine
+
+    headers = signup(group="exporters")
+    comment = gql('mutation { createComment(content: "v0") { id } }', headers)["createComment"]["id"]
+    since = datetime.now(timezone.utc)
+    for version in ("v1", "v2"):
+        gql('mutation($id: Int!, $c: String!) { updateComment(commentId: $id, newContent: $c) { id } }',
+            headers, id=comment, c=version)
+    history = models.CommentHistory
+    with engine.begin() as conn:
+        first_edit = conn.scalar(select(func.min(history.id)).where(history.comment_id == comment))
+        conn.execute(update(history).where(history.id == first_edit).values(timestamp=None))
+
+    histories = export(client, headers, "comment-histories", since)
+    assert [(h["old_value"], h["new_value"]) for h in histories] == [("v1", "v2")]
@@ -0,0 +1,62 @@
+import asyncio
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import models
+from app.cache import _MISSING, GroupFeedCache, LRUBackend
+from app.database import AsyncSessionLocal, Base
+from tests.conftest import DATA_DIR
+
+
+def test_cached_feeds_are_read_from_the_primary(client, signup, gql):
+    headers = signup(group="lagging")
+    gql('mutation { createComment(content: "on the primary") { id } }', headers)
+    cache = GroupFeedCache(LRUBackend())
+    query = select(models.Comment.content).where(models.Comment.group == "lagging")
+
+    async def cached_contents(**info):
+        async with AsyncSessionLocal() as db:
+            db.info.update(info)
+
+            async def load():
+                return (await db.scalars(query)).all()
+
+            return await cache.get_or_load(db, "lagging", ("contents",), load), await load()
+
+    async def run():
+        # An empty replica: it has not caught up with the comment yet.
+        replica = create_async_engine(f"sqlite+aiosqlite:///{DATA_DIR}/replica.db")
+        async with replica.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            return [
+                await cached_contents(replica=replica),
+                await cached_contents(replica=replica),
+                await cached_contents(recent_write=True),
+            ]
+        finally:
+            await replica.dispose()
+
+    # Outside the cache, replica-routed sessions still read the replica.
+    primary = ["on the primary"]
+    assert client.portal.call(run) == [(primary, []), (primary, []), (primary, primary)]
+    # The second read was a hit; the client that just wrote skipped the cache.
+    assert cache.stats() == {"hits": 1, "misses": 1, "invalidations": 0}
+
+
+def test_memory_backend_keeps_versions_bounded_and_never_reuses_them():
+    async def run():
+        backend = LRUBackend(maxsize=2)
+        stale = await backend.get_version("group:a")
+        await backend.set(f"a:{stale}", "stale", 60)
+        await backend.bump_version("group:a")
+        for name in ("group:b", "group:c", "group:a", "group:d"):
+            await backend.get_version(name)
+        assert len(backend._versions) == 2
+        # "group:a" was dropped again: it starts over at a new version, not
+        # the one its stale entry was stored under.
+        version = await backend.get_version("group:a")
+        return version != stale and await backend.get(f"a:{version}") is _MISSING
+
+    assert asyncio.run(run())
@@ -0,0 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+def test_concurrent_edits_chain_histories(client, signup, gql):
+    headers = signup()
+    comment_id = gql('mutation { createComment(content: "v0") { id } }', headers)["createComment"]["id"]
+
+    def edit(n):
+        response = client.post("/graphql", headers=headers, json={
+            "query": "mutation($id: Int!, $content: String!) { updateComment(commentId: $id, newContent: $content) { id } }",
+            "variables": {"id": comment_id, "content": f"v{n}"},
+        })
+        assert not response.json().get("errors"), response.json()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(edit, range(1, 33)))
+
+    data = gql(
+        "query($id: Int!) { commentById(commentId: $id) { content histories { oldValue newValue } } }",
+        headers, id=comment_id,
+    )["commentById"]
+    histories = data["histories"]
+    assert len(histories) == 32
+    # Every edit starts from the text the previous one left.
+    assert histories[0]["oldValue"] == "v0"
+    for previous, history in zip(histories, histories[1:]):
+        assert history["oldValue"] == previous["newValue"]
+    assert histories[-1]["newValue"] == data["content"]
@@ -0,0 +1,110 @@
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+PAGE = """query($after: String) {
+  commentHistories(first: 2, after: $after) {
+    totalCount
+    edges { node { commentId oldValue newValue } }
+    pageInfo { hasNextPage endCursor }
+  }
+}"""
+
+
+def archive_old_edits(client, comment_ids):
+    """Backdate the edits of these comments and run the archive job."""
+    from app import models
+    from app.database import engine, shard_map
+    from app.jobs.archive_histories import archive_shard
+
+    history = models.CommentHistory
+    with Session(engine) as db:
+        rows = db.execute(select(history.id, history.timestamp).where(history.comment_id.in_(comment_ids))).all()
+        db.execute(update(history), [{"id": id, "timestamp": timestamp - timedelta(days=200)} for id, timestamp in rows])
+        db.commit()
+    cutoff = datetime.utcnow() - timedelta(days=100)
+    return sum(client.portal.call(archive_shard, name, shard, cutoff) for name, shard in shard_map.engines.items())
+
+
+def test_connection_and_export_include_archived_rows(client, signup, gql):
+    headers = signup(group="archivists")
+    comments = {}
+    for name in ("a", "b"):
+        comments[name] = gql('mutation($c: String!) { createComment(content: $c) { id } }', headers, c=f"{name}0")["createComment"]["id"]
+        for version in (1, 2):
+            gql('mutation($id: Int!, $c: String!) { updateComment(commentId: $id, newContent: $c) { id } }',
+                headers, id=comments[name], c=f"{name}{version}")
+    assert archive_old_edits(client, list(comments.values())) == 4
+    gql('mutation($id: Int!) { updateComment(commentId: $id, newContent: "a3") { id } }', headers, id=comments["a"])
+
+    nodes, after, counts = [], None, set()
+    while True:
+        page = gql(PAGE, headers, after=after)["commentHistories"]
+        nodes += [edge["node"] for edge in page["edges"]]
+        counts.add(page["totalCount"])
+        if not page["pageInfo"]["hasNextPage"]:
+            break
+        after = page["pageInfo"]["endCursor"]
+    assert [(n["oldValue"], n["newValue"]) for n in nodes] == [("a0", "a1"), ("a1", "a2"), ("b0", "b1"), ("b1", "b2"), ("a2", "a3")]
+    assert counts == {5}
+
+    response = client.get("/exports/comment-histories", headers=headers)
+    assert response.status_code == 200, response.text
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [(h["comment_id"], h["old_value"], h["new_value"]) for h in exported] == [
+        (comments["a"], "a0", "a1"), (comments["a"], "a1", "a2"), (comments["a"], "a2", "a3"),
+        (comments["b"], "b0", "b1"), (comments["b"], "b1", "b2"),
+    ]
+
+    since = (datetime.utcnow() - timedelta(days=1)).isoformat()
+    response = client.get("/exports/comment-histories", params={"since": since}, headers=headers)
+    assert [json.loads(line)["new_value"] for line in response.text.splitlines()] == ["a3"]
+
+
+def test_a_page_reads_only_the_archived_rows_it_needs(client, signup, gql, monkeypatch):
+    from app.utils import history_archive
+
+    headers = signup(group="long-archived")
+    comment = gql('mutation { createComment(content: "v0") { id } }', headers)["createComment"]["id"]
+    for version in range(1, 9):
+        gql('mutation($id: Int!, $c: String!) { updateComment(commentId: $id, newContent: $c) { id } }',
+            headers, id=comment, c=f"v{version}")
+    assert archive_old_edits(client, [comment]) == 8
+
+    read = []
+    keys = history_archive.Segment.keys
+
+    def counted(self, group, after=()):
+        for entry in keys(self, group, after):
+            read.append(entry)
+            yield entry
+
+    monkeypatch.setattr(history_archive.Segment, "keys", counted)
+    page = gql(PAGE, headers)["commentHistories"]
+    assert [edge["node"]["newValue"] for edge in page["edges"]] == ["v1", "v2"]
+    assert page["totalCount"] == 8
+    assert len(read) == 3
+    read.clear()
+    page = gql(PAGE, headers, after=page["pageInfo"]["endCursor"])["commentHistories"]
+    assert [edge["node"]["newValue"] for edge in page["edges"]] == ["v3", "v4"]
+    assert len(read) == 3
+
+
+def test_archived_rows_follow_a_user_to_another_group(client, signup, gql):
+    headers = signup(group="archived-before-move")
+    comment = gql('mutation { createComment(content: "m0") { id } }', headers)["createComment"]["id"]
+    for version in (1, 2):
+        gql('mutation($id: Int!, $c: String!) { updateComment(commentId: $id, newContent: $c) { id } }',
+            headers, id=comment, c=f"m{version}")
+    assert archive_old_edits(client, [comment]) == 2
+
+    gql('mutation { updateUser(group: "archived-after-move") { group } }', headers)
+    page = gql(PAGE, headers)["commentHistories"]
+    assert [(e["node"]["oldValue"], e["node"]["newValue"]) for e in page["edges"]] == [("m0", "m1"), ("m1", "m2")]
+    assert page["totalCount"] == 2
+    assert gql(PAGE, signup(group="archived-before-move"))["commentHistories"]["totalCount"] == 0
+    # Filed under the new group by the next run.
+    assert archive_old_edits(client, [comment]) == 2
+    assert gql(PAGE, headers)["commentHistories"]["totalCount"] == 2
@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from app.metrics import instrument_engine
+
+
+def test_failed_statements_leave_no_start_times():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.exec_driver_sql("SELECT * FROM missing")
+        assert conn.info["query_started"] == []
+        assert conn.exec_driver_sql("SELECT 1").scalar() == 1
+        assert conn.info["query_started"] == []
+    engine.dispose()
+
+
+def test_nested_selections_cost_the_same_statements_at_any_size(client, signup, gql, monkeypatch):
+    import app.graphql.schema
+
+    monkeypatch.setattr(app.graphql.schema, "METRICS_IN_RESPONSE", True)
+    headers = signup(group="nested")
+    query = "{ allComments { id author { username group } histories { oldValue newValue } } }"
+
+    def add_edited_comments(count):
+        created = gql("mutation($contents: [String!]!) { createComments(contents: $contents) { id } }",
+                      headers, contents=["draft"] * count)["createComments"]
+        for comment in created:
+            gql('mutation($id: Int!) { updateComment(commentId: $id, newContent: "final") { id } }', headers, id=comment["id"])
+
+    def statements():
+        body = client.post("/graphql", json={"query": query}, headers=headers).json()
+        assert not body.get("errors"), body["errors"]
+        return len(body["data"]["allComments"]), body["extensions"]["metrics"]["sqlStatements"]
+
+    # Each size is read twice: once loading the feed, once from the cache.
+    add_edited_comments(2)
+    small = [statements(), statements()]
+    add_edited_comments(10)
+    large = [statements(), statements()]
+    assert [size for size, _ in small + large] == [2, 2, 12, 12]
+    assert [count for _, count in large] == [count for _, count in small]
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from app.graphql.persisted_queries import PersistedQueryStore, persisted_queries, query_hash
+
+
+def post(client, headers, query=None, sha=None):
+    body = {}
+    if query is not None:
+        body["query"] = query
+    if sha is not None:
+        body["extensions"] = {"persistedQuery": {"version": 1, "sha256Hash": sha}}
+    return client.post("/graphql", json=body, headers=headers).json()
+
+
+def error_codes(body) -> list:
+    return [(e.get("extensions") or {}).get("code") for e in body.get("errors") or ()]
+
+
+def test_unknown_hash_is_registered_by_the_retry_and_then_served(client, signup):
+    headers = signup(group="persisted")
+    query = '{ allComments { id content } } # apq'
+    sha = query_hash(query)
+
+    assert error_codes(post(client, headers, sha=sha)) == ["PERSISTED_QUERY_NOT_FOUND"]
+    assert post(client, headers, query, sha)["data"] == {"allComments": []}
+    assert sha in persisted_queries
+    assert post(client, headers, sha=sha)["data"] == {"allComments": []}
+
+
+def test_a_query_not_matching_its_hash_is_refused(client, signup):
+    headers = signup(group="persisted")
+    query = "{ allComments { id } }"
+    body = post(client, headers, query, query_hash(query + " "))
+    assert error_codes(body) == ["PERSISTED_QUERY_HASH_MISMATCH"]
+    assert query_hash(query + " ") not in persisted_queries
+
+
+def test_allowlist_runs_only_listed_documents(client, signup, tmp_path, monkeypatch):
+    headers = signup(group="persisted")
+    allowed = "{ allComments { id } } # allowed"
+    path = tmp_path / "allowlist.json"
+    path.write_text(json.dumps({query_hash(allowed): allowed}))
+    allowlist = PersistedQueryStore(mode="auto")
+    allowlist.load(str(path))
+    monkeypatch.setattr(persisted_queries, "mode", "allowlist")
+    monkeypatch.setattr(persisted_queries, "_queries", allowlist._queries)
+
+    assert post(client, headers, sha=query_hash(allowed))["data"] == {"allComments": []}
+    assert post(client, headers, allowed)["data"] == {"allComments": []}
+    other = "{ allComments { content } } # not allowed"
+    assert error_codes(post(client, headers, other)) == ["PERSISTED_QUERY_NOT_ALLOWED"]
+    assert error_codes(post(client, headers, other, query_hash(other))) == ["PERSISTED_QUERY_NOT_ALLOWED"]
+    assert error_codes(post(client, headers, sha=query_hash(other))) == ["PERSISTED_QUERY_NOT_ALLOWED"]
+    # Clients can't add to the allowlist by sending the full text.
+    assert query_hash(other) not in persisted_queries
+
+
+def test_allowlist_file_entries_must_match_their_hash(tmp_path):
+    path = tmp_path / "allowlist.json"
+    path.write_text(json.dumps({"0" * 64: "{ allComments { id } }"}))
+    with pytest.raises(Exception, match="does not match its hash"):
+        PersistedQueryStore(mode="auto").load(str(path))
@@ -0,0 +1,73 @@
+from app.database import async_engine, pool_stats
+
+
+def test_requests_return_their_connections(client, signup, gql):
+    headers = signup()
+    comment = gql('mutation { createComment(content: "first") { id } }', headers)["createComment"]
+    gql(
+        'mutation($id: Int!) { updateComment(commentId: $id, newContent: "second") { id } }',
+        headers, id=comment["id"],
+    )
+    gql("{ allComments { id content } allCommentHistories { oldValue newValue } }", headers)
+    gql(
+        "{ comments(first: 10) { edges { node { id author { username } histories { oldValue newValue } } } }"
+        " commentHistories(first: 10) { totalCount } }",
+        headers,
+    )
+    gql("{ groupStats { commentCount editCount } }", headers)
+    # A failing resolver must hand its connection back too.
+    response = client.post(
+        "/graphql", json={"query": 'mutation { updateComment(commentId: -1, newContent: "x") { id } }'}, headers=headers,
+    )
+    assert response.json()["errors"]
+    assert client.get("/exports/comments", headers=headers).status_code == 200
+    assert client.get("/exports/comment-histories", headers=headers).status_code == 200
+
+    assert async_engine.sync_engine.pool.checkedout() == 0
+    assert pool_stats.snapshot()["checked_out"] == 0
+
+
+def test_login_hashes_without_a_connection(client, monkeypatch):
+    from app.utils import security
+
+    client.post("/signup", json={"username": "hasher", "password": "pw", "group": "testers"})
+    checked_out = []
+    verify = security.verify_password_async
+
+    async def verify_password_async(plain_password, hashed_password):
+        checked_out.append(async_engine.sync_engine.pool.checkedout())
+        return await verify(plain_password, hashed_password)
+
+    monkeypatch.setattr(security, "verify_password_async", verify_password_async)
+    assert client.post("/login", data={"username": "hasher", "password": "pw"}).status_code == 200
+    assert client.post("/login", data={"username": "hasher", "password": "wrong"}).status_code == 401
+    assert checked_out == [0, 0]
+
+
+def test_replicas_and_shards_share_the_connection_budget(tmp_path):
+    import json
+    import os
+    import subprocess
+    import sys
+
+    url = lambda name: f"sqlite:///{tmp_path}/{name}.db"
+    env = {
+        **os.environ,
+        "DATABASE_URL": url("primary"),
+        "DATABASE_REPLICA_URLS": f"{url('replica1')},{url('replica2')}",
+        # One shard is the primary itself, which takes no pool of its own.
+        "DATABASE_SHARDS": f"one={url('primary')},two={url('shard2')}",
+        "WEB_CONCURRENCY": "3",
+        "DB_MAX_CONNECTIONS": "60",
+    }
+    env.pop("ASYNC_DATABASE_URL", None)
+    script = (
+        "import json; from app.database import async_engines as e; "
+        "print(json.dumps([x.pool.size() + x.pool._max_overflow for x in e]))"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", script], cwd=root, env=env, capture_output=True, check=True).stdout
+    limits = json.loads(output)
+    # Primary, two replicas and a second shard: 60 / 3 workers / 4 pools.
+    assert limits == [5, 5, 5, 5]
+    assert sum(limits) * 3 <= 60
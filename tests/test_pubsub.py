@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from app.pubsub import PubSub, RedisBackend
+
+pytest.importorskip("redis")
+
+
+def encode(value) -> bytes:
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(v) for v in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class PubSubServer:
+    """Just enough of Redis for one pub/sub reader: replies to SUBSCRIBE and
+    UNSUBSCRIBE, OK to anything else, and pushes messages on demand."""
+
+    def __init__(self):
+        self.connections = []
+        self.handlers = set()
+
+    async def start(self, port: int = 0) -> int:
+        self.server = await asyncio.start_server(self.serve, "127.0.0.1", port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve(self, reader, writer):
+        self.connections.append(writer)
+        self.handlers.add(asyncio.current_task())
+        try:
+            while line := await reader.readline():
+                command = []
+                for _ in range(int(line[1:])):
+                    size = int((await reader.readline())[1:])
+                    command.append((await reader.readexactly(size + 2))[:-2])
+                name = command[0].upper()
+                if name in (b"SUBSCRIBE", b"UNSUBSCRIBE"):
+                    for count, channel in enumerate(command[1:], 1):
+                        writer.write(encode([name.lower(), channel, count]))
+                else:
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+    def push(self, channel: bytes, data: bytes) -> None:
+        for writer in self.connections:
+            if not writer.is_closing():
+                writer.write(encode([b"message", channel, data]))
+
+    def drop_connections(self) -> None:
+        for writer in self.connections:
+            writer.close()
+        self.connections.clear()
+
+    async def stop(self) -> None:
+        self.server.close()
+        self.drop_connections()
+        await asyncio.gather(*self.handlers)
+        await self.server.wait_closed()
+
+
+async def receive(server: PubSubServer, subscriber, data: bytes) -> dict:
+    """Publish until the subscriber gets it: its reader may be reconnecting."""
+    for _ in range(50):
+        server.push(b"comments", data)
+        try:
+            return await asyncio.wait_for(subscriber.__anext__(), 0.1)
+        except asyncio.TimeoutError:
+            pass
+    raise AssertionError("nothing received")
+
+
+def test_reader_resubscribes_after_losing_its_connection():
+    async def run():
+        server = PubSubServer()
+        port = await server.start()
+        pubsub = PubSub(RedisBackend(f"redis://127.0.0.1:{port}/0", reconnect_attempts=3))
+        async with pubsub.subscribe("comments") as subscriber:
+            assert await receive(server, subscriber, b'{"id": 1}') == {"id": 1}
+            server.drop_connections()
+            assert await receive(server, subscriber, b'{"id": 2}') == {"id": 2}
+        await server.stop()
+        assert pubsub.stats()["disconnected"] == 0
+
+    asyncio.run(run())
+
+
+def test_subscribers_end_when_the_broker_stays_away():
+    async def run():
+        server = PubSubServer()
+        port = await server.start()
+        pubsub = PubSub(RedisBackend(f"redis://127.0.0.1:{port}/0", reconnect_attempts=2))
+        async with pubsub.subscribe("comments") as subscriber:
+            await server.stop()
+            with pytest.raises(Exception, match="lost the connection"):
+                await asyncio.wait_for(subscriber.__anext__(), 10)
+        assert pubsub.stats()["disconnected"] == 1
+
+    asyncio.run(run())
+
+
+def test_principal_invalidations_reach_other_workers_and_losing_them_clears_the_cache():
+    from app.auth.principal_cache import Principal, PrincipalCache, follow_invalidations
+
+    def cached(cache: PrincipalCache, token: str, user_id: int) -> None:
+        cache.put(token, Principal(id=user_id, username=token, group="g"), cache.epoch)
+
+    async def run():
+        server = PubSubServer()
+        port = await server.start()
+        pubsub = PubSub(RedisBackend(f"redis://127.0.0.1:{port}/0", reconnect_attempts=1))
+        cache = PrincipalCache(ttl=60)
+        follower = asyncio.ensure_future(follow_invalidations(cache, pubsub, retry_delay=0.05))
+        cached(cache, "alice", 1)
+        cached(cache, "bob", 2)
+        # Another worker renamed user 1.
+        for _ in range(50):
+            server.push(b"principals", b'{"user_id": 1}')
+            await asyncio.sleep(0.1)
+            if cache.get("alice") is None:
+                break
+        assert cache.get("alice") is None and cache.get("bob") is not None
+
+        await server.stop()
+        for _ in range(100):
+            if cache.peek("bob") is None:
+                break
+            await asyncio.sleep(0.05)
+        assert cache.peek("bob") is None
+        follower.cancel()
+
+    asyncio.run(run())
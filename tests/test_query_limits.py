@@ -0,0 +1,53 @@
+import os
+import re
+
+README = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "README.md")
+
+
+def readme_operations():
+    with open(README) as f:
+        blocks = re.findall(r"```graphql\n(.*?)```", f.read(), re.S)
+    return [block for block in blocks if not block.lstrip().startswith("subscription")]
+
+
+def cost_errors(client, headers, query):
+    body = client.post("/graphql", json={"query": query}, headers=headers).json()
+    return [e for e in body.get("errors") or () if (e.get("extensions") or {}).get("code") == "QUERY_TOO_COMPLEX"]
+
+
+def test_documented_operations_are_within_the_default_limits(client, signup):
+    operations = readme_operations()
+    assert operations
+    for query in operations:
+        assert not cost_errors(client, signup(), query), query
+
+
+def test_dashboard_with_group_stats_is_within_the_default_limits(client, signup):
+    query = (
+        "{ allComments { id content author { username } histories { oldValue newValue } }"
+        " groupStats { commentCount editCount } }"
+    )
+    assert not cost_errors(client, signup(), query)
+
+
+def test_root_lists_are_charged_by_their_length_not_cut(client, signup, gql):
+    from sqlalchemy import update
+    from app import models
+    from app.database import engine
+    from app.graphql.cost import LIST_SIZES
+
+    headers = signup(group="crowded")
+    count = LIST_SIZES["Query.allComments"] + 1
+    gql("mutation($contents: [String!]!) { createComments(contents: $contents) { id } }", headers,
+        contents=[f"comment {n}" for n in range(count)])
+    body = client.post("/graphql", json={"query": "{ allComments { id } }"}, headers=headers).json()
+    assert len(body["data"]["allComments"]) == count
+    assert body["extensions"]["cost"]["nodes"] == count
+
+    # A group too big to return at once is refused outright.
+    with engine.begin() as conn:
+        conn.execute(update(models.GroupStats).where(models.GroupStats.group == "crowded").values(comment_count=10 ** 6))
+    errors = cost_errors(client, headers, "{ allComments { id } }")
+    assert [e["extensions"]["limit"] for e in errors] == ["cost"]
+    with engine.begin() as conn:
+        conn.execute(update(models.GroupStats).where(models.GroupStats.group == "crowded").values(comment_count=count))
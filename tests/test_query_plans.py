@@ -0,0 +1,82 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app.database import async_engine, engine
+
+
+@contextmanager
+def query_plans():
+    """Collect EXPLAIN QUERY PLAN details of the statements the app runs."""
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    plans = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        yield plans
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", on_execute)
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            plans.append((statement, [row[-1] for row in rows]))
+
+
+def plan_of(plans, fragment: str) -> str:
+    """The plan of the one statement containing fragment, as one string."""
+    found = [plan for statement, plan in plans if fragment in " ".join(statement.split())]
+    assert len(found) == 1, f"{len(found)} statements contain {fragment!r}"
+    return "\n".join(found[0])
+
+
+def assert_no_table_scan(plan: str) -> None:
+    assert "SCAN comments" not in plan and "SCAN comment_histories" not in plan, plan
+
+
+def edit_comments(headers, gql, count=3):
+    for _ in range(count):
+        comment = gql('mutation { createComment(content: "draft") { id } }', headers)["createComment"]
+        gql('mutation($id: Int!) { updateComment(commentId: $id, newContent: "final") { id } }', headers, id=comment["id"])
+
+
+def test_group_feeds_use_their_indexes(signup, gql):
+    headers = signup(group="plans-feeds")
+    edit_comments(headers, gql)
+    with query_plans() as plans:
+        gql("{ comments(first: 10) { edges { node { id } } } }", headers)
+        gql("{ commentHistories(first: 10) { edges { node { id } } } }", headers)
+
+    comments = plan_of(plans, "FROM comments WHERE comments.\"group\" = ? ORDER BY comments.created_at")
+    assert "INDEX ix_comments_group_created_at_id (group=?)" in comments
+    assert "TEMP B-TREE" not in comments
+    histories = plan_of(plans, "FROM comment_histories JOIN comments")
+    assert "ix_comments_group_created_at_id (group=?)" in histories
+    assert "ix_comment_histories_comment_id (comment_id=?)" in histories
+    assert_no_table_scan(histories)
+
+
+def test_nested_loaders_use_foreign_key_indexes(signup, gql):
+    headers = signup(group="plans-loaders")
+    edit_comments(headers, gql)
+    user_id = gql("{ comments(first: 1) { edges { node { userId } } } }", headers)["comments"]["edges"][0]["node"]["userId"]
+    with query_plans() as plans:
+        gql("query($id: Int!) { userById(userId: $id) { comments { histories { id } } } }", headers, id=user_id)
+
+    assert "ix_comments_user_id (user_id=?)" in plan_of(plans, "WHERE comments.user_id IN")
+    assert "ix_comment_histories_comment_id (comment_id=?)" in plan_of(plans, "WHERE comment_histories.comment_id IN")
+
+
+def test_history_export_since_uses_timestamp_index(client, signup, gql):
+    headers = signup(group="plans-export")
+    edit_comments(headers, gql)
+    with query_plans() as plans:
+        response = client.get("/exports/comment-histories?since=2000-01-01T00:00:00", headers=headers)
+        assert response.status_code == 200
+
+    plan = plan_of(plans, "FROM comment_histories JOIN comments")
+    assert "ix_comment_histories_timestamp_id (timestamp>?)" in plan
+    assert_no_table_scan(plan)
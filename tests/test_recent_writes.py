@@ -0,0 +1,77 @@
+import asyncio
+import socket
+import time
+
+import pytest
+
+from app.database import RedisRecentWrites
+
+pytest.importorskip("redis")
+
+
+class KeyServer:
+    """Just enough of Redis for RedisRecentWrites: SET with PX, and EXISTS;
+    OK to anything else."""
+
+    def __init__(self):
+        self.expires = {}
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self.serve, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                command = []
+                for _ in range(int(line[1:])):
+                    size = int((await reader.readline())[1:])
+                    command.append((await reader.readexactly(size + 2))[:-2])
+                name = command[0].upper()
+                if name == b"SET":
+                    options = [part.upper() for part in command]
+                    self.expires[command[1]] = time.monotonic() + int(command[options.index(b"PX") + 1]) / 1000
+                    writer.write(b"+OK\r\n")
+                elif name == b"EXISTS":
+                    found = sum(self.expires.get(key, 0) > time.monotonic() for key in command[1:])
+                    writer.write(b":%d\r\n" % found)
+                else:
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def test_every_worker_sees_a_write_for_the_window():
+    async def run():
+        server = KeyServer()
+        port = await server.start()
+        url = f"redis://127.0.0.1:{port}/0"
+        writer, reader = RedisRecentWrites(url, window=0.3), RedisRecentWrites(url, window=0.3)
+        await writer.mark("Bearer a")
+        assert await reader.recent("Bearer a")
+        assert not await reader.recent("Bearer b")
+        # The header itself never reaches Redis.
+        assert all(b"Bearer" not in key for key in server.expires)
+        await asyncio.sleep(0.4)
+        assert not await reader.recent("Bearer a")
+        await server.stop()
+
+    asyncio.run(run())
+
+
+def test_clients_read_from_the_primary_while_redis_is_unreachable():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    async def run():
+        recent_writes = RedisRecentWrites(f"redis://127.0.0.1:{port}/0", window=5)
+        await recent_writes.mark("Bearer a")
+        assert await recent_writes.recent("Bearer b")
+
+    asyncio.run(run())
@@ -0,0 +1,37 @@
+SEARCH = """query($q: String!, $first: Int, $after: String) {
+  searchComments(query: $q, first: $first, after: $after) {
+    edges { node { content } }
+    pageInfo { hasNextPage endCursor }
+  }
+}"""
+
+
+def search(gql, headers, query, first=None):
+    contents, after = [], None
+    while True:
+        page = gql(SEARCH, headers, q=query, first=first, after=after)["searchComments"]
+        contents += [edge["node"]["content"] for edge in page["edges"]]
+        if not page["pageInfo"]["hasNextPage"]:
+            return contents
+        after = page["pageInfo"]["endCursor"]
+
+
+def test_search_matches_every_word_in_the_callers_group_best_first(signup, gql):
+    headers = signup(group="searchers")
+    contents = [
+        "a quick brown fox jumps over the lazy dog today",
+        "quick fox, quick fox, quick fox",
+        "a quick turtle",
+        "the fox sleeps",
+    ]
+    gql("mutation($contents: [String!]!) { createComments(contents: $contents) { id } }", headers, contents=contents)
+    gql('mutation { createComment(content: "a quick fox in another group") { id } }', signup(group="elsewhere"))
+
+    expected = ["quick fox, quick fox, quick fox", "a quick brown fox jumps over the lazy dog today"]
+    assert search(gql, headers, "quick fox") == expected
+    # Paging keeps the ranking across pages.
+    assert search(gql, headers, "Quick FOX", first=1) == expected
+    assert search(gql, headers, "turtle") == ["a quick turtle"]
+    # FTS5 syntax in the input is matched as plain words.
+    assert search(gql, headers, 'fox OR "turtle') == []
+    assert search(gql, headers, "!!!") == []
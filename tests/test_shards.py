@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text, update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+COMMENTS = "{ allComments { content } }"
+HISTORIES = "{ allCommentHistories { oldValue newValue } }"
+STATS = "{ groupStats { commentCount editCount } }"
+
+
+@pytest.fixture
+def shards(client, tmp_path, monkeypatch):
+    """Two SQLite shards: "red" holds group red-team and every group not
+    mapped, "blue" holds blue-team. Users stay on the primary. Returns a
+    function counting a table's rows on a shard."""
+    from app import database
+    from app.database import Base, shard_map
+    from app.utils import history_archive
+
+    files = {name: tmp_path / f"{name}.db" for name in ("red", "blue")}
+    for path in files.values():
+        sync = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(sync)
+        sync.dispose()
+    engines = {name: create_async_engine(f"sqlite+aiosqlite:///{path}") for name, path in files.items()}
+    monkeypatch.setattr(database, "shard_engines", engines)
+    monkeypatch.setattr(shard_map, "engines", engines)
+    monkeypatch.setattr(shard_map, "groups", {"red-team": "red", "blue-team": "blue"})
+    monkeypatch.setattr(shard_map, "default", "red")
+    for name in files:
+        monkeypatch.setitem(history_archive.history_archives, name,
+                            history_archive.HistoryArchive(str(tmp_path / "archive" / name)))
+
+    def count(shard: str, sql: str) -> int:
+        sync = create_engine(f"sqlite:///{files[shard]}")
+        try:
+            with sync.connect() as conn:
+                return conn.execute(text(sql)).scalar()
+        finally:
+            sync.dispose()
+
+    yield count
+    for engine in engines.values():
+        client.portal.call(engine.dispose)
+
+
+def comment(gql, headers, content: str, *edits: str) -> int:
+    comment_id = gql('mutation($c: String!) { createComment(content: $c) { id } }', headers, c=content)["createComment"]["id"]
+    for edit in edits:
+        gql('mutation($id: Int!, $c: String!) { updateComment(commentId: $id, newContent: $c) { id } }',
+            headers, id=comment_id, c=edit)
+    return comment_id
+
+
+def test_each_group_reads_and_writes_only_its_shard(shards, signup, gql):
+    red, blue, other = signup(group="red-team"), signup(group="blue-team"), signup(group="unmapped")
+    comment(gql, red, "red comment", "red edit")
+    comment(gql, blue, "blue comment")
+    comment(gql, other, "other comment")
+
+    assert shards("red", "SELECT group_concat(content) FROM comments") == "red edit,other comment"
+    assert shards("blue", "SELECT group_concat(content) FROM comments") == "blue comment"
+    assert shards("red", "SELECT count(*) FROM comment_histories") == 1
+    assert shards("blue", "SELECT count(*) FROM comment_histories") == 0
+
+    assert gql(COMMENTS, red)["allComments"] == [{"content": "red edit"}]
+    assert gql(COMMENTS, blue)["allComments"] == [{"content": "blue comment"}]
+    assert gql(COMMENTS, other)["allComments"] == [{"content": "other comment"}]
+    assert gql(HISTORIES, blue)["allCommentHistories"] == []
+    assert gql(STATS, red)["groupStats"] == {"commentCount": 1, "editCount": 1}
+    assert gql(STATS, blue)["groupStats"] == {"commentCount": 1, "editCount": 0}
+
+
+def test_moving_a_user_to_another_shard_takes_their_comments_histories_and_counters(client, shards, signup, gql):
+    from app import models
+    from app.database import shard_map
+    from app.jobs.archive_histories import archive_shard
+
+    mover, stayer = signup(group="red-team"), signup(group="red-team")
+    archived = comment(gql, mover, "a0", "a1", "a2")
+    comment(gql, mover, "b0", "b1")
+    comment(gql, stayer, "kept")
+
+    async def archive():
+        history = models.CommentHistory
+        async with AsyncSession(shard_map.engines["red"]) as db:
+            await db.execute(
+                update(history).where(history.comment_id == archived)
+                .values(timestamp=datetime.utcnow() - timedelta(days=200))
+            )
+            await db.commit()
+        return await archive_shard("red", shard_map.engines["red"], datetime.utcnow() - timedelta(days=100))
+
+    # Archived rows move too: they become table rows on the new shard.
+    assert client.portal.call(archive) == 2
+
+    gql('mutation { updateUser(group: "blue-team") { group } }', mover)
+    assert shards("red", "SELECT group_concat(content) FROM comments") == "kept"
+    assert shards("red", "SELECT count(*) FROM comment_histories") == 0
+    assert shards("red", "SELECT count(*) FROM comment_archives") == 0
+    assert shards("blue", "SELECT count(*) FROM comment_histories") == 3
+
+    assert sorted(c["content"] for c in gql(COMMENTS, mover)["allComments"]) == ["a2", "b1"]
+    assert [(h["oldValue"], h["newValue"]) for h in gql(HISTORIES, mover)["allCommentHistories"]] == [
+        ("a0", "a1"), ("a1", "a2"), ("b0", "b1"),
+    ]
+    assert gql(STATS, mover)["groupStats"] == {"commentCount": 2, "editCount": 3}
+    assert gql(STATS, stayer)["groupStats"] == {"commentCount": 1, "editCount": 0}
+    assert gql(COMMENTS, stayer)["allComments"] == [{"content": "kept"}]
+
+
+def test_a_failed_move_removes_the_copies_from_the_new_shard(client, shards, signup, gql):
+    mover, taken = signup(group="red-team"), signup(group="blue-team")
+    comment(gql, mover, "c0", "c1")
+    taken_name = gql("mutation { updateUser { username } }", taken)["updateUser"]["username"]
+
+    # The username is taken, so the user's own commit fails after the
+    # comments were copied to the blue shard.
+    body = client.post("/graphql", headers=mover, json={
+        "query": 'mutation($name: String!) { updateUser(username: $name, group: "blue-team") { group } }',
+        "variables": {"name": taken_name},
+    }).json()
+    assert body["errors"]
+
+    assert shards("blue", "SELECT count(*) FROM comments") == 0
+    assert shards("blue", "SELECT count(*) FROM comment_histories") == 0
+    assert shards("blue", "SELECT coalesce(sum(comment_count), 0) FROM group_stats") == 0
+    assert shards("blue", "SELECT count(*) FROM user_stats") == 0
+    assert gql(COMMENTS, mover)["allComments"] == [{"content": "c1"}]
+    assert gql(STATS, mover)["groupStats"] == {"commentCount": 1, "editCount": 1}
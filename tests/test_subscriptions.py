@@ -0,0 +1,59 @@
+import time
+from contextlib import ExitStack
+
+from app.database import async_engine
+from app.pubsub import pubsub
+
+
+def subscribe(stack: ExitStack, client, headers: dict, query: str):
+    ws = stack.enter_context(client.websocket_connect("/graphql", subprotocols=["graphql-transport-ws"]))
+    ws.send_json({"type": "connection_init", "payload": headers})
+    assert ws.receive_json()["type"] == "connection_ack"
+    ws.send_json({"id": "1", "type": "subscribe", "payload": {"query": query}})
+    return ws
+
+
+def wait_for_subscribers(count: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    # Plus the app's own, to principal invalidations.
+    while pubsub.stats()["subscribers"] < count + 1:
+        assert time.monotonic() < deadline, pubsub.stats()
+        time.sleep(0.01)
+
+
+def event(ws) -> dict:
+    message = ws.receive_json()
+    assert message["type"] == "next", message
+    return message["payload"]["data"]
+
+
+def test_each_event_resolves_fresh_nested_data(client, signup, gql):
+    headers = signup(group="subscribers")
+    comment_id = gql('mutation { createComment(content: "v0") { id } }', headers)["createComment"]["id"]
+    update = "mutation($id: Int!, $content: String!) { updateComment(commentId: $id, newContent: $content) { id } }"
+
+    with ExitStack() as stack:
+        ws = subscribe(stack, client, headers, "subscription { commentUpdated { content histories { newValue } } }")
+        wait_for_subscribers(1)
+        for n in (1, 2):
+            gql(update, headers, id=comment_id, content=f"v{n}")
+            updated = event(ws)["commentUpdated"]
+            assert updated["content"] == f"v{n}"
+            assert [h["newValue"] for h in updated["histories"]] == [f"v{m}" for m in range(1, n + 1)]
+
+
+def test_a_thousand_subscribers_get_every_event(client, signup, gql):
+    headers = signup(group="crowd")
+    subscribers = 1000
+    with ExitStack() as stack:
+        sockets = [
+            subscribe(stack, client, headers, "subscription { commentAdded { content author { username } } }")
+            for _ in range(subscribers)
+        ]
+        wait_for_subscribers(subscribers)
+        for n in range(3):
+            gql(f'mutation {{ createComment(content: "event {n}") {{ id }} }}', headers)
+        for ws in sockets:
+            assert [event(ws)["commentAdded"]["content"] for _ in range(3)] == ["event 0", "event 1", "event 2"]
+        # Waiting subscribers hold no pooled connection.
+        assert async_engine.sync_engine.pool.checkedout() == 0